@@ -0,0 +1,90 @@
+"""
+准入控制调度基准：FIFO 信号量 vs AdmissionController（优先级 + 按用户轮转）
+
+纯 asyncio 模拟，不访问网络：并发上限 --concurrency 的上游，
+  - --bulk-users 个批量用户（用例生成）各自一次性提交 --bulk-jobs 个长任务（--bulk-seconds 秒）
+  - --interactive-users 个问答用户在随后 --window 秒内随机提问，每次 --interactive-seconds 秒
+对比问答请求与批量请求的排队等待 p50/p95/p99，以及被拒绝的请求数。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.admission --concurrency 8 --bulk-users 4 --bulk-jobs 10
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.load_test import percentiles
+from utils.admission import BULK, INTERACTIVE, AdmissionController, AdmissionRejected
+
+
+class FifoLimiter:
+    """改造前的写法：只有一个全局信号量，先到先得"""
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    def slot(self, user, priority):
+        return self.semaphore
+
+
+async def simulate(limiter, args) -> dict:
+    rng = random.Random(args.seed)
+    waits = {"interactive": [], "bulk": []}
+    rejected = 0
+
+    async def job(user, priority, seconds, delay):
+        nonlocal rejected
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        try:
+            async with limiter.slot(user, priority):
+                waits["interactive" if priority == INTERACTIVE else "bulk"].append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(seconds)
+        except AdmissionRejected:
+            rejected += 1
+
+    jobs = []
+    for user in range(args.bulk_users):
+        for _ in range(args.bulk_jobs):
+            jobs.append(job(f"bulk-{user}", BULK, args.bulk_seconds, 0))
+    for user in range(args.interactive_users):
+        for _ in range(args.questions):
+            jobs.append(job(f"user-{user}", INTERACTIVE, args.interactive_seconds, rng.uniform(0.05, args.window)))
+    start = time.perf_counter()
+    await asyncio.gather(*jobs)
+    return {
+        "elapsed_s": round(time.perf_counter() - start, 2),
+        "interactive_wait_ms": percentiles(waits["interactive"]),
+        "bulk_wait_ms": percentiles(waits["bulk"]),
+        "rejected": rejected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="准入控制调度基准")
+    parser.add_argument("--concurrency", type=int, default=8, help="上游并发上限")
+    parser.add_argument("--per-user", type=int, default=2, help="单用户并发上限")
+    parser.add_argument("--queue-max", type=int, default=200)
+    parser.add_argument("--bulk-users", type=int, default=4)
+    parser.add_argument("--bulk-jobs", type=int, default=10)
+    parser.add_argument("--bulk-seconds", type=float, default=2.0)
+    parser.add_argument("--interactive-users", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=2)
+    parser.add_argument("--interactive-seconds", type=float, default=0.3)
+    parser.add_argument("--window", type=float, default=4.0, help="问答请求分布的时间窗口（秒）")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print({"limiter": "fifo", **asyncio.run(simulate(FifoLimiter(args.concurrency), args))})
+
+    async def fair():
+        controller = AdmissionController(
+            "bench", args.concurrency, args.per_user, args.queue_max, args.bulk_jobs, queue_timeout=600)
+        return await simulate(controller, args)
+
+    print({"limiter": "admission", **asyncio.run(fair())})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+/api/chat 并发首 token 时延（TTFT）基准
+
+用本地假模型替代 DeepSeek，分别以“阻塞式”（事件循环内迭代同步 stream，
+即改造前的写法）和“异步式”（astream）两种方式驱动 call_llm_model，
+在 N 个并发对话下统计 TTFT 的 p50/p99。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.chat_concurrency --concurrency 20 --tokens 50
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+import httpx
+import uvicorn
+
+
+class FakeChunk:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeChatModel:
+    """模拟上游模型：首 token 延迟 ttft 秒，之后每个 token 间隔 token_interval 秒"""
+
+    def __init__(self, ttft: float, token_interval: float, tokens: int):
+        self.ttft = ttft
+        self.token_interval = token_interval
+        self.tokens = tokens
+
+    def stream(self, prompt):
+        time.sleep(self.ttft)
+        for i in range(self.tokens):
+            if i:
+                time.sleep(self.token_interval)
+            yield FakeChunk(f"t{i} ")
+
+    async def astream(self, prompt):
+        await asyncio.sleep(self.ttft)
+        for i in range(self.tokens):
+            if i:
+                await asyncio.sleep(self.token_interval)
+            yield FakeChunk(f"t{i} ")
+
+
+def patch_llm(main_module, model: FakeChatModel, mode: str):
+    if mode == "blocking":
+        async def call_llm_model(prompt):
+            # 改造前的行为：在协程里迭代同步生成器
+            for token in model.stream(prompt):
+                yield token.content
+    else:
+        async def call_llm_model(prompt):
+            async for token in model.astream(prompt):
+                yield token.content
+    main_module.call_llm_model = call_llm_model
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_chat(client: httpx.AsyncClient, base_url: str) -> float:
+    username = f"bench-{uuid.uuid4().hex[:12]}"
+    await client.post(f"{base_url}/register", data={"username": username, "password": "x"})
+    await client.post(f"{base_url}/login", data={"username": username, "password": "x"})
+
+    start = time.perf_counter()
+    ttft = None
+    async with client.stream(
+        "POST", f"{base_url}/api/chat",
+        json={"message": "你好", "scenario": "需求挖掘", "conversation_id": None}
+    ) as response:
+        async for line in response.aiter_lines():
+            if ttft is None and line.startswith("data: ") and "token" in line:
+                ttft = time.perf_counter() - start
+    return ttft if ttft is not None else float("nan")
+
+
+async def drive(base_url: str, concurrency: int) -> list:
+    async def one():
+        async with httpx.AsyncClient(timeout=120) as client:
+            return await run_chat(client, base_url)
+    return await asyncio.gather(*(one() for _ in range(concurrency)))
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return values[index]
+
+
+def bench(mode: str, args) -> dict:
+    import main
+
+    patch_llm(main, FakeChatModel(args.ttft, args.token_interval, args.tokens), mode)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        ttfts = asyncio.run(drive(f"http://127.0.0.1:{port}", args.concurrency))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    ttfts_ms = [t * 1000 for t in ttfts]
+    return {
+        "mode": mode,
+        "concurrency": args.concurrency,
+        "p50_ttft_ms": round(statistics.median(ttfts_ms), 1),
+        "p99_ttft_ms": round(percentile(ttfts_ms, 99), 1),
+        "max_ttft_ms": round(max(ttfts_ms), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发对话首 token 时延基准")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--ttft", type=float, default=0.3, help="模型首 token 延迟（秒）")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="token 间隔（秒）")
+    parser.add_argument("--mode", choices=["blocking", "async", "both"], default="both")
+    args = parser.parse_args()
+
+    os.environ.setdefault("RAG_WARM_UP", "false")
+    modes = ["blocking", "async"] if args.mode == "both" else [args.mode]
+    with tempfile.TemporaryDirectory() as workdir:
+        # 需在导入 main 之前设置：每次运行注册的 bench-* 用户与对话写入临时库，结束后随目录删除；
+        # 向量库与嵌入缓存同样指向临时目录
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'chat_concurrency.db')}"
+        os.environ["RAG_DB_PATH"] = os.path.join(workdir, "rag_db")
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.db")
+        try:
+            for mode in modes:
+                print(bench(mode, args))
+        finally:
+            import main as main_module
+            main_module.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
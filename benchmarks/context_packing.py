@@ -0,0 +1,88 @@
+"""
+检索上下文组装基准：原样拼接 vs 合并重叠片段 + 去重 + 预算装入
+
+用 split_documents（chunk_size=1000, chunk_overlap=200）切分合成的手册页面，模拟检索命中：
+每个问题的 top-k 结果集中在某一页的相邻位置（同一问题的答案通常在同一段落附近），
+并以 --duplicate-rate 的概率混入另一份文件中内容相同的片段（同一文档的多个版本）。
+统计每个问题的上下文 token 数（原样拼接 / 组装后）与组装耗时。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.context_packing --queries 500 --top-k 5
+"""
+import argparse
+import random
+import statistics
+import time
+
+from langchain_core.documents import Document
+
+from benchmarks.load_test import percentiles
+from utils.context import SEPARATOR, assemble_context
+from utils.file_handle import split_documents
+from utils.history import count_tokens
+
+WORDS = ["备份", "恢复", "数据库", "配置", "参数", "检查", "日志", "磁盘", "网络", "超时", "重试", "告警",
+         "策略", "实例", "快照", "权限", "the", "backup", "job", "failed", "mysql", "restore"]
+
+
+def synthetic_pages(pages: int, rng: random.Random) -> list:
+    docs = []
+    for page in range(pages):
+        paragraphs = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120))) for _ in range(12)]
+        docs.append(Document(page_content="\n\n".join(paragraphs), metadata={"source": "manual.pdf", "page": page}))
+    return docs
+
+
+def sample_hits(chunks_by_page: dict, top_k: int, duplicate_rate: float, rng: random.Random) -> list:
+    page = rng.choice(list(chunks_by_page))
+    chunks = chunks_by_page[page]
+    center = rng.randrange(len(chunks))
+    nearby = chunks[max(0, center - top_k // 2):center + top_k]
+    hits = rng.sample(nearby, min(top_k, len(nearby)))
+    if hits and rng.random() < duplicate_rate:
+        copy = hits[0]
+        hits[-1] = Document(
+            page_content=copy.page_content,
+            metadata={**copy.metadata, "source": "manual-v2.pdf"}
+        )
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检索上下文组装基准")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--duplicate-rate", type=float, default=0.3)
+    parser.add_argument("--budget", type=int, help="token 预算，默认按场景配置")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    chunks_by_page = {}
+    for split in split_documents(synthetic_pages(args.pages, rng)):
+        chunks_by_page.setdefault(split.metadata["page"], []).append(split)
+
+    raw_tokens, packed_tokens, assemble_ms = [], [], []
+    for _ in range(args.queries):
+        hits = sample_hits(chunks_by_page, args.top_k, args.duplicate_rate, rng)
+        raw_tokens.append(count_tokens(SEPARATOR.join(doc.page_content for doc in hits)))
+        start = time.perf_counter()
+        _, stats = assemble_context(hits, "运维助手", max_tokens=args.budget)
+        assemble_ms.append((time.perf_counter() - start) * 1000)
+        packed_tokens.append(stats["tokens"])
+
+    print({
+        "queries": args.queries,
+        "top_k": args.top_k,
+        "raw_tokens_mean": round(statistics.mean(raw_tokens), 1),
+        "packed_tokens_mean": round(statistics.mean(packed_tokens), 1),
+        "saved": f"{1 - sum(packed_tokens) / sum(raw_tokens):.1%}",
+        "raw_tokens": percentiles(raw_tokens),
+        "packed_tokens": percentiles(packed_tokens),
+        "assemble_ms": percentiles(assemble_ms),
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+聊天写入路径吞吐基准
+
+在临时 SQLite 文件上用 N 个线程并发模拟完整的对话轮次（新建对话 + 用户消息 + AI 回答 + 标题），对比：
+  - legacy：改造前的写法，默认 pragma（rollback journal + synchronous=FULL），
+    每轮 5 次提交 + refresh + 一次 SELECT 对话再更新时间
+  - batched：main.create_db_engine 的 WAL + 调优 pragma，每个阶段一个事务（用户消息、回答、标题共 3 次提交）
+
+用法（在项目根目录执行）：
+    python -m benchmarks.db_writes --concurrency 64 --turns 20
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import func
+
+from main import Base, Conversation, Message, create_db_engine, persist_user_turn, save_ai_response
+
+ANSWER = "这是一段模拟的模型回答。" * 20
+
+
+def legacy_turn(db, user_id: int):
+    conversation = Conversation(user_id=user_id, title="新对话", scenario="需求挖掘")
+    db.add(conversation)
+    db.commit()
+    db.refresh(conversation)
+
+    db.add(Message(conversation_id=conversation.id, role="user", content="问题"))
+    db.commit()
+
+    db.add(Message(conversation_id=conversation.id, role="assistant", content=ANSWER))
+    db.commit()
+    row = db.query(Conversation).filter(Conversation.id == conversation.id).first()
+    row.updated_at = func.now()
+    db.commit()
+
+    conversation.title = "标题"
+    db.add(conversation)
+    db.commit()
+    db.refresh(conversation)
+
+
+def batched_turn(db, user_id: int):
+    conversation_id = persist_user_turn(db, user_id, "需求挖掘", None, "问题")
+    save_ai_response(ANSWER, conversation_id, db)
+    # 标题由后台任务单条 UPDATE 写入
+    db.query(Conversation).filter(Conversation.id == conversation_id).update(
+        {Conversation.title: "标题"}, synchronize_session=False
+    )
+    db.commit()
+
+
+def run(engine, turn, concurrency: int, turns: int) -> dict:
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(user_id: int):
+        db = SessionLocal()
+        try:
+            for _ in range(turns):
+                start = time.perf_counter()
+                try:
+                    turn(db, user_id)
+                except Exception as e:
+                    db.rollback()
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "turns_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 1) if latencies else None,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聊天写入路径吞吐基准")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=20, help="每个并发对话的轮数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_url = f"sqlite:///{os.path.join(tmp, 'legacy.db')}"
+        # 改造前 create_engine 未设置 timeout，这里放宽到 30s，否则高并发下大量 database is locked
+        legacy_engine = create_engine(legacy_url, connect_args={"check_same_thread": False, "timeout": 30})
+        result = run(legacy_engine, legacy_turn, args.concurrency, args.turns)
+        print({"mode": "legacy", "concurrency": args.concurrency, **result})
+        legacy_engine.dispose()
+
+        batched_engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'batched.db')}")
+        result = run(batched_engine, batched_turn, args.concurrency, args.turns)
+        print({"mode": "batched", "concurrency": args.concurrency, **result})
+        batched_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+嵌入后端延迟/吞吐对比
+
+对远程接口（EMBEDDING_BACKEND=remote，需要 ALIYUN_API_KEY）和本地 ONNX 模型（--onnx-dir）
+分别测量：
+  - 单条查询延迟 p50/p99（模拟在线检索）
+  - 并发单条请求吞吐（ONNX 后端会自动合批）
+  - 批量文档吞吐（模拟入库）
+
+用法（在项目根目录执行）：
+    python -m benchmarks.embedding_backends --onnx-dir models/bge-small-zh --quantize
+    python -m benchmarks.embedding_backends --skip-remote --onnx-dir models/bge-small-zh
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from utils.embeddings import OnnxEmbeddingBackend, RemoteEmbeddingBackend
+
+QUERIES = [
+    "MySQL 备份失败会是什么原因？",
+    "如何配置按月执行的备份策略",
+    "恢复后的 PDF 文件无法打开",
+    "--skip-lock-tables 参数有什么作用",
+    "备份期间 IOPS 峰值持续超过 95% 怎么处理",
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+def bench_latency(backend, rounds: int) -> dict:
+    latencies = []
+    for i in range(rounds):
+        # 每次带上序号，避免服务端缓存影响结果
+        text = f"{QUERIES[i % len(QUERIES)]} #{i}"
+        start = time.perf_counter()
+        backend.embed(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+async def bench_concurrent(backend, concurrency: int, rounds: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await backend.aembed(f"{QUERIES[i % len(QUERIES)]} ##{i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(rounds)))
+    return round(rounds / (time.perf_counter() - start), 1)
+
+
+def bench_batch(backend, documents: int, batch_size: int) -> float:
+    texts = [f"{QUERIES[i % len(QUERIES)]} 文档片段 {i} " * 8 for i in range(documents)]
+    start = time.perf_counter()
+    for offset in range(0, len(texts), batch_size):
+        backend.embed_documents(texts[offset:offset + batch_size])
+    return round(documents / (time.perf_counter() - start), 1)
+
+
+def run(name: str, backend, args, batch_size: int) -> dict:
+    result = {"backend": name, "model": backend.model_name, "dimensions": backend.dimensions}
+    result.update(bench_latency(backend, args.rounds))
+    result["concurrent_qps"] = asyncio.run(bench_concurrent(backend, args.concurrency, args.rounds))
+    result["batch_docs_per_sec"] = bench_batch(backend, args.documents, batch_size)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入后端延迟/吞吐对比")
+    parser.add_argument("--onnx-dir", help="包含 model.onnx 与 tokenizer.json 的目录")
+    parser.add_argument("--quantize", action="store_true", help="同时测试 int8 量化模型")
+    parser.add_argument("--skip-remote", action="store_true")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--documents", type=int, default=200)
+    args = parser.parse_args()
+
+    if not args.skip_remote:
+        print(run("remote", RemoteEmbeddingBackend(), args, batch_size=10))
+
+    if args.onnx_dir:
+        variants = [False, True] if args.quantize else [False]
+        for quantize in variants:
+            backend = OnnxEmbeddingBackend(args.onnx_dir, quantize=quantize)
+            try:
+                print(run("onnx-int8" if quantize else "onnx", backend, args, batch_size=32))
+            finally:
+                backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+/api/history 与 /api/conversation 查询基准
+
+在临时 SQLite 文件中生成 --messages 条消息（默认 100 万），对比：
+  - legacy：改造前的写法，无复合索引，ORM 读出全部对话 / 通过 relationship 懒加载全部消息，
+    在 Python 中分组
+  - keyset：复合索引 + 只查所需列 + SQL 内分组 + 游标分页（通过 TestClient 调用实际接口）
+
+被测用户拥有 --user-conversations 个对话，其中一个长对话有 --long-messages 条消息。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.history_queries --messages 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.testclient import TestClient
+from sqlalchemy import desc
+from sqlalchemy.orm import sessionmaker
+
+from main import Base, Conversation, app, create_db_engine, get_db, migrate_schema
+
+SCENARIO = "需求挖掘"
+CONTENT = "这是一条用于压测的消息内容，包含若干中文与 English words。" * 2
+
+
+def seed(path: str, messages: int, user_conversations: int, long_messages: int, per_conversation: int = 50):
+    """直接用 sqlite3 批量写入，时间格式与 func.now() 写入的一致"""
+    engine = create_db_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    rnd = random.Random(42)
+    now = datetime.now()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany("INSERT INTO users (id, username, password) VALUES (?, ?, ?)",
+                     [(i, f"user{i}", "p") for i in range(1, 201)])
+
+    long_conversation = None
+    remaining = messages
+    conversation_index = 0
+    start = time.perf_counter()
+    while remaining > 0:
+        target_user = conversation_index < user_conversations
+        user_id = 1 if target_user else rnd.randint(2, 200)
+        count = long_messages if conversation_index == 0 else per_conversation
+        count = min(count, remaining)
+        conversation_id = str(uuid.uuid4())
+        if conversation_index == 0:
+            long_conversation = conversation_id
+        updated_at = now - timedelta(minutes=rnd.randint(0, 60 * 24 * 30))
+        conn.execute(
+            "INSERT INTO conversations (id, user_id, title, created_at, updated_at, scenario, summary, summary_until) "
+            "VALUES (?, ?, ?, ?, ?, ?, '', 0)",
+            (conversation_id, user_id, f"对话{conversation_index}", updated_at.strftime("%Y-%m-%d %H:%M:%S"),
+             updated_at.strftime("%Y-%m-%d %H:%M:%S"), SCENARIO)
+        )
+        base = updated_at - timedelta(seconds=count)
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            [(conversation_id, "user" if i % 2 == 0 else "assistant", CONTENT,
+              (base + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S")) for i in range(count)]
+        )
+        remaining -= count
+        conversation_index += 1
+        if conversation_index % 2000 == 0:
+            conn.commit()
+    conn.commit()
+    conn.close()
+    print(f"已生成 {conversation_index} 个对话、{messages} 条消息，耗时 {time.perf_counter() - start:.1f}s")
+    return long_conversation
+
+
+def timed(fn, rounds: int) -> dict:
+    latencies = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(statistics.median(latencies), 2), "max_ms": round(max(latencies), 2), "result": result}
+
+
+def legacy_history(SessionLocal):
+    db = SessionLocal()
+    try:
+        today = datetime.now().date()
+        conversations = db.query(Conversation).filter(
+            Conversation.user_id == 1,
+            Conversation.scenario == SCENARIO
+        ).order_by(desc(Conversation.updated_at)).all()
+        groups = {}
+        for conv in conversations:
+            days = (today - conv.updated_at.date()).days
+            name = "当天" if days == 0 else "3天前" if days <= 3 else "最近7天" if days <= 7 else "更早"
+            groups.setdefault(name, []).append({
+                "id": conv.id, "title": conv.title, "updated_at": conv.updated_at.isoformat()
+            })
+        return len(orjson.dumps(groups))
+    finally:
+        db.close()
+
+
+def legacy_conversation(SessionLocal, conversation_id: str):
+    db = SessionLocal()
+    try:
+        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        messages = [
+            {"role": m.role, "content": m.content, "timestamp": m.timestamp.isoformat()}
+            for m in conversation.messages
+        ]
+        return len(orjson.dumps(messages))
+    finally:
+        db.close()
+
+
+def run_legacy(path: str, long_conversation: str, rounds: int):
+    conn = sqlite3.connect(path)
+    conn.execute("DROP INDEX IF EXISTS ix_conversations_user_scenario_updated")
+    conn.execute("DROP INDEX IF EXISTS ix_messages_conversation_timestamp")
+    conn.execute("ANALYZE")
+    conn.close()
+    engine = create_db_engine(f"sqlite:///{path}")
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    history = timed(lambda: legacy_history(SessionLocal), rounds)
+    conversation = timed(lambda: legacy_conversation(SessionLocal, long_conversation), rounds)
+    print({"mode": "legacy", "endpoint": "history", "bytes": history.pop("result"), **history})
+    print({"mode": "legacy", "endpoint": "conversation", "bytes": conversation.pop("result"), **conversation})
+    engine.dispose()
+
+
+def run_keyset(path: str, long_conversation: str, rounds: int):
+    engine = create_db_engine(f"sqlite:///{path}")
+    migrate_schema(engine)
+    with engine.connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+    client.post("/login", data={"username": "user1", "password": "p"})
+
+    def page(url, **params):
+        response = client.get(url, params=params)
+        response.raise_for_status()
+        return response
+
+    history = timed(lambda: len(page("/api/history", scenario=SCENARIO).content), rounds)
+    print({"mode": "keyset", "endpoint": "history first page", "bytes": history.pop("result"), **history})
+
+    # 连续翻 20 页，验证深翻页时延不随页码增长
+    cursor = page("/api/history", scenario=SCENARIO).json()["next_cursor"]
+    deep = []
+    for _ in range(20):
+        if not cursor:
+            break
+        start = time.perf_counter()
+        cursor = page("/api/history", scenario=SCENARIO, cursor=cursor).json()["next_cursor"]
+        deep.append((time.perf_counter() - start) * 1000)
+    if deep:
+        print({"mode": "keyset", "endpoint": "history next pages", "pages": len(deep),
+               "p50_ms": round(statistics.median(deep), 2), "max_ms": round(max(deep), 2)})
+
+    conversation = timed(lambda: len(page(f"/api/conversation/{long_conversation}").content), rounds)
+    print({"mode": "keyset", "endpoint": "conversation latest page", "bytes": conversation.pop("result"), **conversation})
+    app.dependency_overrides.pop(get_db, None)
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史记录查询基准")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--user-conversations", type=int, default=5000)
+    parser.add_argument("--long-messages", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        keyset_path = os.path.join(tmp, "keyset.db")
+        long_conversation = seed(keyset_path, args.messages, args.user_conversations, args.long_messages)
+        legacy_path = os.path.join(tmp, "legacy.db")
+        with sqlite3.connect(keyset_path) as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        shutil.copy(keyset_path, legacy_path)
+
+        run_legacy(legacy_path, long_conversation, args.rounds)
+        run_keyset(keyset_path, long_conversation, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+大模型客户端复用基准
+
+对本地模拟服务（benchmarks.mock_openai）持续发起流式请求，--concurrency 个并发、每个连续 --rounds 次，对比：
+  - per_call：改造前的写法，每次调用 init_chat_model 重新构建模型与 HTTP 客户端
+  - pooled：utils.llm.LLMClientManager，模型对象与连接池在进程内复用
+
+分别统计客户端侧的首 token 时延（含构建开销）p50/p95/p99 与单次构建耗时。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.llm_client --concurrency 20 --rounds 10 --ttft 0.2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.load_test import free_port, percentiles, start_server, stop_server
+from benchmarks.mock_openai import MockConfig, create_app
+
+
+def per_call_stream(base_url: str, setup_ms: list):
+    async def stream(prompt):
+        start = time.perf_counter()
+        from langchain.chat_models import init_chat_model
+        model = init_chat_model(
+            model="deepseek-chat",
+            model_provider="deepseek",
+            api_key="bench",
+            api_base=base_url,
+            temperature=0.7,
+            stream_usage=True)
+        setup_ms.append((time.perf_counter() - start) * 1000)
+        async for token in model.astream(prompt):
+            yield token.content
+    return stream
+
+
+def pooled_stream(manager, setup_ms: list):
+    async def stream(prompt):
+        start = time.perf_counter()
+        manager.model("需求挖掘")
+        setup_ms.append((time.perf_counter() - start) * 1000)
+        async for token in manager.astream(prompt, scenario="需求挖掘"):
+            yield token
+    return stream
+
+
+async def drive(stream, concurrency: int, rounds: int) -> list:
+    async def worker(index):
+        ttfts = []
+        for round_index in range(rounds):
+            start = time.perf_counter()
+            ttft = None
+            async for token in stream(f"问题 {index}-{round_index}"):
+                if ttft is None and token:
+                    ttft = (time.perf_counter() - start) * 1000
+            ttfts.append(ttft)
+        return ttfts
+
+    results = await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return [ttft for ttfts in results for ttft in ttfts if ttft is not None]
+
+
+def bench(mode: str, base_url: str, args) -> dict:
+    setup_ms = []
+
+    async def run():
+        manager = None
+        if mode == "pooled":
+            from utils.llm import LLMClientManager
+            manager = LLMClientManager(api_key="bench", base_url=base_url)
+            manager.warm_up()
+            stream = pooled_stream(manager, setup_ms)
+        else:
+            stream = per_call_stream(base_url, setup_ms)
+        # 预热一次：两种方式都先完成模块导入
+        async for _ in stream("预热"):
+            pass
+        setup_ms.clear()
+        start = time.perf_counter()
+        ttfts = await drive(stream, args.concurrency, args.rounds)
+        elapsed = time.perf_counter() - start
+        if manager is not None:
+            await manager.aclose()
+        return ttfts, elapsed
+
+    ttfts, elapsed = asyncio.run(run())
+    return {
+        "mode": mode,
+        "requests": len(ttfts),
+        "requests_per_second": round(len(ttfts) / elapsed, 1),
+        "setup_ms_mean": round(statistics.mean(setup_ms), 3),
+        "ttft_ms": percentiles(ttfts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大模型客户端复用基准")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--ttft", type=float, default=0.2, help="模拟模型首 token 延迟（秒）")
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--mode", choices=["per_call", "pooled", "both"], default="both")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(create_app(MockConfig(ttft=args.ttft, token_rate=0, tokens=args.tokens)), port)
+    base_url = f"http://127.0.0.1:{port}/v1"
+    try:
+        modes = ["per_call", "pooled"] if args.mode == "both" else [args.mode]
+        for mode in modes:
+            print(bench(mode, base_url, args))
+    finally:
+        stop_server(server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""
+端到端压测：本地模拟上游 + main:app，结果保存为 JSON 便于版本间对比
+
+启动 benchmarks.mock_openai 模拟服务，把 DeepSeek 与百炼的地址指向它，
+再用 uvicorn 在同一进程内启动 main:app（临时 SQLite 库与临时知识库）。
+--users 个虚拟用户以最多 --concurrency 个并发依次执行：
+    注册 -> 登录 -> 新建对话 -> --turns 轮对话 -> 查询历史 -> 导出用例
+RAG 场景（运维助手、产品手册）会预先写入 --rag-docs 条确定性向量的文档，走完整检索链路。
+
+报告内容：
+  - 吞吐：每秒完成的对话轮数与请求数
+  - 对话首 token 时延（TTFT）与整轮耗时的 p50/p95/p99
+  - 各接口时延分位数与错误数
+  - 数据库争用：写语句耗时分位数、提交耗时分位数（db_commit_duration_seconds）、
+    “database is locked” 错误数
+  - 上游调用次数（模拟服务统计）
+
+用法（在项目根目录执行）：
+    python -m benchmarks.load_test --users 50 --concurrency 20 --turns 3 --output results.json
+    python -m benchmarks.load_test --baseline results.json --output results-new.json
+
+指定 --baseline 时与上一次结果对比，关键指标变差超过 --tolerance（默认 20%）即以非零状态码退出。
+注意压测端、模拟服务与被测服务共用一个进程，绝对数值只适合同一台机器上的版本间对比。
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+import orjson
+import uvicorn
+
+from benchmarks.mock_openai import MockConfig, create_app, embedding_vector
+
+RAG_SCENARIOS = {"运维助手": "devops_tool", "产品手册": "product_manual"}
+
+# 对比基线时检查的指标：(路径, 越大越好)
+REGRESSION_CHECKS = [
+    (("throughput", "chat_turns_per_second"), True),
+    (("ttft_ms", "p50"), False),
+    (("ttft_ms", "p95"), False),
+    (("ttft_ms", "p99"), False),
+    (("chat_total_ms", "p95"), False),
+    (("db", "write_statement_ms", "p95"), False),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"端口 {port} 上的服务启动失败")
+        time.sleep(0.05)
+    server.thread = thread
+    return server
+
+
+def stop_server(server: uvicorn.Server):
+    server.should_exit = True
+    server.thread.join(timeout=10)
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))], 2)
+
+    return {
+        "count": len(values),
+        "p50": round(statistics.median(values), 2),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": round(values[-1], 2),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def seed_knowledge_base(path: str, docs: int, dimensions: int):
+    """为 RAG 场景的集合写入文档，向量与模拟嵌入接口的结果一致"""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    for scenario, collection_name in RAG_SCENARIOS.items():
+        collection = client.get_or_create_collection(name=collection_name)
+        texts = [f"{scenario}知识条目 {i}：处理步骤与注意事项，编号 KB-{i:05d}。" * 4 for i in range(docs)]
+        for start in range(0, docs, 256):
+            batch = texts[start:start + 256]
+            collection.upsert(
+                ids=[f"{collection_name}-{start + i}" for i in range(len(batch))],
+                documents=batch,
+                embeddings=[embedding_vector(text, dimensions).tolist() for text in batch],
+                metadatas=[{"source": "load_test.pdf", "page": start + i, "start_index": 0} for i in range(len(batch))]
+            )
+
+
+class DbContention:
+    """通过 SQLAlchemy 事件统计写语句耗时与锁冲突"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.write_ms = []
+        self.locked_errors = 0
+        self.errors = 0
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, executemany):
+            context._load_test_start = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+                self.write_ms.append((time.perf_counter() - context._load_test_start) * 1000)
+
+        @event.listens_for(engine, "handle_error")
+        def on_error(context):
+            self.errors += 1
+            if "locked" in str(context.original_exception).lower():
+                self.locked_errors += 1
+
+    def report(self, metrics) -> dict:
+        commit = {}
+        for labels in metrics.DB_COMMIT_SECONDS.series():
+            operation = labels[0]
+            p50 = metrics.DB_COMMIT_SECONDS.quantile(0.5, *labels)
+            p99 = metrics.DB_COMMIT_SECONDS.quantile(0.99, *labels)
+            commit[operation] = {
+                "count": metrics.DB_COMMIT_SECONDS.count(*labels),
+                "p50_ms_est": round(p50 * 1000, 2),
+                "p99_ms_est": round(p99 * 1000, 2),
+            }
+        return {
+            "write_statement_ms": percentiles(self.write_ms),
+            "commit_by_operation": commit,
+            "locked_errors": self.locked_errors,
+            "errors": self.errors,
+        }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.ttft_ms = []
+        self.chat_total_ms = []
+        self.chat_turns = 0
+        self.requests = 0
+
+    def record(self, operation: str, start: float, ok: bool):
+        self.requests += 1
+        self.latencies[operation].append((time.perf_counter() - start) * 1000)
+        if not ok:
+            self.errors[operation] += 1
+
+
+async def chat_turn(client: httpx.AsyncClient, recorder: Recorder, message: str, scenario: str, conversation_id: str):
+    start = time.perf_counter()
+    ttft = None
+    done = False
+    ok = False
+    try:
+        async with client.stream(
+            "POST", "/api/chat",
+            json={"message": message, "scenario": scenario, "conversation_id": conversation_id}
+        ) as response:
+            ok = response.status_code == 200
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                if ttft is None and line.startswith('data: {"token"'):
+                    ttft = (time.perf_counter() - start) * 1000
+                elif line == "data: [DONE]":
+                    done = True
+    except httpx.HTTPError:
+        ok = False
+    recorder.record("chat", start, ok and done)
+    if ok and done:
+        recorder.chat_turns += 1
+        recorder.chat_total_ms.append((time.perf_counter() - start) * 1000)
+        if ttft is not None:
+            recorder.ttft_ms.append(ttft)
+
+
+async def virtual_user(base_url: str, index: int, args, recorder: Recorder):
+    scenario = args.scenarios[index % len(args.scenarios)]
+    username = f"load-{uuid.uuid4().hex[:12]}"
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+        async def call(operation, method, url, expected=(200,), **kwargs):
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                ok = response.status_code in expected
+            except httpx.HTTPError:
+                response, ok = None, False
+            recorder.record(operation, start, ok)
+            return response if ok else None
+
+        credentials = {"username": username, "password": "load-test"}
+        if await call("register", "POST", "/register", expected=(303,), data=credentials) is None:
+            return
+        if await call("login", "POST", "/login", expected=(303,), data=credentials) is None:
+            return
+        response = await call("new_conversation", "POST", "/api/conversation/new", data={"scenario": scenario})
+        if response is None:
+            return
+        conversation_id = response.json()["conversation_id"]
+
+        for turn in range(args.turns):
+            # 每个问题都不相同，避免命中语义回答缓存
+            message = f"请针对登录模块生成测试用例，用户 {index} 第 {turn + 1} 轮，编号 {uuid.uuid4().hex[:8]}"
+            await chat_turn(client, recorder, message, scenario, conversation_id)
+            if args.think_time > 0:
+                await asyncio.sleep(args.think_time)
+
+        await call("history", "GET", "/api/history", params={"scenario": scenario})
+        await call("export", "GET", "/api/export/testcases", params={"conversation_id": conversation_id})
+
+
+async def drive(base_url: str, args, recorder: Recorder):
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run(index):
+        async with semaphore:
+            await virtual_user(base_url, index, args, recorder)
+
+    await asyncio.gather(*(run(i) for i in range(args.users)))
+
+
+def configure_environment(mock_base_url: str, workdir: str, args):
+    """需在导入 main 之前设置：各模块在导入时读取环境变量"""
+    os.environ["DEEPSEEK_API_BASE"] = mock_base_url
+    os.environ["DEEPSEEK_API_KEY"] = "load-test"
+    os.environ["ALIYUN_BASE_URL"] = mock_base_url
+    os.environ["ALIYUN_API_KEY"] = "load-test"
+    os.environ["EMBEDDING_BACKEND"] = "remote"
+    os.environ["RAG_DB_PATH"] = os.path.join(workdir, "rag_db")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.db")
+    os.environ["METRICS_ENABLED"] = "true"
+    # 压测从服务完全就绪开始计时，不把后台初始化算进首批请求
+    os.environ["STARTUP_BACKGROUND_INIT"] = "false"
+    if args.rag_docs:
+        seed_knowledge_base(os.environ["RAG_DB_PATH"], args.rag_docs, args.dimensions)
+
+
+def bind_database(main_module, path: str):
+    """把 main 的会话工厂指向临时库，不影响项目目录下的 fast_test.db"""
+    engine = main_module.create_db_engine(f"sqlite:///{path}")
+    main_module.Base.metadata.create_all(bind=engine)
+    main_module.migrate_schema(engine)
+    main_module.engine = engine
+    main_module.SessionLocal.configure(bind=engine)
+    return engine
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for path, higher_is_better in REGRESSION_CHECKS:
+        current, previous = result, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or previous == 0:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        line = {"metric": ".".join(path), "baseline": previous, "current": current, "change": f"{change:+.1%}"}
+        print(line)
+        if worse > tolerance:
+            regressions.append(line)
+    return regressions
+
+
+def run(args) -> dict:
+    mock_config = MockConfig(
+        ttft=args.llm_ttft,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        embedding_latency=args.embedding_latency,
+        dimensions=args.dimensions
+    )
+    mock_port = free_port()
+    mock_server = start_server(create_app(mock_config), mock_port)
+    mock_base_url = f"http://127.0.0.1:{mock_port}/v1"
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(mock_base_url, workdir, args)
+
+        import main as main_module
+        from utils import metrics
+
+        engine = bind_database(main_module, os.path.join(workdir, "load_test.db"))
+        contention = DbContention(engine)
+
+        port = free_port()
+        app_server = start_server(main_module.app, port)
+        recorder = Recorder()
+        start = time.perf_counter()
+        try:
+            asyncio.run(drive(f"http://127.0.0.1:{port}", args, recorder))
+        finally:
+            elapsed = time.perf_counter() - start
+            stop_server(app_server)
+        upstream = httpx.get(f"http://127.0.0.1:{mock_port}/stats").json()
+        stop_server(mock_server)
+        engine.dispose()
+
+        return {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            "elapsed_s": round(elapsed, 2),
+            "throughput": {
+                "chat_turns_per_second": round(recorder.chat_turns / elapsed, 2),
+                "requests_per_second": round(recorder.requests / elapsed, 2),
+            },
+            "ttft_ms": percentiles(recorder.ttft_ms),
+            "chat_total_ms": percentiles(recorder.chat_total_ms),
+            "operations": {
+                operation: {**percentiles(latencies), "errors": recorder.errors.get(operation, 0)}
+                for operation, latencies in recorder.latencies.items()
+            },
+            "db": contention.report(metrics),
+            "upstream": upstream,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端压测")
+    parser.add_argument("--users", type=int, default=50, help="虚拟用户总数")
+    parser.add_argument("--concurrency", type=int, default=20, help="同时活跃的虚拟用户数")
+    parser.add_argument("--turns", type=int, default=3, help="每个用户的对话轮数")
+    parser.add_argument("--think-time", type=float, default=0.0, help="两轮对话之间的间隔（秒）")
+    parser.add_argument("--scenarios", default="用例生成,运维助手", help="逗号分隔，用户轮流分配")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="模拟模型首 token 延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="模拟模型每秒 token 数")
+    parser.add_argument("--tokens", type=int, default=100, help="每条回答的 token 数")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="模拟嵌入接口延迟（秒）")
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--rag-docs", type=int, default=500, help="每个知识库集合写入的文档数，0 表示不写入")
+    parser.add_argument("--output", default="load_test_results.json")
+    parser.add_argument("--baseline", help="上一次的结果文件，用于回归对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的指标变差比例")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+
+    result = run(args)
+    with open(args.output, "wb") as f:
+        f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+    print(orjson.dumps({key: result[key] for key in ("throughput", "ttft_ms", "chat_total_ms", "db")},
+                       option=orjson.OPT_INDENT_2).decode())
+    print(f"结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "rb") as f:
+            baseline = orjson.loads(f.read())
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} 项指标变差超过 {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+本地 OpenAI 兼容模拟服务，替代 DeepSeek 对话接口与百炼嵌入接口用于压测
+
+  - POST /v1/chat/completions：支持流式与非流式，首 token 延迟、token 速率、回答长度可配置，
+    流式请求带 stream_options.include_usage 时在末尾返回用量；回答中带一张 Markdown 表格，
+    便于覆盖用例导出
+  - POST /v1/embeddings：按文本内容生成确定性的单位向量（同一文本每次结果相同），
+    支持 float / base64 两种编码与 dimensions 参数，延迟可配置
+  - GET /stats：各接口累计请求数，压测结束后用于核对上游调用次数
+
+可单独启动，供本地起的服务通过环境变量指向它：
+    python -m benchmarks.mock_openai --port 9000 --ttft 0.3 --token-rate 50
+    DEEPSEEK_API_BASE=http://127.0.0.1:9000/v1 ALIYUN_BASE_URL=http://127.0.0.1:9000/v1 uvicorn main:app
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import time
+import uuid
+from dataclasses import dataclass
+
+import numpy as np
+import orjson
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+
+ANSWER_HEAD = "根据需求整理如下。\n\n| 用例编号 | 用例标题 | 预期结果 |\n| --- | --- | --- |\n"
+ANSWER_ROW = "| TC-{index:03d} | 模拟用例 {index} | 返回成功 |\n"
+
+
+@dataclass
+class MockConfig:
+    ttft: float = 0.3
+    token_rate: float = 50.0
+    tokens: int = 100
+    embedding_latency: float = 0.02
+    dimensions: int = 1024
+
+
+def embedding_vector(text: str, dimensions: int) -> np.ndarray:
+    """以文本的 SHA-256 为随机种子生成单位向量，结果只取决于文本与维度"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def answer_tokens(count: int) -> list:
+    """生成固定内容的回答并切成 count 个 token，每行表格按单元格切分"""
+    text = ANSWER_HEAD + "".join(ANSWER_ROW.format(index=i + 1) for i in range(max(1, count // 8)))
+    pieces = [piece for piece in text.replace("|", "\0|").split("\0") if piece]
+    if len(pieces) >= count:
+        return pieces[:count - 1] + ["".join(pieces[count - 1:])]
+    return pieces + ["。"] * (count - len(pieces))
+
+
+def prompt_tokens(messages) -> int:
+    return sum(len(str(message.get("content", ""))) for message in messages) // 2 + 1
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI")
+    stats = {"chat_completions": 0, "chat_streams": 0, "embeddings": 0, "embedding_inputs": 0}
+
+    def chunk(completion_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> bytes:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else [],
+        }
+        if usage is not None:
+            payload["usage"] = usage
+        return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "mock-chat")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        tokens = answer_tokens(config.tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens(body.get("messages", [])),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        stats["chat_completions"] += 1
+        interval = 1.0 / config.token_rate if config.token_rate > 0 else 0.0
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.ttft + interval * (len(tokens) - 1))
+            return Response(orjson.dumps({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            }), media_type="application/json")
+
+        stats["chat_streams"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def stream():
+            await asyncio.sleep(config.ttft)
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+            # 按绝对时间排期，避免 sleep 误差逐 token 累积
+            start = time.perf_counter()
+            for index, token in enumerate(tokens):
+                delay = start + index * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield chunk(completion_id, model, {"content": token})
+            yield chunk(completion_id, model, {}, finish_reason="stop")
+            if include_usage:
+                yield chunk(completion_id, model, {}, usage=usage)
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = int(body.get("dimensions") or config.dimensions)
+        encoding_format = body.get("encoding_format") or "float"
+        stats["embeddings"] += 1
+        stats["embedding_inputs"] += len(inputs)
+        if config.embedding_latency > 0:
+            await asyncio.sleep(config.embedding_latency)
+
+        data = []
+        for index, text in enumerate(inputs):
+            vector = embedding_vector(str(text), dimensions)
+            if encoding_format == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        total_tokens = sum(len(str(text)) for text in inputs) // 2 + len(inputs)
+        return Response(orjson.dumps({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "mock-embedding"),
+            "usage": {"prompt_tokens": total_tokens, "total_tokens": total_tokens}
+        }), media_type="application/json")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft", type=float, default=0.3, help="首 token 延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="每秒输出 token 数，0 表示不限速")
+    parser.add_argument("--tokens", type=int, default=100, help="每条回答的 token 数")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="嵌入接口延迟（秒）")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        ttft=args.ttft,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        embedding_latency=args.embedding_latency
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
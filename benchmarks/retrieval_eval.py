@@ -0,0 +1,338 @@
+"""
+检索调优评估：在标注查询集上比较不同 HNSW 参数的召回质量与查询时延
+
+从 --db-path 的集合 --collection 读出全部片段（向量、正文、元数据），对每组构建参数
+（--space × --m × --ef-construction）在临时目录中重建一份集合，再依次把 ef_search 调整为 --ef-search
+中的各个值，通过 ChromaRetriever.aretrieve 逐条回放查询集（纯向量检索，不启用 BM25 混合），统计：
+  - recall@k：前 k 个结果命中的标注片段数 / 标注片段数，按查询平均
+  - mrr：第一个命中片段名次的倒数（前 max(k) 个内未命中记 0），按查询平均
+  - ann_recall@k：与同一距离下暴力精确检索前 k 个结果的重合度，只反映 HNSW 近似带来的损失
+  - 向量查询时延 p50/p95/p99（毫秒，查询向量已预先算好并缓存，不含嵌入耗时）以及建索引耗时
+
+查询集为 JSONL，每行一个查询，标注答案二选一（可同时提供，任一片段命中即算命中）：
+    {"query": "MySQL 备份失败怎么办", "relevant_ids": ["片段 ID", ...]}
+    {"query": "如何配置按月备份", "relevant_pages": [["产品手册.pdf", 12]]}
+relevant_pages 按来源文件名与元数据中的页码（PyPDFLoader 从 0 开始）匹配该页的全部片段。
+不提供 --queries 时随机抽取 --sample 个已入库片段，以其开头一句作为查询、该片段作为答案，
+只适合比较参数之间的相对差异。查询向量使用与线上一致的嵌入后端（EMBEDDING_BACKEND）。
+
+--synthetic N 不读取向量库，也不调用嵌入接口：生成 N 个按主题聚簇的模拟向量，
+查询为抽样片段向量加噪声，用于离线试跑和观察参数趋势。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.retrieval_eval --collection product_manual --queries eval/product_manual.jsonl \\
+        --space l2,cosine --m 16,32 --ef-construction 100,200 --ef-search 10,50,100 --k 3,5
+    python -m benchmarks.retrieval_eval --synthetic 50000 --sample 500 --m 8,16,32 --ef-search 10,20,50,100
+结果逐行打印，--output 另存为 JSON。
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import re
+import tempfile
+import time
+from dataclasses import replace
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import orjson
+
+from benchmarks.load_test import percentiles
+from utils.embedding_cache import EmbeddingCache
+from utils.embeddings import EmbeddingBackend
+from utils.vector_index import HNSWParams, apply_search_params, current_hnsw, get_or_create_collection
+
+CHROMA_DEFAULTS = {"space": "l2", "m": 16, "ef_construction": 100, "ef_search": 100}
+
+
+class Corpus:
+    """评估用的片段全集，向量按行存放"""
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings: np.ndarray):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class StaticEmbeddingBackend(EmbeddingBackend):
+    """按文本查表返回预先生成的向量，供 --synthetic 离线评估使用"""
+
+    def __init__(self, vectors: Dict[str, List[float]], dimensions: int):
+        self.model_name = "synthetic"
+        self.dimensions = dimensions
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.vectors[text] for text in texts]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+
+def load_corpus(db_path: str, collection_name: str, batch_size: int = 1000) -> Corpus:
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=db_path).get_collection(name=collection_name)
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for offset in range(0, collection.count(), batch_size):
+        batch = collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        metadatas.extend(metadata or {} for metadata in batch["metadatas"])
+        embeddings.append(np.asarray(batch["embeddings"], dtype=np.float32))
+    print({"collection": collection_name, "chunks": len(ids), "source_hnsw": current_hnsw(collection)})
+    return Corpus(ids, documents, metadatas, np.vstack(embeddings))
+
+
+def synthetic_corpus(size: int, dimensions: int, rng: np.random.Generator) -> Corpus:
+    """按主题聚簇的单位向量：真实嵌入同一主题的片段彼此接近，纯随机向量会低估 HNSW 的召回"""
+    topics = max(8, size // 200)
+    centroids = rng.standard_normal((topics, dimensions)).astype(np.float32)
+    assignment = rng.integers(0, topics, size)
+    vectors = centroids[assignment] + 0.8 * rng.standard_normal((size, dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"synthetic-{i}" for i in range(size)]
+    documents = [f"主题 {topic} 的模拟片段 {i}" for i, topic in enumerate(assignment)]
+    metadatas = [{"source": "synthetic.pdf", "page": int(topic), "start_index": 0} for topic in assignment]
+    return Corpus(ids, documents, metadatas, vectors)
+
+
+def first_sentence(text: str, limit: int = 60) -> str:
+    return re.split(r"(?<=[。！？?!.])\s*", text.strip(), maxsplit=1)[0][:limit]
+
+
+def load_queries(path: str, corpus: Corpus) -> List[dict]:
+    """读取标注查询集，relevant_pages 换算成片段 ID"""
+    pages: Dict[tuple, List[str]] = {}
+    for doc_id, metadata in zip(corpus.ids, corpus.metadatas):
+        key = (os.path.basename(str(metadata.get("source", ""))), metadata.get("page"))
+        pages.setdefault(key, []).append(doc_id)
+
+    queries = []
+    with open(path, "rb") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = orjson.loads(line)
+            relevant = set(item.get("relevant_ids") or [])
+            for source, page in item.get("relevant_pages") or []:
+                relevant.update(pages.get((os.path.basename(source), page), []))
+            if not relevant:
+                print(f"第 {line_no} 行的标注在集合中找不到对应片段，已跳过: {item.get('query')}")
+                continue
+            queries.append({"query": item["query"], "relevant": relevant})
+    return queries
+
+
+def sample_queries(corpus: Corpus, count: int, rng: random.Random) -> List[dict]:
+    """用已入库片段的开头一句作为查询"""
+    queries = []
+    for index in rng.sample(range(len(corpus)), min(count, len(corpus))):
+        query = first_sentence(corpus.documents[index] or "")
+        if query:
+            queries.append({"query": query, "relevant": {corpus.ids[index]}})
+    return queries
+
+
+def synthetic_queries(corpus: Corpus, count: int, rng: np.random.Generator) -> tuple:
+    """抽样片段向量加噪声作为查询向量，返回 (查询集, 文本 -> 向量)"""
+    queries, vectors = [], {}
+    dimensions = corpus.embeddings.shape[1]
+    for index in rng.choice(len(corpus), min(count, len(corpus)), replace=False):
+        vector = corpus.embeddings[index] + 0.05 * rng.standard_normal(dimensions).astype(np.float32)
+        text = f"查询 {index}"
+        vectors[text] = (vector / np.linalg.norm(vector)).tolist()
+        queries.append({"query": text, "relevant": {corpus.ids[index]}})
+    return queries, vectors
+
+
+def exact_neighbors(corpus: Corpus, query_vectors: np.ndarray, space: str, k: int) -> List[List[str]]:
+    """暴力计算指定距离下的前 k 个片段（与 Chroma 的距离定义一致）"""
+    data = corpus.embeddings
+    if space == "cosine":
+        data = data / np.maximum(np.linalg.norm(data, axis=1, keepdims=True), 1e-12)
+        query_vectors = query_vectors / np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+    results = []
+    for start in range(0, len(query_vectors), 256):
+        block = query_vectors[start:start + 256]
+        scores = block @ data.T
+        if space == "l2":
+            # ||q - x||² = ||q||² - 2q·x + ||x||²，按行排序时 ||q||² 是常数
+            scores = 2 * scores - np.einsum("ij,ij->i", data, data)[None, :]
+        top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+        for row, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row[candidates])]
+            results.append([corpus.ids[i] for i in ordered])
+    return results
+
+
+def build_collection(client, name: str, corpus: Corpus, params: HNSWParams) -> float:
+    start = time.perf_counter()
+    collection = get_or_create_collection(client, name, params)
+    batch_size = min(client.get_max_batch_size(), 5000)
+    for offset in range(0, len(corpus), batch_size):
+        collection.add(
+            ids=corpus.ids[offset:offset + batch_size],
+            documents=corpus.documents[offset:offset + batch_size],
+            metadatas=corpus.metadatas[offset:offset + batch_size],
+            embeddings=corpus.embeddings[offset:offset + batch_size]
+        )
+    return round(time.perf_counter() - start, 2)
+
+
+def score(ranked: Sequence[str], relevant: set, exact: Sequence[str], ks: Sequence[int]) -> dict:
+    row = {}
+    for k in ks:
+        row[f"recall@{k}"] = len(relevant.intersection(ranked[:k])) / len(relevant)
+        row[f"ann_recall@{k}"] = len(set(exact[:k]).intersection(ranked[:k])) / max(1, min(k, len(exact)))
+    row["mrr"] = next((1 / rank for rank, doc_id in enumerate(ranked, 1) if doc_id in relevant), 0.0)
+    return row
+
+
+async def replay(retriever, queries: List[dict], exact: List[List[str]], ks: Sequence[int]) -> dict:
+    """逐条回放查询集，返回平均指标与向量查询时延"""
+    top_k = max(ks)
+    totals: Dict[str, float] = {}
+    latencies = []
+    for query, exact_ids in zip(queries, exact):
+        docs, timings = await retriever.aretrieve(query["query"], top_k)
+        latencies.append(timings["vector_ms"])
+        for key, value in score([doc.id for doc in docs], query["relevant"], exact_ids, ks).items():
+            totals[key] = totals.get(key, 0.0) + value
+    report = {key: round(value / len(queries), 4) for key, value in sorted(totals.items())}
+    report["latency_ms"] = percentiles(latencies)
+    return report
+
+
+def grid(values: Optional[str], cast, default) -> list:
+    return [cast(value) for value in values.split(",")] if values else [default]
+
+
+def close_client(client):
+    """关闭客户端的 System，释放 SQLite 连接与 HNSW 段；之后再打开同一路径会读到磁盘上的最新配置"""
+    from utils.registry import _detach_system, _stop_system
+
+    system = _detach_system(client)
+    if system is not None:
+        _stop_system(system)
+
+
+def open_retriever(workdir: str, name: str, backend: EmbeddingBackend, cache: EmbeddingCache):
+    """打开新的客户端：Chroma 客户端缓存了集合配置，调整 ef_search 后要关闭旧客户端再打开才会生效"""
+    import chromadb
+    from utils.retriever import ChromaRetriever
+
+    return ChromaRetriever(
+        collection_name=name,
+        chroma_client=chromadb.PersistentClient(path=workdir),
+        embedding_backend=backend,
+        embedding_cache=cache,
+        singleflight=False
+    )
+
+
+async def evaluate(corpus: Corpus, queries: List[dict], backend: EmbeddingBackend, args) -> List[dict]:
+    import chromadb
+
+    ks = sorted(grid(args.k, int, 3))
+    spaces = grid(args.space, str, CHROMA_DEFAULTS["space"])
+    ms = grid(args.m, int, CHROMA_DEFAULTS["m"])
+    ef_constructions = grid(args.ef_construction, int, CHROMA_DEFAULTS["ef_construction"])
+    ef_searches = grid(args.ef_search, int, CHROMA_DEFAULTS["ef_search"])
+    # 查询向量只算一次，之后各组配置的检索都命中内存缓存
+    cache = EmbeddingCache()
+    query_vectors = None
+    exact_by_space = {}
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for index, (space, m, ef_construction) in enumerate(itertools.product(spaces, ms, ef_constructions)):
+            name = f"eval-{index}"
+            params = HNSWParams(space=space, m=m, ef_construction=ef_construction)
+            client = chromadb.PersistentClient(path=workdir)
+            build_s = build_collection(client, name, corpus, params)
+            close_client(client)
+
+            for ef_search in ef_searches:
+                retriever = open_retriever(workdir, name, backend, cache)
+                if apply_search_params(retriever.collection, replace(params, ef_search=ef_search)):
+                    close_client(retriever.chroma_client)
+                    retriever = open_retriever(workdir, name, backend, cache)
+                if query_vectors is None:
+                    start = time.perf_counter()
+                    query_vectors = np.asarray([await retriever.aembed(q["query"]) for q in queries], dtype=np.float32)
+                    print({"queries": len(queries), "embed_s": round(time.perf_counter() - start, 2)})
+                if space not in exact_by_space:
+                    exact_by_space[space] = exact_neighbors(corpus, query_vectors, space, max(ks))
+                # 预热：把索引载入内存，避免第一条查询的加载时间计入时延
+                retriever.collection.query(query_embeddings=query_vectors[:1], n_results=1, include=[])
+                row = {
+                    "space": space, "m": m, "ef_construction": ef_construction,
+                    "ef_search": current_hnsw(retriever.collection).get("ef_search"),
+                    "build_s": build_s,
+                    **await replay(retriever, queries, exact_by_space[space], ks),
+                }
+                print(row)
+                results.append(row)
+                close_client(retriever.chroma_client)
+
+            client = chromadb.PersistentClient(path=workdir)
+            client.delete_collection(name)
+            close_client(client)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HNSW 参数的检索质量与时延评估")
+    parser.add_argument("--db-path", default=os.getenv("RAG_DB_PATH"), help="向量库目录，默认 RAG_DB_PATH")
+    parser.add_argument("--collection", default="product_manual")
+    parser.add_argument("--queries", help="标注查询集（JSONL），为空时从集合中抽样生成")
+    parser.add_argument("--sample", type=int, default=200, help="未提供查询集时抽样的查询数")
+    parser.add_argument("--synthetic", type=int, default=0, help="使用 N 个模拟向量离线评估")
+    parser.add_argument("--dimensions", type=int, default=1024, help="模拟向量维度")
+    parser.add_argument("--space", help="距离，逗号分隔，如 l2,cosine,ip")
+    parser.add_argument("--m", help="HNSW M（每个节点的邻居数），逗号分隔")
+    parser.add_argument("--ef-construction", help="逗号分隔")
+    parser.add_argument("--ef-search", help="逗号分隔")
+    parser.add_argument("--k", default="3,5,10", help="计算 recall@k 的 k，逗号分隔；检索深度取最大值")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        rng = np.random.default_rng(args.seed)
+        corpus = synthetic_corpus(args.synthetic, args.dimensions, rng)
+        queries, vectors = synthetic_queries(corpus, args.sample, rng)
+        backend = StaticEmbeddingBackend(vectors, args.dimensions)
+    else:
+        if not args.db_path:
+            parser.error("需要 --db-path 或 RAG_DB_PATH")
+        from utils.embeddings import create_embedding_backend
+
+        corpus = load_corpus(args.db_path, args.collection)
+        if args.queries:
+            queries = load_queries(args.queries, corpus)
+        else:
+            queries = sample_queries(corpus, args.sample, random.Random(args.seed))
+        backend = create_embedding_backend(dimensions=corpus.embeddings.shape[1])
+    if not queries:
+        parser.error("查询集为空")
+
+    try:
+        results = asyncio.run(evaluate(corpus, queries, backend, args))
+    finally:
+        backend.close()
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(orjson.dumps({"chunks": len(corpus), "queries": len(queries), "results": results},
+                                 option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
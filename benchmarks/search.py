@@ -0,0 +1,162 @@
+"""
+对话全文搜索基准：FTS5 trigram 索引 vs 子串扫描
+
+在临时 SQLite 文件中生成 --users 个用户、共 --messages 条消息（中英文混合的运维问答文本，
+部分消息带有 ERR-xxx 形式的错误码）。各用户的消息量按 Zipf 分布（少数重度用户拥有大量消息），
+查询的用户按消息量加权抽取（越活跃的用户搜索越多）。统计：
+  - 建索引（rebuild）耗时与库文件大小
+  - 开启索引后单条写入（触发器维护索引）的耗时变化
+  - 各类查询的时延 p50/p95/p99：少见词、常见词、两字中文词（子串扫描）、翻页；
+    基线为同样的查询全部走子串扫描
+
+用法（在项目根目录执行）：
+    python -m benchmarks.search --messages 1000000 --users 1000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.load_test import percentiles
+from main import Base, create_db_engine
+from utils import search
+from utils.search import create_search_index, search_messages
+
+WORDS = ["数据库", "备份", "恢复", "配置", "参数", "检查", "日志", "磁盘", "网络", "超时", "重试", "告警",
+         "策略", "实例", "快照", "权限", "主从", "复制", "延迟", "连接池", "the", "backup", "job", "failed",
+         "mysql", "restore", "replica", "timeout", "kubernetes", "pod", "restart", "nginx", "upstream"]
+CONVERSATIONS_PER_USER = 20
+
+
+def sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(15, 60))]
+    if rng.random() < 0.05:
+        words.insert(rng.randrange(len(words)), f"ERR-{rng.randrange(1000):03d}")
+    return " ".join(words)
+
+
+def user_weights(users: int) -> list:
+    return [1 / (rank + 1) ** 1.1 for rank in range(users)]
+
+
+def populate(engine, users: int, messages: int, rng: random.Random):
+    Base.metadata.create_all(bind=engine)
+    conversations = [(f"c{u}-{i}", u + 1) for u in range(users) for i in range(CONVERSATIONS_PER_USER)]
+    owners = rng.choices(range(users), weights=user_weights(users), k=messages)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO users (id, username, password) VALUES (:id, :name, '')"),
+                           [{"id": u + 1, "name": f"user{u}"} for u in range(users)])
+        connection.execute(
+            text("INSERT INTO conversations (id, user_id, title, scenario, created_at, updated_at) "
+                 "VALUES (:id, :user_id, '对话', '运维助手', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"),
+            [{"id": cid, "user_id": uid} for cid, uid in conversations])
+        batch = []
+        for i in range(messages):
+            batch.append({
+                "conversation_id": f"c{owners[i]}-{rng.randrange(CONVERSATIONS_PER_USER)}",
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": sentence(rng),
+            })
+            if len(batch) >= 10000 or i == messages - 1:
+                connection.execute(
+                    text("INSERT INTO messages (conversation_id, role, content, timestamp) "
+                         "VALUES (:conversation_id, :role, :content, CURRENT_TIMESTAMP)"), batch)
+                batch = []
+
+
+def time_inserts(engine, count: int, rng: random.Random) -> float:
+    """单条提交的平均写入耗时（毫秒）"""
+    start = time.perf_counter()
+    for _ in range(count):
+        with engine.begin() as connection:
+            connection.execute(
+                text("INSERT INTO messages (conversation_id, role, content, timestamp) "
+                     "VALUES ('c0-0', 'assistant', :content, CURRENT_TIMESTAMP)"),
+                {"content": sentence(rng)})
+    return round((time.perf_counter() - start) * 1000 / count, 3)
+
+
+def run_queries(SessionLocal, users: int, queries: int, rng: random.Random) -> dict:
+    weights = user_weights(users)
+    pick_user = lambda: rng.choices(range(users), weights=weights)[0] + 1
+    cases = {
+        "rare_code": lambda: f"ERR-{rng.randrange(1000):03d}",
+        "common_word": lambda: rng.choice(["kubernetes", "连接池 timeout", "restore"]),
+        "short_cjk": lambda: rng.choice(["备份", "快照", "延迟"]),
+        "mixed": lambda: rng.choice(["备份 mysql", "主从 replica"]),
+    }
+    report = {}
+    db = SessionLocal()
+    try:
+        for name, make_query in cases.items():
+            latencies, hits = [], 0
+            for _ in range(queries):
+                user_id = pick_user()
+                start = time.perf_counter()
+                results, _ = search_messages(db, user_id, make_query(), limit=20)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len(results)
+            report[name] = {"hits_per_query": round(hits / queries, 1), **percentiles(latencies)}
+
+        # 翻到第 5 页
+        latencies = []
+        for _ in range(queries):
+            user_id = pick_user()
+            cursor = None
+            start = time.perf_counter()
+            for _ in range(5):
+                results, has_more = search_messages(db, user_id, "backup", before=cursor, limit=20)
+                if not has_more:
+                    break
+                cursor = results[-1]["message_id"]
+            latencies.append((time.perf_counter() - start) * 1000)
+        report["five_pages"] = percentiles(latencies)
+    finally:
+        db.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话全文搜索基准")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--inserts", type=int, default=500, help="测量单条写入耗时的条数")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "search.db")
+        engine = create_db_engine(f"sqlite:///{path}")
+        SessionLocal = sessionmaker(bind=engine)
+
+        start = time.perf_counter()
+        populate(engine, args.users, args.messages, rng)
+        print({"messages": args.messages, "users": args.users,
+               "populate_s": round(time.perf_counter() - start, 1),
+               "db_mb": round(os.path.getsize(path) / 2**20, 1)})
+        insert_ms_plain = time_inserts(engine, args.inserts, rng)
+
+        print({"mode": "like", **run_queries(SessionLocal, args.users, args.queries, random.Random(args.seed))})
+
+        start = time.perf_counter()
+        create_search_index(engine)
+        with engine.begin() as connection:
+            connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        print({"index_build_s": round(time.perf_counter() - start, 1),
+               "db_mb_with_index": round(os.path.getsize(path) / 2**20, 1),
+               "insert_ms_without_index": insert_ms_plain,
+               "insert_ms_with_index": time_inserts(engine, args.inserts, rng)})
+
+        print({"mode": "fts", **run_queries(SessionLocal, args.users, args.queries, random.Random(args.seed))})
+        search._fts_enabled = False
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
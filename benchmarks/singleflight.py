@@ -0,0 +1,118 @@
+"""
+相同问题并发检索的合并（single-flight）基准
+
+模拟“同一个文档问题在几秒内被很多人提问”：共 --bursts 轮，每轮 --concurrency 个请求同时检索
+同一个问题（带全半角、空白差异，规范化后相同），每轮换一个新问题以避开嵌入缓存。
+嵌入接口使用本地模拟服务（benchmarks.mock_openai，延迟 --embedding-latency），
+分别在开启/关闭合并时统计：
+  - 上游嵌入请求数、Chroma 查询次数
+  - 单次检索时延 p50/p95/p99 与总耗时
+
+用法（在项目根目录执行）：
+    python -m benchmarks.singleflight --concurrency 50 --bursts 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.load_test import free_port, percentiles, seed_knowledge_base, start_server, stop_server
+from benchmarks.mock_openai import MockConfig, create_app
+
+
+def variants(question: str, count: int) -> list:
+    """同一问题的不同写法：多余空白、全角字符"""
+    forms = [question, f"  {question} ", question.replace(" ", "  "), question.replace("?", "？")]
+    return [forms[i % len(forms)] for i in range(count)]
+
+
+async def run_bursts(retriever, args) -> tuple:
+    latencies = []
+
+    async def one(text):
+        start = time.perf_counter()
+        await retriever.aretrieve(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for burst in range(args.bursts):
+        question = f"MySQL backup failed after upgrade, how to restore? case {burst}"
+        await asyncio.gather(*(one(text) for text in variants(question, args.concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+def bench(singleflight: bool, rag_path: str, base_url: str, args) -> dict:
+    import chromadb
+    from openai import AsyncOpenAI, OpenAI
+
+    from utils.embedding_cache import EmbeddingCache
+    from utils.embeddings import RemoteEmbeddingBackend
+    from utils.retriever import ChromaRetriever
+
+    backend = RemoteEmbeddingBackend(
+        openai_client=OpenAI(api_key="bench", base_url=base_url),
+        async_openai_client=AsyncOpenAI(api_key="bench", base_url=base_url)
+    )
+    retriever = ChromaRetriever(
+        collection_name="devops_tool",
+        chroma_client=chromadb.PersistentClient(path=rag_path),
+        embedding_backend=backend,
+        embedding_cache=EmbeddingCache(path=None),
+        singleflight=singleflight
+    )
+    # 统计实际执行的 Chroma 查询次数
+    chroma_queries = 0
+    query = retriever.collection.query
+
+    def counting_query(*a, **kw):
+        nonlocal chroma_queries
+        chroma_queries += 1
+        return query(*a, **kw)
+
+    retriever.collection.query = counting_query
+
+    before = httpx.get(base_url.replace("/v1", "/stats")).json()["embeddings"]
+    latencies, elapsed = asyncio.run(run_bursts(retriever, args))
+    after = httpx.get(base_url.replace("/v1", "/stats")).json()["embeddings"]
+    return {
+        "singleflight": singleflight,
+        "requests": len(latencies),
+        "upstream_embedding_calls": after - before,
+        "chroma_queries": chroma_queries,
+        "elapsed_s": round(elapsed, 2),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="相同问题并发检索的合并基准")
+    parser.add_argument("--concurrency", type=int, default=50, help="每轮同时提问的人数")
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="模拟嵌入接口延迟（秒）")
+    parser.add_argument("--rag-docs", type=int, default=2000)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(create_app(MockConfig(embedding_latency=args.embedding_latency)), port)
+    base_url = f"http://127.0.0.1:{port}/v1"
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            rag_path = os.path.join(workdir, "rag_db")
+            seed_knowledge_base(rag_path, args.rag_docs, 1024)
+            for singleflight in (False, True):
+                print(bench(singleflight, rag_path, base_url, args))
+    finally:
+        stop_server(server)
+
+    from utils.retriever import SINGLEFLIGHT_CALLS
+    print({
+        f"{operation}_{role}": SINGLEFLIGHT_CALLS.value(operation, role)
+        for operation in ("embedding", "search") for role in ("leader", "shared")
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+冷启动基准
+
+  - import：全新解释器中 import main 的耗时（取 --runs 次中位数），并按 -X importtime 列出
+    main 直接导入的耗时最多的模块
+  - ready：启动 uvicorn main:app 到 /login 返回 200 的时间（time_to_ready），
+    以及到 /api/health/rag 全部集合就绪的时间（time_to_rag_ready）
+
+知识库与应用数据库都使用临时目录，预先写入 --rag-docs 条文档。--app-dir 可指向另一份检出
+（如旧版本的 git worktree），便于版本间对比。
+
+用法（在项目根目录执行）：
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --app-dir /tmp/old-checkout --runs 5
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.load_test import free_port, seed_knowledge_base
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def import_seconds(app_dir: str, env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=app_dir, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def import_profile(app_dir: str, env: dict, top: int) -> list:
+    """main 直接导入的模块按累计耗时排序"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=app_dir, env=env, capture_output=True, text=True, check=True
+    ).stderr
+    entries = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)$", line)
+        # 缩进两个空格的是 main 的直接依赖
+        if match and len(match.group(2)) == 3:
+            entries.append((match.group(3), round(int(match.group(1)) / 1000, 1)))
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    return entries[:top]
+
+
+def time_to_ready(app_dir: str, env: dict, timeout: float) -> dict:
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    result = {"time_to_ready_s": None, "time_to_rag_ready_s": None}
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(timeout=2) as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    if result["time_to_ready_s"] is None:
+                        if client.get(f"{base_url}/login").status_code == 200:
+                            result["time_to_ready_s"] = round(time.perf_counter() - start, 3)
+                    elif client.get(f"{base_url}/api/health/rag").json().get("status") == "ok":
+                        result["time_to_rag_ready_s"] = round(time.perf_counter() - start, 3)
+                        break
+                except httpx.HTTPError:
+                    pass
+                if process.poll() is not None:
+                    raise RuntimeError(f"服务进程提前退出，返回码 {process.returncode}")
+                time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return result
+
+
+def median_of(results: list, key: str):
+    values = [r[key] for r in results if r[key] is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动基准")
+    parser.add_argument("--app-dir", default=os.getcwd(), help="被测代码目录")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rag-docs", type=int, default=1000)
+    parser.add_argument("--top", type=int, default=10, help="列出耗时最多的直接依赖数")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        rag_path = os.path.join(workdir, "rag_db")
+        seed_knowledge_base(rag_path, args.rag_docs, 1024)
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+            RAG_DB_PATH=rag_path,
+            EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache.db"),
+            DEEPSEEK_API_KEY=os.environ.get("DEEPSEEK_API_KEY") or "startup-bench",
+            ALIYUN_API_KEY=os.environ.get("ALIYUN_API_KEY") or "startup-bench",
+        )
+        # 先导入一次，生成 .pyc，排除首次编译的耗时
+        import_seconds(args.app_dir, env)
+
+        imports = [import_seconds(args.app_dir, env) for _ in range(args.runs)]
+        print({"import_main_s": round(statistics.median(imports), 3), "runs": args.runs})
+        print({"slowest_direct_imports_ms": import_profile(args.app_dir, env, args.top)})
+
+        for background in ("true", "false"):
+            mode_env = dict(env, STARTUP_BACKGROUND_INIT=background)
+            results = [time_to_ready(args.app_dir, mode_env, args.timeout) for _ in range(args.runs)]
+            print({
+                "background_init": background,
+                "time_to_ready_s": median_of(results, "time_to_ready_s"),
+                "time_to_rag_ready_s": median_of(results, "time_to_rag_ready_s"),
+            })
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,8 @@ const elements = {
     chatInput: document.getElementById('chatInput'),
     sendBtn: document.getElementById('sendBtn'),
     newChatBtn: document.getElementById('newChatBtn'),
-    chatTitle: document.getElementById('chatTitle')
+    chatTitle: document.getElementById('chatTitle'),
+    searchInput: document.getElementById('searchInput')
 };
 
 // 初始化应用
@@ -34,6 +35,8 @@ document.addEventListener('DOMContentLoaded', async () => {
 const userInfo = document.getElementById('userInfo');
 const dropdownContent = document.getElementById('dropdownContent');
 let currentRequestController = null;
+// 打开仍在生成回答的对话时，接收后续内容的请求
+let resumeController = null;
 
 userInfo.addEventListener('click', function(event) {
     event.stopPropagation();
@@ -64,17 +67,25 @@ window.addEventListener('beforeunload', () => {
 });
 
 // 加载历史记录
-async function loadHistory(scenario) {
-    elements.historyContainer.innerHTML = '<div class="loader">加载历史记录中...</div>';
+async function loadHistory(scenario, silent = false, cursor = null) {
+    if (!silent && !cursor) {
+        elements.historyContainer.innerHTML = '<div class="loader">加载历史记录中...</div>';
+    }
     
     try {
-        const response = await fetch(`/api/history?scenario=${encodeURIComponent(scenario)}`, {
+        let url = `/api/history?scenario=${encodeURIComponent(scenario)}`;
+        if (cursor) {
+            url += `&cursor=${encodeURIComponent(cursor)}`;
+        }
+        const response = await fetch(url, {
             method: 'GET',
             credentials: 'include'
         });
         if (response.ok) {
             const historyData = await response.json();
-            renderHistory(historyData);
+            renderHistory(historyData, Boolean(cursor));
+            renderLoadMoreHistory(scenario, historyData.next_cursor);
+            return historyData;
         } else {
             console.error('加载历史记录失败');
             elements.historyContainer.innerHTML = '<div class="empty-state">无法加载历史记录</div>';
@@ -85,12 +96,101 @@ async function loadHistory(scenario) {
     }
 }
 
-// 渲染历史记录
-function renderHistory(historyData) {
+// 搜索当前场景下的历史消息，结果替换侧边栏的历史列表；cursor 为下一页游标
+async function searchHistory(query, cursor = null) {
+    const scenario = appState.currentScenario;
+    let url = `/api/search?q=${encodeURIComponent(query)}&scenario=${encodeURIComponent(scenario)}`;
+    if (cursor) {
+        url += `&cursor=${encodeURIComponent(cursor)}`;
+    }
+    try {
+        const response = await fetch(url, {
+            method: 'GET',
+            credentials: 'include'
+        });
+        // 结果返回前输入已经改变，丢弃过期的结果
+        if (elements.searchInput.value.trim() !== query || appState.currentScenario !== scenario) return;
+        if (!response.ok) {
+            elements.historyContainer.innerHTML = '<div class="empty-state">搜索失败</div>';
+            return;
+        }
+        const data = await response.json();
+        renderSearchResults(query, data, Boolean(cursor));
+    } catch (error) {
+        console.error('搜索历史消息时出错:', error);
+    }
+}
+
+function renderSearchResults(query, data, append = false) {
+    elements.historyContainer.querySelector('.load-more-history')?.remove();
+    if (!append) {
+        elements.historyContainer.innerHTML = '';
+        if (data.results.length === 0) {
+            elements.historyContainer.innerHTML = '<div class="empty-state"><p>没有找到相关消息</p></div>';
+            return;
+        }
+    }
+
+    data.results.forEach(result => {
+        const item = document.createElement('div');
+        item.className = 'conversation-item search-result';
+        if (appState.currentConversation === result.conversation_id) {
+            item.classList.add('active');
+        }
+
+        const title = document.createElement('div');
+        title.className = 'conversation-title';
+        title.textContent = result.title;
+        // 摘要已由服务端转义，命中部分带 <mark>
+        const snippet = document.createElement('div');
+        snippet.className = 'search-snippet';
+        snippet.innerHTML = DOMPurify.sanitize(result.snippet, { ALLOWED_TAGS: ['mark'] });
+        item.append(title, snippet);
+
+        item.addEventListener('click', () => {
+            document.querySelectorAll('.conversation-item').forEach(el => el.classList.remove('active'));
+            item.classList.add('active');
+            loadConversation(result.conversation_id);
+        });
+        elements.historyContainer.appendChild(item);
+    });
+
+    if (data.next_cursor) {
+        const button = document.createElement('button');
+        button.className = 'load-more-history';
+        button.textContent = '加载更多';
+        button.addEventListener('click', () => {
+            button.disabled = true;
+            searchHistory(query, data.next_cursor);
+        });
+        elements.historyContainer.appendChild(button);
+    }
+}
+
+// 历史记录分页：列表末尾的“加载更多”按钮
+function renderLoadMoreHistory(scenario, nextCursor) {
+    elements.historyContainer.querySelector('.load-more-history')?.remove();
+    if (!nextCursor) return;
+
+    const button = document.createElement('button');
+    button.className = 'load-more-history';
+    button.textContent = '加载更多';
+    button.addEventListener('click', () => {
+        button.disabled = true;
+        loadHistory(scenario, true, nextCursor);
+    });
+    elements.historyContainer.appendChild(button);
+}
+
+// 渲染历史记录；append 为真时追加下一页，同一时间分组接着上一页的分组显示
+function renderHistory(historyData, append = false) {
 
-    elements.historyContainer.innerHTML = '';
+    if (!append) {
+        elements.historyContainer.innerHTML = '';
+    }
     
     if (!historyData || !historyData.groups || historyData.groups.length === 0) {
+        if (append) return;
         elements.historyContainer.innerHTML = `
             <div class="empty-state">
                 <p>暂无历史对话记录</p>
@@ -100,12 +200,18 @@ function renderHistory(historyData) {
     }
     
     historyData.groups.forEach(group => {
-        const groupElement = document.createElement('div');
-        groupElement.className = 'history-section';
-        
-        groupElement.innerHTML = `
-            <div class="section-title">${group.time_group}</div>
-        `;
+        const sections = elements.historyContainer.querySelectorAll('.history-section');
+        const lastSection = sections[sections.length - 1];
+        const continued = append && lastSection && lastSection.dataset.group === group.time_group;
+        const groupElement = continued ? lastSection : document.createElement('div');
+        if (!continued) {
+            groupElement.className = 'history-section';
+            groupElement.dataset.group = group.time_group;
+            
+            groupElement.innerHTML = `
+                <div class="section-title">${group.time_group}</div>
+            `;
+        }
         
         group.conversations.forEach(conversation => {
             const item = document.createElement('div');
@@ -228,7 +334,9 @@ function renderHistory(historyData) {
             groupElement.appendChild(item);
         });
         
-        elements.historyContainer.appendChild(groupElement);
+        if (!continued) {
+            elements.historyContainer.appendChild(groupElement);
+        }
     });
 
     document.addEventListener('click', (e) => {
@@ -244,6 +352,10 @@ function renderHistory(historyData) {
 // 加载对话内容
 async function loadConversation(conversationId) {
     appState.currentConversation = conversationId;
+    if (resumeController) {
+        resumeController.abort();
+        resumeController = null;
+    }
     
     try {
         const response = await fetch(`/api/conversation/${conversationId}`, {
@@ -254,8 +366,12 @@ async function loadConversation(conversationId) {
         if (response.ok) {
             const conversationData = await response.json();
             renderConversation(conversationData);
+            renderLoadEarlierMessages(conversationId, conversationData.next_cursor);
             
             elements.chatTitle.textContent = conversationData.title || "对话详情";
+            if (conversationData.generating) {
+                attachGeneration(conversationId, conversationData.messages);
+            }
         } else {
             console.error('加载对话内容失败');
         }
@@ -264,6 +380,40 @@ async function loadConversation(conversationId) {
     }
 }
 
+// 对话分页：顶部的“加载更早的消息”按钮，新消息插在已有消息之前
+function renderLoadEarlierMessages(conversationId, nextCursor) {
+    elements.chatMessages.querySelector('.load-earlier-messages')?.remove();
+    if (!nextCursor) return;
+
+    const button = document.createElement('button');
+    button.className = 'load-earlier-messages';
+    button.textContent = '加载更早的消息';
+    button.addEventListener('click', async () => {
+        button.disabled = true;
+        try {
+            const response = await fetch(`/api/conversation/${conversationId}?before=${encodeURIComponent(nextCursor)}`, {
+                method: 'GET',
+                credentials: 'include'
+            });
+            if (!response.ok || appState.currentConversation !== conversationId) return;
+
+            const conversationData = await response.json();
+            button.remove();
+            const existing = Array.from(elements.chatMessages.childNodes);
+            elements.chatMessages.innerHTML = '';
+            conversationData.messages.forEach(message => {
+                addMessageToChat(message);
+            });
+            existing.forEach(node => elements.chatMessages.appendChild(node));
+            renderLoadEarlierMessages(conversationId, conversationData.next_cursor);
+        } catch (error) {
+            console.error('加载更早的消息时出错:', error);
+            button.disabled = false;
+        }
+    });
+    elements.chatMessages.prepend(button);
+}
+
 // 渲染对话内容
 function renderConversation(conversation) {
 
@@ -341,6 +491,20 @@ function scrollToBottom() {
 
 // 设置事件监听器
 function setupEventListeners() {
+    // 搜索历史消息：停止输入 300ms 后查询，清空时恢复历史列表
+    let searchTimer = null;
+    elements.searchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            const query = elements.searchInput.value.trim();
+            if (query) {
+                searchHistory(query);
+            } else {
+                loadHistory(appState.currentScenario);
+            }
+        }, 300);
+    });
+
     // 场景切换
     document.querySelectorAll('.function-item').forEach(item => {
         item.addEventListener('click', () => {
@@ -362,6 +526,7 @@ function setupEventListeners() {
             appState.currentScenario = item.dataset.scenario;
             
             // 加载新场景的历史记录
+            elements.searchInput.value = '';
             loadHistory(appState.currentScenario);
             
             // 重置当前对话
@@ -531,73 +696,92 @@ async function sendMessage() {
             signal: currentRequestController.signal
         });
         
+        if (response.status === 429 || response.status === 409) {
+            // 服务繁忙被拒绝或本对话仍在生成，本轮消息未保存
+            const result = await response.json().catch(() => ({}));
+            cursor.textContent = result.retry_after
+                ? `${result.error || '服务繁忙，请稍后再试'}（约 ${result.retry_after} 秒后可重试）`
+                : (result.error || '服务繁忙，请稍后再试');
+            return;
+        }
+
         if (!response.ok) {
             throw new Error('请求失败');
         }
         
-        // 读取流式响应
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder('utf-8');
-        let aiResponse = "";
+        // 回答在服务端后台生成，连接中断后凭对话 ID 续传
+        const streamConversationId = response.headers.get('X-Conversation-Id');
+        const stream = { text: '', lastEventId: null, finished: false, failed: false };
         let newConversationId = null;
         let conversationTitle = null;
-        
-        while (true) {
-            const { value, done } = await reader.read();
-            if (done) break;
-            
-            // 解码并处理事件流
-            const chunk = decoder.decode(value, { stream: true });
-            const events = chunk.split('\n\n').filter(event => event.trim() !== '');
-            
-            for (const event of events) {
-                if (event.startsWith('data: ')) {
-                    const dataStr = event.replace('data: ', '').trim();
-                    
-                    // 结束标记
-                    if (dataStr === '[DONE]') {
-                        break;
-                    }
-                    
-                    try {
-                        const data = JSON.parse(dataStr);
-                        if (data.token) {
-                            // 添加token到响应
-                            aiResponse += data.token;
-                            
-                            // 渲染Markdown
-                            contentElement.innerHTML = DOMPurify.sanitize(marked.parse(aiResponse));
-                            
-                            scrollToBottom();
-                        }
-                        
-                        if (data.full_response) {
-                            aiResponse = data.full_response; // 更新为完整的响应
-                            // 将完整的响应存储在message容器上
-                            const currentMessageContainer = contentElement.closest('.message-container');
-                            if (currentMessageContainer) {
-                                currentMessageContainer.dataset.raw = aiResponse;
-                                // 检查是否是测试用例场景并且包含表格
-                                if (appState.currentScenario === '用例生成' && hasMarkdownTable(aiResponse)) {
-                                    addExportButton(currentMessageContainer);
-                                }
-                            }
-                        }
+        let titlePending = false;
 
-                        if (data.new_conversation_id) {
-                            newConversationId = data.new_conversation_id;
-                        }
-                        
-                        if (data.conversation_title) {
-                            conversationTitle = data.conversation_title;
-                        }      
-                        
-                    } catch (e) {
-                        console.error('解析JSON失败:', e);
+        const onEvent = data => {
+            if (data.queue_position !== undefined) {
+                cursor.textContent = data.queue_position > 0
+                    ? `排队中，前面还有 ${data.queue_position} 个请求...`
+                    : '排队中，即将开始...';
+            }
+
+            if (data.error) {
+                stream.failed = true;
+                cursor.textContent = data.retry_after
+                    ? `${data.error}（约 ${data.retry_after} 秒后可重试）`
+                    : data.error;
+            }
+
+            if (data.token) {
+                // 添加token到响应
+                stream.text += data.token;
+                
+                // 渲染Markdown
+                contentElement.innerHTML = DOMPurify.sanitize(marked.parse(stream.text));
+                
+                scrollToBottom();
+            }
+            
+            if (data.full_response) {
+                stream.text = data.full_response; // 更新为完整的响应
+                // 将完整的响应存储在message容器上
+                const currentMessageContainer = contentElement.closest('.message-container');
+                if (currentMessageContainer) {
+                    currentMessageContainer.dataset.raw = stream.text;
+                    // 检查是否是测试用例场景并且包含表格
+                    if (appState.currentScenario === '用例生成' && hasMarkdownTable(stream.text)) {
+                        addExportButton(currentMessageContainer);
                     }
                 }
             }
+
+            if (data.new_conversation_id) {
+                newConversationId = data.new_conversation_id;
+            }
+            
+            if (data.conversation_title) {
+                conversationTitle = data.conversation_title;
+            }
+
+            if (data.title_pending) {
+                titlePending = true;
+            }
+        };
+
+        try {
+            await readEventStream(response, stream, onEvent);
+        } catch (error) {
+            if (error.name === 'AbortError') throw error;
+            console.warn('回答流中断，尝试续传:', error);
         }
+        if (!stream.finished && !stream.failed && streamConversationId) {
+            const resumed = await resumeGeneration(streamConversationId, stream, onEvent, currentRequestController.signal);
+            if (!resumed && !stream.finished) {
+                // 续传不可用（已过保留期或落在其他 worker 上），改为加载已保存的内容
+                await loadConversation(streamConversationId);
+                await loadHistory(appState.currentScenario);
+                return;
+            }
+        }
+        const aiResponse = stream.text;
 
 
                 // 确保添加导出按钮（如果未在流中处理）
@@ -612,6 +796,9 @@ async function sendMessage() {
             
             // 刷新历史记录
             await loadHistory(appState.currentScenario);
+            if (titlePending) {
+                pollConversationTitle(newConversationId, appState.currentScenario);
+            }
         }
         
     } catch (error) {
@@ -636,6 +823,145 @@ async function sendMessage() {
     }
 }
 
+// 读取 SSE 响应：记录事件 ID（续传时作为 Last-Event-ID），逐个事件回调，收到 [DONE] 时标记完成
+async function readEventStream(response, stream, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = "";
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) return;
+
+        // 一帧可能跨多次 read，最后一段不完整的帧留到下次拼接
+        buffer += decoder.decode(value, { stream: true });
+        const parts = buffer.split('\n\n');
+        buffer = parts.pop();
+
+        for (const event of parts) {
+            let dataStr = null;
+            for (const line of event.split('\n')) {
+                if (line.startsWith('id: ')) {
+                    stream.lastEventId = line.slice(4).trim();
+                } else if (line.startsWith('data: ')) {
+                    dataStr = line.slice(6).trim();
+                }
+            }
+            if (dataStr === null) continue;
+
+            // 结束标记
+            if (dataStr === '[DONE]') {
+                stream.finished = true;
+                return;
+            }
+
+            let data;
+            try {
+                data = JSON.parse(dataStr);
+            } catch (e) {
+                console.error('解析JSON失败:', e);
+                continue;
+            }
+            onEvent(data);
+        }
+    }
+}
+
+// 断线续传：生成在服务端继续进行，按 Last-Event-ID 与已收到的字符数接着接收，返回续传接口是否可用
+async function resumeGeneration(conversationId, stream, onEvent, signal, attempts = 5) {
+    for (let attempt = 0; attempt < attempts && !stream.finished && !stream.failed; attempt++) {
+        if (attempt > 0) {
+            await new Promise(resolve => setTimeout(resolve, Math.min(1000 * 2 ** (attempt - 1), 8000)));
+        }
+        const headers = {};
+        if (stream.lastEventId) {
+            headers['Last-Event-ID'] = stream.lastEventId;
+        }
+        // 服务端按 Unicode 字符计数，不能直接用 UTF-16 的 length
+        const offset = Array.from(stream.text).length;
+        try {
+            const response = await fetch(`/api/chat/${conversationId}/stream?offset=${offset}`, {
+                method: 'GET',
+                headers: headers,
+                credentials: 'include',
+                signal: signal
+            });
+            if (response.status === 404) return false;
+            if (!response.ok) continue;
+            await readEventStream(response, stream, onEvent);
+        } catch (error) {
+            if (error.name === 'AbortError') throw error;
+            console.warn('续传中断:', error);
+        }
+    }
+    return true;
+}
+
+// 打开仍在生成回答的对话：接在已保存的部分回答后面继续接收
+async function attachGeneration(conversationId, messages) {
+    const last = messages[messages.length - 1];
+    const stream = {
+        text: last && last.role === 'assistant' ? last.content : '',
+        lastEventId: null,
+        finished: false,
+        failed: false
+    };
+    if (!stream.text) {
+        addMessageToChat({ role: 'assistant', content: '' });
+    }
+    const contentElement = elements.chatMessages.lastElementChild.querySelector('.message-content');
+
+    resumeController = new AbortController();
+    try {
+        await resumeGeneration(conversationId, stream, data => {
+            if (data.queue_position !== undefined && !stream.text) {
+                contentElement.textContent = data.queue_position > 0
+                    ? `排队中，前面还有 ${data.queue_position} 个请求...`
+                    : '排队中，即将开始...';
+            }
+            if (data.error) {
+                stream.failed = true;
+                contentElement.insertAdjacentText('beforeend', `（${data.error}）`);
+            }
+            if (data.token) {
+                stream.text += data.token;
+                contentElement.innerHTML = DOMPurify.sanitize(marked.parse(stream.text));
+                scrollToBottom();
+            }
+            if (data.full_response) {
+                const container = contentElement.closest('.message-container');
+                container.dataset.raw = data.full_response;
+                if (appState.currentScenario === '用例生成' && hasMarkdownTable(data.full_response)) {
+                    addExportButton(container);
+                }
+            }
+        }, resumeController.signal);
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('接收生成中的回答时出错:', error);
+        }
+    }
+}
+
+// 标题在后台生成，轮询历史记录直到标题就绪
+async function pollConversationTitle(conversationId, scenario, attempts = 6, interval = 1500) {
+    for (let i = 0; i < attempts; i++) {
+        await new Promise(resolve => setTimeout(resolve, interval));
+        if (appState.currentScenario !== scenario) return;
+
+        const historyData = await loadHistory(scenario, true);
+        const conversation = (historyData?.groups || [])
+            .flatMap(group => group.conversations)
+            .find(item => item.id === conversationId);
+        if (!conversation || !conversation.title_pending) {
+            if (conversation && appState.currentConversation === conversationId) {
+                elements.chatTitle.textContent = conversation.title;
+            }
+            return;
+        }
+    }
+}
+
 function createTypingIndicator() {
     const container = document.createElement('div');
     container.className = 'message-container';
@@ -0,0 +1,317 @@
+import asyncio
+import contextvars
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from utils import metrics
+
+load_dotenv()
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_PER_USER = int(os.getenv("LLM_MAX_PER_USER", "2"))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "200"))
+LLM_QUEUE_MAX_PER_USER = int(os.getenv("LLM_QUEUE_MAX_PER_USER", "4"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "16"))
+EMBEDDING_MAX_PER_USER = int(os.getenv("EMBEDDING_MAX_PER_USER", "2"))
+EMBEDDING_QUEUE_MAX = int(os.getenv("EMBEDDING_QUEUE_MAX", "200"))
+EMBEDDING_QUEUE_TIMEOUT = float(os.getenv("EMBEDDING_QUEUE_TIMEOUT", "10"))
+
+# 优先级：数值越小越先调度；同一优先级内按用户轮转
+INTERACTIVE, BULK, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "bulk", "background")
+# 长表格输出的批量生成让位于问答类场景，后台任务（标题、摘要）最后
+SCENARIO_PRIORITY = {
+    "用例生成": BULK,
+    "标题生成": BACKGROUND,
+    "历史摘要": BACKGROUND,
+}
+
+# 标题、摘要等后台任务共用一个“用户”，合计并发不超过单用户上限
+BACKGROUND_USER = "__background__"
+
+# 当前请求所属用户，嵌入调用等拿不到请求对象的地方按它做公平调度
+current_user: contextvars.ContextVar[str] = contextvars.ContextVar("admission_user", default="anonymous")
+
+ADMISSION_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    "admission_wait_seconds", "准入排队等待时间", ("pool", "priority"))
+ADMISSION_REJECTED = metrics.REGISTRY.counter(
+    "admission_rejected_total", "被拒绝的请求数（queue_full/user_queue_full/timeout）", ("pool", "reason"))
+
+_controllers: List["AdmissionController"] = []
+
+
+def scenario_priority(scenario: Optional[str]) -> int:
+    return SCENARIO_PRIORITY.get(scenario or "", INTERACTIVE)
+
+
+class AdmissionRejected(Exception):
+    """排队已满或等待超时，retry_after 为建议的重试间隔（秒）"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """一次准入申请：创建时即排队（或直接获得名额），release 归还名额或退出队列"""
+
+    def __init__(self, controller: "AdmissionController", user: str, priority: int):
+        self.controller = controller
+        self.user = user
+        self.priority = priority
+        self.enqueued_at = time.perf_counter()
+        self.granted_at: Optional[float] = None
+        self.released = False
+        self._granted = asyncio.get_running_loop().create_future()
+
+    @property
+    def granted(self) -> bool:
+        return self.granted_at is not None
+
+    def position(self) -> int:
+        """前面还有多少个请求会先于本请求获得名额，已获得名额时为 0"""
+        return 0 if self.granted else self.controller.position(self)
+
+    async def wait(self):
+        """等待获得名额；从排队开始超过 queue_timeout 仍未获得时退出队列并抛出 AdmissionRejected"""
+        try:
+            while not self.granted:
+                remaining = self.enqueued_at + self.controller.queue_timeout - time.perf_counter()
+                if remaining <= 0:
+                    self._timeout()
+                await asyncio.wait([self._granted], timeout=remaining)
+        except BaseException:
+            self.release()
+            raise
+
+    async def positions(self, interval: float = 1.0) -> AsyncIterator[int]:
+        """
+        等待获得名额，期间排队位置变化时产出新位置（首次必定产出），获得名额后结束；超时同 wait
+        :param interval: 检查位置的间隔（秒）
+        """
+        last = None
+        try:
+            while not self.granted:
+                position = self.position()
+                if position != last:
+                    last = position
+                    yield position
+                remaining = self.enqueued_at + self.controller.queue_timeout - time.perf_counter()
+                if remaining <= 0:
+                    self._timeout()
+                await asyncio.wait([self._granted], timeout=min(interval, remaining))
+        except BaseException:
+            self.release()
+            raise
+
+    def _timeout(self):
+        ADMISSION_REJECTED.inc(1, self.controller.name, "timeout")
+        raise AdmissionRejected("排队等待超时，请稍后再试", self.controller.retry_after())
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.controller._release(self)
+
+    def _grant(self):
+        self.granted_at = time.perf_counter()
+        ADMISSION_WAIT_SECONDS.observe(
+            self.granted_at - self.enqueued_at, self.controller.name, PRIORITY_NAMES[self.priority])
+        if not self._granted.done():
+            self._granted.set_result(None)
+
+
+class AdmissionController:
+    """
+    上游调用的准入控制：全局并发上限 + 单用户并发上限 + 有界公平队列
+
+    超出并发上限的请求进入队列，按优先级（问答 > 批量生成 > 后台任务）调度，
+    同一优先级内各用户轮流获得名额，单个用户大量提交不会挤占其他用户。
+    队列已满（或该用户排队数已满）时直接拒绝，由调用方返回 429；排队超过 queue_timeout 同样拒绝。
+    只在事件循环内使用，不加锁。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_per_user: int,
+        max_queue: int,
+        max_queue_per_user: int,
+        queue_timeout: float
+    ):
+        """
+        :param name: 指标中的 pool 标签
+        :param max_concurrency: 同时进行的调用数上限
+        :param max_per_user: 单个用户同时进行的调用数上限
+        :param max_queue: 排队请求总数上限
+        :param max_queue_per_user: 单个用户排队请求数上限
+        :param queue_timeout: 最长排队时间（秒）
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self._active_by_user: Dict[str, int] = {}
+        # 每个优先级一个 {用户: 排队的请求}，OrderedDict 的顺序即轮转顺序
+        self._queues: List["OrderedDict[str, Deque[Ticket]]"] = [OrderedDict() for _ in PRIORITY_NAMES]
+        self._queued = 0
+        self._queued_by_user: Dict[str, int] = {}
+        # 名额平均占用时间（指数滑动平均），用于估算 Retry-After
+        self._hold_seconds = 1.0
+        _controllers.append(self)
+
+    def enqueue(self, user: Optional[str] = None, priority: Optional[int] = None) -> Ticket:
+        """
+        申请名额，有空闲时立即获得，否则排队；队列已满时抛出 AdmissionRejected
+        :param user: 用户标识，默认取 current_user
+        :param priority: 优先级，默认按当前请求的场景
+        """
+        user = user or current_user.get()
+        priority = scenario_priority(metrics.current_scenario.get()) if priority is None else priority
+        if self._queued >= self.max_queue:
+            ADMISSION_REJECTED.inc(1, self.name, "queue_full")
+            raise AdmissionRejected("服务繁忙，请稍后再试", self.retry_after())
+        if self._queued_by_user.get(user, 0) >= self.max_queue_per_user:
+            ADMISSION_REJECTED.inc(1, self.name, "user_queue_full")
+            raise AdmissionRejected("您的请求过多，请等待之前的回答完成", self.retry_after())
+        ticket = Ticket(self, user, priority)
+        self._enqueue(ticket)
+        return ticket
+
+    @asynccontextmanager
+    async def slot(self, user: Optional[str] = None, priority: Optional[int] = None):
+        """排队直到获得名额，退出时归还"""
+        ticket = self.enqueue(user, priority)
+        try:
+            await ticket.wait()
+            yield ticket
+        finally:
+            ticket.release()
+
+    def retry_after(self) -> int:
+        """按排队长度与名额平均占用时间估算多久后可能有空位"""
+        return max(1, math.ceil(self._hold_seconds * (self._queued + 1) / max(1, self.max_concurrency)))
+
+    def position(self, ticket: Ticket) -> int:
+        ahead = sum(len(waiting) for queue in self._queues[:ticket.priority] for waiting in queue.values())
+        queue = self._queues[ticket.priority]
+        waiting = queue.get(ticket.user)
+        if not waiting or ticket not in waiting:
+            return ahead
+        index = waiting.index(ticket)
+        # 轮转调度：排在本用户第 index 个，意味着其他每个用户最多先调度 index(+1) 个
+        for user, others in queue.items():
+            if user == ticket.user:
+                break
+            ahead += min(len(others), index + 1)
+        for user, others in reversed(queue.items()):
+            if user == ticket.user:
+                break
+            ahead += min(len(others), index)
+        return ahead + index
+
+    def _enqueue(self, ticket: Ticket):
+        self._queues[ticket.priority].setdefault(ticket.user, deque()).append(ticket)
+        self._queued += 1
+        self._queued_by_user[ticket.user] = self._queued_by_user.get(ticket.user, 0) + 1
+        self._dispatch()
+
+    def _remove(self, ticket: Ticket) -> bool:
+        queue = self._queues[ticket.priority]
+        waiting = queue.get(ticket.user)
+        if not waiting or ticket not in waiting:
+            return False
+        waiting.remove(ticket)
+        if not waiting:
+            del queue[ticket.user]
+        self._queued -= 1
+        self._decrement(self._queued_by_user, ticket.user)
+        return True
+
+    def _release(self, ticket: Ticket):
+        if ticket.granted:
+            self.active -= 1
+            self._decrement(self._active_by_user, ticket.user)
+            held = time.perf_counter() - ticket.granted_at
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held
+        else:
+            self._remove(ticket)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency:
+            ticket = self._next()
+            if ticket is None:
+                return
+            self.active += 1
+            self._active_by_user[ticket.user] = self._active_by_user.get(ticket.user, 0) + 1
+            ticket._grant()
+
+    def _next(self) -> Optional[Ticket]:
+        """按优先级取下一个可以调度的请求，同一优先级内轮转到下一个未达单用户上限的用户"""
+        for queue in self._queues:
+            for user in list(queue):
+                if self._active_by_user.get(user, 0) >= self.max_per_user:
+                    continue
+                waiting = queue[user]
+                ticket = waiting.popleft()
+                if waiting:
+                    queue.move_to_end(user)
+                else:
+                    del queue[user]
+                self._queued -= 1
+                self._decrement(self._queued_by_user, user)
+                return ticket
+        return None
+
+    @staticmethod
+    def _decrement(counts: Dict[str, int], user: str):
+        remaining = counts.get(user, 0) - 1
+        if remaining > 0:
+            counts[user] = remaining
+        else:
+            counts.pop(user, None)
+
+    def stats(self) -> Dict[str, int]:
+        stats = {"active": self.active, "queued": self._queued, "users_queued": len(self._queued_by_user)}
+        for name, queue in zip(PRIORITY_NAMES, self._queues):
+            stats[f"queued_{name}"] = sum(len(waiting) for waiting in queue.values())
+        return stats
+
+
+metrics.REGISTRY.gauge(
+    "admission_queue_depth", "排队中的请求数",
+    lambda: {
+        (controller.name, name): sum(len(waiting) for waiting in queue.values())
+        for controller in _controllers for name, queue in zip(PRIORITY_NAMES, controller._queues)
+    },
+    ("pool", "priority")
+)
+metrics.REGISTRY.gauge(
+    "admission_active", "已获得名额、正在进行的上游调用数",
+    lambda: {(controller.name,): controller.active for controller in _controllers},
+    ("pool",)
+)
+
+
+def create_llm_admission() -> AdmissionController:
+    return AdmissionController(
+        "llm", LLM_MAX_CONCURRENCY, LLM_MAX_PER_USER, LLM_QUEUE_MAX, LLM_QUEUE_MAX_PER_USER, LLM_QUEUE_TIMEOUT)
+
+
+def create_embedding_admission() -> AdmissionController:
+    return AdmissionController(
+        "embedding", EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_PER_USER, EMBEDDING_QUEUE_MAX,
+        EMBEDDING_MAX_PER_USER * 4, EMBEDDING_QUEUE_TIMEOUT)
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+
+@dataclass
+class CachedAnswer:
+    vector: List[float]  # 已归一化的问题向量
+    answer: str
+    created_at: float
+
+
+def context_hash(context: str) -> str:
+    """检索到的上下文的哈希，参与缓存键"""
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else list(vector)
+
+
+class SemanticAnswerCache:
+    """
+    RAG 场景的语义回答缓存
+
+    缓存键为 (集合, 集合 generation, 上下文哈希)，同一键下保存若干问题向量及其回答，
+    查询时要求余弦相似度不低于阈值。对话历史不参与缓存键，是否只对无历史的提问复用由调用方决定。集合重新入库后 generation 变化，旧回答自然失效，
+    注册表热加载时也会主动清理对应集合。
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600.0, max_keys: int = 2000, max_per_key: int = 8):
+        """
+        :param threshold: 命中所需的最小余弦相似度
+        :param ttl: 回答有效期（秒）
+        :param max_keys: 最多保存的缓存键数量（LRU 淘汰）
+        :param max_per_key: 同一上下文下最多保存的问题数
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.max_per_key = max_per_key
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, int, str], List[CachedAnswer]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    def lookup(self, collection: str, generation: int, ctx_hash: str, query_vector: List[float]) -> Optional[str]:
+        key = (collection, generation, ctx_hash)
+        query = _normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            candidates = self._entries.get(key)
+            if candidates:
+                candidates[:] = [c for c in candidates if now - c.created_at < self.ttl]
+                best, best_score = None, self.threshold
+                for candidate in candidates:
+                    score = sum(a * b for a, b in zip(query, candidate.vector))
+                    if score >= best_score:
+                        best, best_score = candidate, score
+                if best is not None:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return best.answer
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, collection: str, generation: int, ctx_hash: str, query_vector: List[float], answer: str):
+        key = (collection, generation, ctx_hash)
+        with self._lock:
+            candidates = self._entries.setdefault(key, [])
+            candidates.append(CachedAnswer(vector=_normalize(query_vector), answer=answer, created_at=time.time()))
+            del candidates[:-self.max_per_key]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+            self._stats["stores"] += 1
+
+    def invalidate(self, collection: Optional[str] = None):
+        """清理指定集合（为空时清理全部）的缓存回答"""
+        with self._lock:
+            if collection is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == collection]:
+                    del self._entries[key]
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["keys"] = len(self._entries)
+        return stats
+
+
+async def replay_answer(answer: str, chunk_size: int = 16) -> AsyncIterator[str]:
+    """把缓存的回答按小段重新产出，复用与模型流式输出相同的 token 协议"""
+    for start in range(0, len(answer), chunk_size):
+        yield answer[start:start + chunk_size]
+        await asyncio.sleep(0)
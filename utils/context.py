@@ -0,0 +1,188 @@
+import os
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Set, Tuple
+
+import orjson
+from dotenv import load_dotenv
+
+from utils import metrics
+from utils.embedding_cache import normalize_text
+from utils.history import count_tokens, truncate_to_tokens
+
+# Document 只用于类型注解，不在运行时导入 langchain_core，避免拖慢 import main
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+load_dotenv()
+# 各场景检索上下文的 token 预算，未列出的场景使用 CONTEXT_MAX_TOKENS；
+# 可通过 CONTEXT_SCENARIO_TOKENS（JSON，如 {"产品手册": 4000}）覆盖
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+SCENARIO_CONTEXT_TOKENS: Dict[str, int] = {
+    "运维助手": 3000,
+    "产品手册": 3000,
+}
+SCENARIO_CONTEXT_TOKENS.update(orjson.loads(os.getenv("CONTEXT_SCENARIO_TOKENS", "{}")))
+# 片段的字符 n-gram 有这么大比例出现在已选片段中时视为近似重复
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+# 切分时会去掉片段首尾的空白，相邻片段之间最多相差这么多个字符仍视为相邻
+CONTEXT_MERGE_GAP = int(os.getenv("CONTEXT_MERGE_GAP", "2"))
+
+SHINGLE_SIZE = 5
+SEPARATOR = "\n\n"
+
+CONTEXT_TOKENS = metrics.REGISTRY.counter(
+    "rag_context_tokens_total", "检索上下文 token 数：raw 为片段直接拼接，packed 为组装后实际放入提示词", ("scenario", "kind"))
+
+
+@dataclass
+class ContextBlock:
+    """合并后的一段连续原文"""
+    text: str
+    rank: int  # 所含片段中最靠前的检索名次
+    start: Optional[int] = None
+    end: Optional[int] = None
+    chunks: int = 1
+    shingles: Set[str] = field(default_factory=set, repr=False)
+
+
+def context_budget(scenario: Optional[str]) -> int:
+    return SCENARIO_CONTEXT_TOKENS.get(scenario or "", CONTEXT_MAX_TOKENS)
+
+
+def _position(doc: "Document") -> Tuple[Optional[tuple], Optional[int]]:
+    metadata = doc.metadata or {}
+    start = metadata.get("start_index")
+    if not isinstance(start, int) or start < 0:
+        return None, None
+    return (metadata.get("source"), metadata.get("page")), start
+
+
+def merge_chunks(docs: Sequence["Document"], max_gap: int = CONTEXT_MERGE_GAP) -> List[ContextBlock]:
+    """
+    按 start_index 合并同一文档同一页中重叠或相邻的片段
+
+    切分时相邻片段有 chunk_overlap 个字符的重叠，合并后重叠部分只保留一份。
+    没有位置信息的片段原样保留；重叠部分的文本对不上时（位置信息不可靠）也不合并。
+    :param docs: 按相关度排序的检索结果
+    :param max_gap: 两个片段之间最多间隔的字符数
+    :return: 合并后的文本块，按所含片段的最好名次排序
+    """
+    blocks: List[ContextBlock] = []
+    by_page: Dict[tuple, List[ContextBlock]] = {}
+    for rank, doc in enumerate(docs):
+        text = doc.page_content or ""
+        key, start = _position(doc)
+        block = ContextBlock(text=text, rank=rank)
+        if key is None:
+            blocks.append(block)
+            continue
+        block.start, block.end = start, start + len(text)
+        by_page.setdefault(key, []).append(block)
+
+    for page_blocks in by_page.values():
+        page_blocks.sort(key=lambda b: b.start)
+        current = page_blocks[0]
+        for block in page_blocks[1:]:
+            overlap = current.end - block.start
+            offset = len(current.text) - overlap
+            if block.end <= current.end and offset >= 0 and current.text[offset:offset + len(block.text)] == block.text:
+                # 完全包含在前一个片段中
+                current.rank = min(current.rank, block.rank)
+                current.chunks += 1
+                continue
+            if overlap > 0 and current.text[-overlap:] == block.text[:overlap]:
+                current.text += block.text[overlap:]
+            elif -max_gap <= overlap <= 0:
+                # 间隔的是切分时去掉的空白，补回同样长度的换行，保持偏移一致
+                current.text += "\n" * -overlap + block.text
+            else:
+                blocks.append(current)
+                current = block
+                continue
+            current.end = block.end
+            current.rank = min(current.rank, block.rank)
+            current.chunks += 1
+        blocks.append(current)
+
+    blocks.sort(key=lambda b: b.rank)
+    return blocks
+
+
+def _shingles(text: str) -> Set[str]:
+    text = normalize_text(text).lower()
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def drop_near_duplicates(blocks: Sequence[ContextBlock], threshold: float = CONTEXT_DUPLICATE_THRESHOLD) -> List[ContextBlock]:
+    """
+    去掉与更靠前的文本块近似重复的块（同一内容出现在多个文件或多页中）
+
+    按字符 n-gram 计算包含度：块的 n-gram 中有 threshold 比例已出现在某个保留块里即丢弃。
+    """
+    kept: List[ContextBlock] = []
+    for block in blocks:
+        block.shingles = _shingles(block.text)
+        if not block.shingles or block.shingles == {""}:
+            continue
+        duplicate = any(
+            len(block.shingles & other.shingles) >= threshold * len(block.shingles)
+            for other in kept
+        )
+        if not duplicate:
+            kept.append(block)
+    return kept
+
+
+def pack_blocks(blocks: Sequence[ContextBlock], max_tokens: int) -> Tuple[List[str], int]:
+    """
+    按名次依次装入 token 预算，放不下的块跳过，继续尝试后面较短的块
+
+    :return: (装入的文本, 使用的 token 数)；第一块单独就超出预算时截断后保留
+    """
+    texts = []
+    used = 0
+    separator_tokens = count_tokens(SEPARATOR)
+    for block in blocks:
+        tokens = count_tokens(block.text) + (separator_tokens if texts else 0)
+        if used + tokens <= max_tokens:
+            texts.append(block.text)
+            used += tokens
+        elif not texts:
+            text = truncate_to_tokens(block.text, max_tokens)
+            texts.append(text)
+            used = count_tokens(text)
+    return texts, used
+
+
+def assemble_context(docs: Sequence["Document"], scenario: Optional[str] = None, max_tokens: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
+    """
+    检索结果 -> 提示词中的上下文：合并重叠片段、去掉近似重复、按场景预算装入
+
+    :param docs: 按相关度排序的检索结果
+    :param scenario: 场景名称，决定 token 预算
+    :param max_tokens: 显式指定预算，优先于场景配置
+    :return: (上下文文本, 统计信息)
+    """
+    budget = max_tokens if max_tokens is not None else context_budget(scenario)
+    raw_tokens = count_tokens(SEPARATOR.join(doc.page_content for doc in docs))
+    merged = merge_chunks(docs)
+    unique = drop_near_duplicates(merged)
+    texts, _ = pack_blocks(unique, budget)
+    context = SEPARATOR.join(texts)
+    # 与 raw_tokens 口径一致，按拼接后的文本计数
+    tokens = count_tokens(context)
+    label = scenario or metrics.current_scenario.get()
+    CONTEXT_TOKENS.inc(raw_tokens, label, "raw")
+    CONTEXT_TOKENS.inc(tokens, label, "packed")
+    stats = {
+        "chunks": len(docs),
+        "merged_blocks": len(merged),
+        "duplicates": len(merged) - len(unique),
+        "packed_blocks": len(texts),
+        "raw_tokens": raw_tokens,
+        "tokens": tokens,
+        "budget": budget,
+    }
+    return context, stats
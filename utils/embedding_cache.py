@@ -0,0 +1,264 @@
+import hashlib
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "20000"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "128"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """统一全半角、去掉首尾空白并合并连续空白，保证同一问题命中同一缓存键"""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    按内容寻址的嵌入向量缓存
+
+    缓存键为 (模型, 维度, 规范化文本哈希)。第一层是进程内 LRU（按条数和字节数限制），
+    第二层是 SQLite 持久化表，向量以 float32 二进制存储，进程重启后依然有效。
+    内存层与磁盘层分别加锁，读写 SQLite 时不阻塞其他线程（包括事件循环）查询内存层；
+    put_many(wait=False) 的磁盘写入交给后台线程批量提交。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 20000,
+        max_bytes: int = 128 * 1024 * 1024
+    ):
+        """
+        :param path: SQLite 文件路径，为空时只使用内存层
+        :param max_entries: 内存层最大条数
+        :param max_bytes: 内存层最大字节数
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._pending: "queue.Queue[list]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._lru: "OrderedDict[str, array]" = OrderedDict()
+        self._lru_bytes = 0
+        self._stats = {"lru_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT, dimensions INTEGER, "
+                "vector BLOB, created_at REAL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, dimensions: int, text: str) -> str:
+        raw = f"{model}\x1f{dimensions}\x1f{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def persistent(self) -> bool:
+        """是否有 SQLite 磁盘层"""
+        return self._conn is not None
+
+    def get(self, model: str, dimensions: int, text: str, memory_only: bool = False) -> Optional[List[float]]:
+        return self.get_many(model, dimensions, [text], memory_only)[0]
+
+    def put(self, model: str, dimensions: int, text: str, vector: List[float], wait: bool = True):
+        self.put_many(model, dimensions, [text], [vector], wait)
+
+    def get_many(
+        self,
+        model: str,
+        dimensions: int,
+        texts: List[str],
+        memory_only: bool = False
+    ) -> List[Optional[List[float]]]:
+        """
+        批量查询，未命中的位置返回 None
+        :param memory_only: 只查内存层，不做磁盘 IO（可在事件循环中调用）；
+                            有磁盘层时未命中不计入 misses，由随后的完整查询计数
+        """
+        keys = [self.make_key(model, dimensions, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(keys)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    self._stats["lru_hits"] += 1
+                    results[i] = vector.tolist()
+                else:
+                    missing.setdefault(key, []).append(i)
+            if memory_only and self._conn is not None:
+                return results
+
+        if missing and self._conn is not None:
+            with self._db_lock:
+                rows = self._select(list(missing)) if self._conn is not None else []
+            with self._lock:
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    self._remember(key, vector)
+                    for i in missing.pop(key):
+                        self._stats["disk_hits"] += 1
+                        results[i] = vector.tolist()
+
+        with self._lock:
+            self._stats["misses"] += sum(len(v) for v in missing.values())
+        return results
+
+    def put_many(
+        self,
+        model: str,
+        dimensions: int,
+        texts: List[str],
+        vectors: List[List[float]],
+        wait: bool = True
+    ):
+        """
+        写入缓存，内存层立即生效
+        :param wait: 是否等磁盘写入提交后再返回；为假时交给后台线程写入（进程异常退出可能丢失最近的写入）
+        """
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(model, dimensions, text)
+                packed = array("f", vector)
+                self._remember(key, packed)
+                rows.append((key, model, dimensions, packed.tobytes(), time.time()))
+            self._stats["writes"] += len(rows)
+        if self._conn is None or not rows:
+            return
+        if wait:
+            self._write(rows)
+        else:
+            self._start_writer()
+            self._pending.put(rows)
+
+    def flush(self):
+        """等待后台线程写完已提交的磁盘写入"""
+        if self._writer is not None:
+            self._pending.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["lru_entries"] = len(self._lru)
+            stats["lru_bytes"] = self._lru_bytes
+        lookups = stats["lru_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["lru_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _write(self, rows: list):
+        with self._db_lock:
+            if self._conn is None:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dimensions, vector, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def _start_writer(self):
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="embedding-cache-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            batches = [self._pending.get()]
+            # 积压的写入合并成一次提交
+            while True:
+                try:
+                    batches.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write([row for batch in batches for row in batch])
+            except Exception as e:
+                print(f"嵌入缓存写入失败: {e}")
+            finally:
+                for _ in batches:
+                    self._pending.task_done()
+
+    def _select(self, keys: List[str]):
+        rows = []
+        # SQLite 单条语句的参数个数有限，分批查询
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall())
+        return rows
+
+    def _remember(self, key: str, vector: array):
+        size = len(vector) * vector.itemsize
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._lru_bytes -= len(old) * old.itemsize
+        self._lru[key] = vector
+        self._lru_bytes += size
+        while self._lru and (len(self._lru) > self.max_entries or self._lru_bytes > self.max_bytes):
+            _, evicted = self._lru.popitem(last=False)
+            self._lru_bytes -= len(evicted) * evicted.itemsize
+            self._stats["evictions"] += 1
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """进程共享的默认缓存实例，检索器与入库流程共用"""
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = EmbeddingCache(
+                    path=EMBEDDING_CACHE_PATH or None,
+                    max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                    max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+                )
+    return _default_cache
+
+
+def flush_embedding_cache():
+    """等待默认缓存的后台磁盘写入完成（应用退出时调用），缓存未创建时什么也不做"""
+    if _default_cache is not None:
+        _default_cache.flush()
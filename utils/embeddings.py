@@ -0,0 +1,293 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, List, Optional
+
+from dotenv import load_dotenv
+
+from utils import metrics
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+load_dotenv()
+ALIYUN_API_KEY = os.getenv("ALIYUN_API_KEY")
+ALIYUN_BASE_URL = os.getenv("ALIYUN_BASE_URL")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "remote")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR")
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "false").lower() == "true"
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+
+class EmbeddingBackend:
+    """
+    嵌入后端接口
+
+    检索器和入库流程只依赖这组方法，远程接口与本地模型可以互换。
+    model_name 与 dimensions 参与嵌入缓存键，不同后端的向量不会混用。
+    """
+    model_name: str
+    dimensions: int
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def close(self):
+        pass
+
+
+class RemoteEmbeddingBackend(EmbeddingBackend):
+    """OpenAI 兼容的远程嵌入接口（默认阿里百炼 text-embedding-v4）"""
+
+    def __init__(
+        self,
+        model_name: str = "text-embedding-v4",
+        dimensions: int = 1024,
+        encoding_format: str = "float",
+        openai_client: Optional["OpenAI"] = None,
+        async_openai_client: Optional["AsyncOpenAI"] = None,
+        batch_size: int = 10
+    ):
+        """
+        :param model_name: 嵌入模型名称
+        :param dimensions: 向量维度
+        :param encoding_format: 向量编码格式（float 或 base64）
+        :param openai_client: 可复用的同步客户端，为空时自行创建
+        :param async_openai_client: 可复用的异步客户端，为空时自行创建
+        :param batch_size: 单次请求的最大输入条数
+        """
+        self.model_name = model_name
+        self.dimensions = dimensions
+        self.encoding_format = encoding_format
+        self.batch_size = batch_size
+        if openai_client is None or async_openai_client is None:
+            from openai import AsyncOpenAI, OpenAI
+        self.openai_client = openai_client or OpenAI(api_key=ALIYUN_API_KEY, base_url=ALIYUN_BASE_URL)
+        self.async_openai_client = async_openai_client or AsyncOpenAI(api_key=ALIYUN_API_KEY, base_url=ALIYUN_BASE_URL)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.openai_client.embeddings.create(**self._params(texts[start:start + self.batch_size]))
+            vectors.extend(self._parse(response))
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = await self.async_openai_client.embeddings.create(**self._params(texts[start:start + self.batch_size]))
+            vectors.extend(self._parse(response))
+        return vectors
+
+    def _params(self, texts: List[str]) -> dict:
+        return {
+            "model": self.model_name,
+            "input": texts[0] if len(texts) == 1 else texts,
+            "dimensions": self.dimensions,
+            "encoding_format": self.encoding_format
+        }
+
+    def _parse(self, response) -> List[List[float]]:
+        metrics.EMBEDDING_TOKENS.inc(response.usage.total_tokens, metrics.current_scenario.get(), self.model_name)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """
+    本地 CPU ONNX 嵌入后端
+
+    模型目录需包含 model.onnx 与 tokenizer.json（HuggingFace 导出格式，如 bge-small-zh）。
+    单条请求先进入队列，由后台工作线程取走排队中的请求并在 max_wait_ms 内继续攒批
+    （最多 max_batch_size 条）后一次推理，高并发下自动合批；quantize 为真时首次加载会生成 model.int8.onnx 动态量化模型。
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        model_name: Optional[str] = None,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        num_workers: int = 1,
+        intra_op_threads: int = 0,
+        quantize: bool = False,
+        max_length: int = 512,
+        normalize: bool = True
+    ):
+        """
+        :param model_dir: 模型目录
+        :param model_name: 参与缓存键的模型名，默认取目录名
+        :param max_batch_size: 动态批的最大条数
+        :param max_wait_ms: 攒批最长等待时间（毫秒）
+        :param num_workers: 推理工作线程数
+        :param intra_op_threads: 单次推理的算子线程数，0 表示由 onnxruntime 决定
+        :param quantize: 是否使用 int8 动态量化模型
+        :param max_length: 最大 token 数，超出部分截断
+        :param normalize: 是否对输出向量做 L2 归一化
+        """
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self._np = np
+        model_path = os.path.join(model_dir, "model.onnx")
+        if quantize:
+            model_path = self._quantized_model(model_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        suffix = "-int8" if quantize else ""
+        self.model_name = model_name or f"onnx:{os.path.basename(os.path.normpath(model_dir))}{suffix}"
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.normalize = normalize
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"onnx-embed-{i}", daemon=True)
+            for i in range(max(1, num_workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+        self.dimensions = len(self.embed("dimension probe"))
+
+    @staticmethod
+    def _quantized_model(model_path: str) -> str:
+        quantized_path = model_path.replace(".onnx", ".int8.onnx")
+        if not os.path.exists(quantized_path):
+            try:
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+            except ImportError as e:
+                raise RuntimeError("int8 量化需要安装 onnx 包：pip install onnx") from e
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        return quantized_path
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = self._submit(texts)
+        return [future.result() for future in futures]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = self._submit(texts)
+        return list(await asyncio.gather(*(asyncio.wrap_future(f) for f in futures)))
+
+    def close(self):
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+
+    def _submit(self, texts: List[str]) -> List[Future]:
+        if self._closed:
+            raise RuntimeError("嵌入后端已关闭")
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        return futures
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            # 先取走已排队的请求；确有并发（批次已不止一条）时才在等待窗口内继续攒批，
+            # 单条请求不额外等待
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if len(batch) == 1 or remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self._infer(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def _infer(self, texts: List[str]) -> List[List[float]]:
+        np = self._np
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        feeds = {name: value for name, value in feeds.items() if name in self.input_names}
+
+        output = self.session.run(None, feeds)[0]
+        if output.ndim == 3:
+            # token 级输出做带掩码的均值池化
+            mask = attention_mask[:, :, None].astype(output.dtype)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            output = output / np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-12, None)
+        return output.astype(np.float32).tolist()
+
+
+def create_embedding_backend(
+    kind: Optional[str] = None,
+    model_name: str = "text-embedding-v4",
+    dimensions: int = 1024,
+    openai_client: Optional["OpenAI"] = None,
+    async_openai_client: Optional["AsyncOpenAI"] = None
+) -> EmbeddingBackend:
+    """
+    按配置创建嵌入后端
+
+    EMBEDDING_BACKEND=remote（默认）使用远程接口；EMBEDDING_BACKEND=onnx 使用 ONNX_MODEL_DIR
+    下的本地模型。注意切换后端后向量空间不同，需要用同一后端重新入库。
+    """
+    kind = kind or EMBEDDING_BACKEND
+    if kind == "onnx":
+        if not ONNX_MODEL_DIR:
+            raise ValueError("EMBEDDING_BACKEND=onnx 时必须配置 ONNX_MODEL_DIR")
+        return OnnxEmbeddingBackend(
+            ONNX_MODEL_DIR,
+            quantize=ONNX_QUANTIZE,
+            intra_op_threads=ONNX_THREADS
+        )
+    if kind != "remote":
+        raise ValueError(f"未知的嵌入后端: {kind}")
+    return RemoteEmbeddingBackend(
+        model_name=model_name,
+        dimensions=dimensions,
+        openai_client=openai_client,
+        async_openai_client=async_openai_client
+    )
@@ -1,38 +1,93 @@
 # from langchain_community.document_loaders import PyPDFLoader
 from langchain.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from openai import OpenAI
+from openai import OpenAI, RateLimitError, APIConnectionError, InternalServerError
+import argparse
+import glob
+import hashlib
 import os
-import chromadb
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
 from langchain_core.documents import Document
 from dotenv import load_dotenv
+from utils.embedding_cache import get_embedding_cache
+from utils.embeddings import create_embedding_backend
+from utils.manifest import IngestManifest, default_manifest_path
+from utils.vector_index import get_or_create_collection
 
 load_dotenv()
 
 ALIYUN_API_KEY = os.getenv("ALIYUN_API_KEY")
 ALIYUN_BASE_URL = os.getenv("ALIYUN_BASE_URL")
 RAG_DB_PATH = os.getenv("RAG_DB_PATH")
+EMBEDDING_MODEL = "text-embedding-v4"
+EMBEDDING_DIMENSIONS = 1024
 
-client = OpenAI(
-    api_key=ALIYUN_API_KEY,
-    base_url=ALIYUN_BASE_URL
-)
+# 百炼 text-embedding-v4 单次请求最多 10 条输入
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "10"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = 5
+UPSERT_BATCH_SIZE = 256
 
-
-# 初始化 ChromaDB 客户端
-chromadb_client = chromadb.PersistentClient(path=RAG_DB_PATH)
-rag_collections = {
-    "运维助手": chromadb_client.get_or_create_collection(name="devops_tool"),
-    "产品手册": chromadb_client.get_or_create_collection(name="product_manual")
+# 场景与知识库集合的对应关系
+RAG_SCENARIO_COLLECTIONS = {
+    "运维助手": "devops_tool",
+    "产品手册": "product_manual"
 }
 
-def load_pdf(file_path: str) -> list[str]:
+# 嵌入后端与 Chroma 客户端在首次使用时创建，导入本模块不会连接向量库或嵌入接口
+_embedding_backend = None
+_rag_collections = None
+_init_lock = threading.Lock()
+
+
+def get_embedding_backend():
+    """嵌入后端需与检索端一致（EMBEDDING_BACKEND=remote/onnx），否则向量空间不匹配"""
+    global _embedding_backend
+    if _embedding_backend is None:
+        with _init_lock:
+            if _embedding_backend is None:
+                client = OpenAI(
+                    api_key=ALIYUN_API_KEY,
+                    base_url=ALIYUN_BASE_URL
+                )
+                _embedding_backend = create_embedding_backend(
+                    model_name=EMBEDDING_MODEL,
+                    dimensions=EMBEDDING_DIMENSIONS,
+                    openai_client=client
+                )
+    return _embedding_backend
+
+
+def get_rag_collections() -> dict:
+    """场景名 -> Chroma 集合，首次调用时打开 RAG_DB_PATH 并按 HNSW 配置（RAG_HNSW_*）创建集合"""
+    global _rag_collections
+    if _rag_collections is None:
+        with _init_lock:
+            if _rag_collections is None:
+                import chromadb
+
+                chromadb_client = chromadb.PersistentClient(path=RAG_DB_PATH)
+                _rag_collections = {
+                    scenario: get_or_create_collection(chromadb_client, name)
+                    for scenario, name in RAG_SCENARIO_COLLECTIONS.items()
+                }
+    return _rag_collections
+
+def iter_pdf_pages(file_path: str) -> Iterator[Document]:
+    """逐页读取 PDF，不把整本文件一次性载入内存"""
     loader = PyPDFLoader(file_path)
-    docs = loader.load()
-    for doc in docs:
+    for doc in loader.lazy_load():
         doc.page_content = doc.page_content.replace('\n', ' ')
-        # print(f"加载啊啊啊啊啊啊啊啊啊啊啊啊啊{doc}")
-    return docs
+        yield doc
+
+def load_pdf(file_path: str) -> list[str]:
+    return list(iter_pdf_pages(file_path))
 
 def split_documents(docs: list[any]) -> list[any]:
     text_splitter = RecursiveCharacterTextSplitter(
@@ -43,35 +98,345 @@ def split_documents(docs: list[any]) -> list[any]:
     all_splits = text_splitter.split_documents(docs)
     return all_splits
 
+def chunk_id(split: Document) -> str:
+    """
+    基于内容生成稳定的片段 ID
+
+    由来源文件名、页码、页内偏移和文本内容共同决定，同一片段重复入库得到相同 ID，
+    不同文件之间不会冲突。
+    """
+    metadata = split.metadata or {}
+    source = os.path.basename(str(metadata.get("source", "")))
+    raw = f"{source}|{metadata.get('page', '')}|{metadata.get('start_index', '')}|{split.page_content}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+# chunk_id() 生成的片段 ID 格式；早期版本按序号 "0".."n" 写入，不符合该格式
+_CHUNK_ID = re.compile(r"[0-9a-f]{32}")
+
+def _legacy_chunk_ids(collection, sources: Optional[set] = None, page_size: int = 5000) -> List[str]:
+    """
+    找出早期版本按序号写入的片段
+
+    这些片段的 ID 不是内容哈希，重新入库时不会被 upsert 覆盖，不清理会与新片段重复、检索结果出现两遍。
+    :param sources: 来源文件名集合，只返回这些文件的旧片段；为空时返回全部旧片段
+    """
+    ids = []
+    offset = 0
+    while True:
+        # 不按来源过滤时只取 ID
+        batch = collection.get(include=["metadatas"] if sources is not None else [], limit=page_size, offset=offset)
+        if not batch["ids"]:
+            break
+        offset += len(batch["ids"])
+        for doc_id, metadata in zip(batch["ids"], batch["metadatas"] or [None] * len(batch["ids"])):
+            if _CHUNK_ID.fullmatch(doc_id):
+                continue
+            if sources is not None and os.path.basename(str((metadata or {}).get("source", ""))) not in sources:
+                continue
+            ids.append(doc_id)
+    return ids
+
 def embed(text: str) -> list[float]:
-    embedding = client.embeddings.create(
-        model="text-embedding-v4",
-        input=text,
-        dimensions=1024,
-        encoding_format="float"
-    )
-    return embedding.data[0].embedding
+    # 与检索器共用嵌入缓存，重复入库的相同片段不再请求接口
+    cache = get_embedding_cache()
+    backend = get_embedding_backend()
+    model_name, dimensions = backend.model_name, backend.dimensions
+    cached = cache.get(model_name, dimensions, text)
+    if cached is not None:
+        return cached
+
+    vector = backend.embed(text)
+    cache.put(model_name, dimensions, text, vector)
+    return vector
+
+
+class RateLimiter:
+    """按每分钟请求数限速，多个线程共享；rpm<=0 表示不限速"""
+
+    def __init__(self, rpm: int = 0):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+def _embed_request(texts: List[str], limiter: RateLimiter) -> List[List[float]]:
+    """单次批量嵌入请求，限流/网络/服务端错误时指数退避重试"""
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        limiter.wait()
+        try:
+            return get_embedding_backend().embed_documents(texts)
+        except (RateLimitError, APIConnectionError, InternalServerError) as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            delay = min(30.0, 2 ** attempt) * (0.5 + random.random())
+            print(f"嵌入请求失败（{type(e).__name__}），{delay:.1f}s 后第 {attempt + 1} 次重试")
+            time.sleep(delay)
 
-def save_to_chroma(splits: list[Document], collection_name: str):
-    collection = rag_collections.get(collection_name)
+def embed_batch(
+    texts: List[str],
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    limiter: Optional[RateLimiter] = None
+) -> List[List[float]]:
+    """
+    批量生成嵌入向量
+
+    先查缓存，未命中的文本按 batch_size 分组，以 concurrency 个线程并发请求。
+    """
+    cache = get_embedding_cache()
+    backend = get_embedding_backend()
+    model_name, dimensions = backend.model_name, backend.dimensions
+    vectors = cache.get_many(model_name, dimensions, texts)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if not missing:
+        return vectors
+
+    limiter = limiter or RateLimiter()
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = pool.map(lambda batch: _embed_request([texts[i] for i in batch], limiter), batches)
+        for batch, batch_vectors in zip(batches, results):
+            cache.put_many(model_name, dimensions, [texts[i] for i in batch], batch_vectors)
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+    return vectors
+
+def save_to_chroma(
+    splits: list[Document],
+    collection_name: str,
+    batch_size: int = UPSERT_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    limiter: Optional[RateLimiter] = None
+) -> int:
+    """批量嵌入并 upsert 到集合，返回写入的片段数"""
+    collection = get_rag_collections().get(collection_name)
     if not collection:
-        return
-    
-    for i, split in enumerate(splits):
-        vector = embed(split.page_content)
-        print(f"split=========={split}")
-        collection.add(
-            ids=str(i),
-            documents=[split.page_content],
-            embeddings=[vector],
-            metadatas=[split.metadata]
+        return 0
+
+    written = 0
+    for start in range(0, len(splits), batch_size):
+        batch = splits[start:start + batch_size]
+        texts = [split.page_content for split in batch]
+        vectors = embed_batch(texts, concurrency=concurrency, limiter=limiter)
+        collection.upsert(
+            ids=[chunk_id(split) for split in batch],
+            documents=texts,
+            embeddings=vectors,
+            metadatas=[split.metadata for split in batch]
         )
+        written += len(batch)
+    return written
+
+
+@dataclass
+class IngestStats:
+    pages: int = 0
+    chunks: int = 0
+    legacy_deleted: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+
+def ingest_pdf(
+    file_path: str,
+    collection_name: str,
+    pages_per_batch: int = 20,
+    concurrency: int = EMBED_CONCURRENCY,
+    rpm: int = 0
+) -> IngestStats:
+    """
+    流式入库：逐页读取 PDF，每攒够 pages_per_batch 页切分一次并批量写入
+    """
+    stats = IngestStats()
+    limiter = RateLimiter(rpm)
+    start = time.perf_counter()
+
+    pages = []
+    for page in iter_pdf_pages(file_path):
+        pages.append(page)
+        if len(pages) >= pages_per_batch:
+            stats.chunks += save_to_chroma(split_documents(pages), collection_name, concurrency=concurrency, limiter=limiter)
+            stats.pages += len(pages)
+            pages = []
+            stats.seconds = time.perf_counter() - start
+            print(f"已处理 {stats.pages} 页，{stats.chunks} 个片段，{stats.chunks_per_sec:.1f} chunks/s")
+    if pages:
+        stats.chunks += save_to_chroma(split_documents(pages), collection_name, concurrency=concurrency, limiter=limiter)
+        stats.pages += len(pages)
+
+    # 新片段写入后再删除该文件按旧序号 ID 写入的片段，其他文件不受影响
+    collection = get_rag_collections().get(collection_name)
+    if collection:
+        legacy_ids = _legacy_chunk_ids(collection, {os.path.basename(file_path)})
+        _delete_chunks(collection, legacy_ids)
+        stats.legacy_deleted = len(legacy_ids)
+
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+@dataclass
+class SyncStats:
+    files: int = 0
+    unchanged_files: int = 0
+    pages: int = 0
+    changed_pages: int = 0
+    upserted: int = 0
+    deleted: int = 0
+    removed_files: int = 0
+    seconds: float = 0.0
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _expand_pdf_paths(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.pdf"))))
+        else:
+            files.append(path)
+    return files
+
+def _delete_chunks(collection, ids: List[str], batch_size: int = UPSERT_BATCH_SIZE):
+    for start in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[start:start + batch_size])
+
+def sync_sources(
+    paths: List[str],
+    collection_name: str,
+    manifest_path: Optional[str] = None,
+    concurrency: int = EMBED_CONCURRENCY,
+    rpm: int = 0,
+    prune: bool = True
+) -> SyncStats:
+    """
+    增量同步知识库
+
+    paths 中的 PDF（目录会展开为其中的 *.pdf）视为该集合的全部来源：
+    文件大小和修改时间未变则直接跳过；文件内容变化时逐页比较哈希，只对变化或新增的页
+    重新切分、嵌入并 upsert，删除不再出现的片段；prune 为真时，清单中已不存在的
+    源文件对应的片段会被全部删除。
+    """
+    collection = get_rag_collections().get(collection_name)
+    if not collection:
+        return SyncStats()
+
+    manifest = IngestManifest(manifest_path or default_manifest_path(RAG_DB_PATH))
+    sources = manifest.sources(collection.name)
+    limiter = RateLimiter(rpm)
+    stats = SyncStats()
+    start = time.perf_counter()
+    changed = False
+
+    files = _expand_pdf_paths(paths)
+    seen = set()
+    for path in files:
+        source_key = os.path.basename(path)
+        seen.add(source_key)
+        stats.files += 1
+
+        stat = os.stat(path)
+        entry = sources.get(source_key)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            stats.unchanged_files += 1
+            continue
+
+        file_hash = _file_sha256(path)
+        if entry and entry["file_hash"] == file_hash:
+            entry.update(path=path, size=stat.st_size, mtime=stat.st_mtime)
+            stats.unchanged_files += 1
+            continue
+
+        old_pages = entry["pages"] if entry else {}
+        new_pages = {}
+        to_upsert = []
+        changed_pages = 0
+        for page in iter_pdf_pages(path):
+            stats.pages += 1
+            page_key = str(page.metadata.get("page", len(new_pages)))
+            page_hash = hashlib.sha256(page.page_content.encode("utf-8")).hexdigest()
+            old_page = old_pages.get(page_key)
+            if old_page and old_page["hash"] == page_hash:
+                new_pages[page_key] = old_page
+                continue
+
+            changed_pages += 1
+            splits = split_documents([page])
+            old_ids = set(old_page["chunks"]) if old_page else set()
+            to_upsert.extend(split for split in splits if chunk_id(split) not in old_ids)
+            new_pages[page_key] = {"hash": page_hash, "chunks": [chunk_id(split) for split in splits]}
+
+        upserted = 0
+        if to_upsert:
+            upserted = save_to_chroma(to_upsert, collection_name, concurrency=concurrency, limiter=limiter)
+
+        new_ids = {cid for page in new_pages.values() for cid in page["chunks"]}
+        stale_ids = [cid for page in old_pages.values() for cid in page["chunks"] if cid not in new_ids]
+        if stale_ids:
+            _delete_chunks(collection, stale_ids)
+
+        stats.changed_pages += changed_pages
+        stats.upserted += upserted
+        stats.deleted += len(stale_ids)
+        sources[source_key] = {
+            "path": path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "file_hash": file_hash,
+            "pages": new_pages
+        }
+        changed = True
+        # 每个文件处理完就落盘，中断后重跑可以从这里继续
+        manifest.save()
+        print(f"{source_key}: 变化页 {changed_pages}，upsert {upserted}，删除 {len(stale_ids)}")
+
+    if prune:
+        for source_key in [key for key in sources if key not in seen]:
+            stale_ids = [cid for page in sources[source_key]["pages"].values() for cid in page["chunks"]]
+            _delete_chunks(collection, stale_ids)
+            stats.deleted += len(stale_ids)
+            stats.removed_files += 1
+            del sources[source_key]
+            changed = True
+            print(f"{source_key}: 源文件已移除，删除 {len(stale_ids)} 个片段")
+
+    # paths 即全部来源：prune 时删除所有旧序号 ID 的片段，否则只删除本次同步的文件的
+    legacy_ids = _legacy_chunk_ids(collection, None if prune else seen)
+    if legacy_ids:
+        _delete_chunks(collection, legacy_ids)
+        stats.deleted += len(legacy_ids)
+        changed = True
+        print(f"删除旧版本按序号 ID 写入的片段 {len(legacy_ids)} 个")
+
+    if changed:
+        manifest.bump(collection.name)
+    manifest.save()
+    stats.seconds = time.perf_counter() - start
+    return stats
 
 def query_chroma(query: str, collection_name: str, n_results: int = 3) -> list[str]:
-    collection = rag_collections.get(collection_name)
+    collection = get_rag_collections().get(collection_name)
     if not collection:
         return []
-    
+
     query_vector = embed(query)
     results = collection.query(
         query_embeddings=[query_vector],
@@ -80,10 +445,34 @@ def query_chroma(query: str, collection_name: str, n_results: int = 3) -> list[s
     return results['documents'][0] if results else []
 
 if __name__ == "__main__":
-    # devops_file = ""
-    product_manual_path = "C:/Users/lzfdd/Desktop/备份软件缺陷管理.pdf"
-    docs = load_pdf(product_manual_path)
-    splits = split_documents(docs)
-    save_to_chroma(splits, "运维助手")
+    # 用法：python -m utils.file_handle "C:/Users/lzfdd/Desktop/备份软件缺陷管理.pdf" --scenario 运维助手
+    parser = argparse.ArgumentParser(description="PDF 知识库入库工具")
+    parser.add_argument("paths", nargs="+", help="PDF 文件路径（--sync 模式下可以是目录）")
+    parser.add_argument("--scenario", default="运维助手", choices=list(RAG_SCENARIO_COLLECTIONS), help="目标知识库")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY, help="并发嵌入请求数")
+    parser.add_argument("--rpm", type=int, default=0, help="嵌入接口每分钟请求上限，0 表示不限速")
+    parser.add_argument("--pages-per-batch", type=int, default=20, help="每次切分写入的页数")
+    parser.add_argument("--sync", action="store_true",
+                        help="增量同步：只处理变化的页，并删除已不在 paths 中的来源")
+    args = parser.parse_args()
+
+    if args.sync:
+        stats = sync_sources(args.paths, args.scenario, concurrency=args.concurrency, rpm=args.rpm)
+        print(f"同步完成：{stats.files} 个文件（未变化 {stats.unchanged_files}），"
+              f"变化页 {stats.changed_pages}/{stats.pages}，upsert {stats.upserted}，"
+              f"删除 {stats.deleted}，移除来源 {stats.removed_files}，耗时 {stats.seconds:.1f}s")
+        print(f"集合记录数: {get_rag_collections()[args.scenario].count()}")
+        raise SystemExit(0)
+
+    for path in args.paths:
+        stats = ingest_pdf(
+            path,
+            args.scenario,
+            pages_per_batch=args.pages_per_batch,
+            concurrency=args.concurrency,
+            rpm=args.rpm
+        )
+        print(f"{path}: {stats.pages} 页，{stats.chunks} 个片段，删除旧片段 {stats.legacy_deleted} 个，"
+              f"耗时 {stats.seconds:.1f}s，{stats.chunks_per_sec:.1f} chunks/s")
     print("数据已保存到 ChromaDB")
-    print(f"集合记录数: {rag_collections['运维助手'].count()}")
\ No newline at end of file
+    print(f"集合记录数: {get_rag_collections()[args.scenario].count()}")
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, NamedTuple, Optional, Set
+
+from dotenv import load_dotenv
+
+from utils import metrics
+from utils.streaming import sse_event
+
+load_dotenv()
+# 每个对话最多缓冲的事件数（token 帧已按时间窗口合并），重连时落在缓冲区内的部分按事件原样重放
+GENERATION_BUFFER_EVENTS = int(os.getenv("GENERATION_BUFFER_EVENTS", "512"))
+# 生成结束后缓冲区保留的时间（秒），期间重连仍可取回结尾与 [DONE]
+GENERATION_RETENTION_SECONDS = float(os.getenv("GENERATION_RETENTION_SECONDS", "120"))
+
+STREAM_RESUMES = metrics.REGISTRY.counter(
+    "chat_stream_resumes_total", "断线重连续传次数：event_id 按 Last-Event-ID 重放，offset 按已收到的字符数补发", ("mode",))
+STREAM_DETACHED = metrics.REGISTRY.counter(
+    "chat_stream_detached_total", "生成未结束时断开的订阅数（生成在后台继续）")
+
+_registries = []
+
+
+class _Event(NamedTuple):
+    id: int
+    frame: bytes
+    # 事件发布前后回答文本的长度；token 事件两者之差即 token 长度，其他事件相等
+    start: int
+    end: int
+
+
+class Generation:
+    """
+    一次回答生成：由后台任务写入事件，任意数量的客户端订阅
+
+    事件保存在定长环形缓冲区中，每个事件带递增的 ID；回答全文另行累积（增量落库也需要它），
+    订阅者请求的位置已被挤出缓冲区时，用全文补发缺失的那段文本，不会丢字或重复。
+    """
+
+    def __init__(self, key: str, owner, buffer_size: int = GENERATION_BUFFER_EVENTS):
+        self.key = key
+        self.owner = owner
+        self.text = ""
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+        self._events: Deque[_Event] = deque(maxlen=max(1, buffer_size))
+        self._last_id = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def last_event_id(self) -> int:
+        return self._last_id
+
+    def publish(self, payload):
+        """发布一个非 token 事件（排队位置、错误、完整回答、[DONE] 等）"""
+        self._append(payload, len(self.text))
+
+    def append(self, chunk: str):
+        """追加一段回答文本并发布 token 事件"""
+        start = len(self.text)
+        self.text += chunk
+        self._append({"token": chunk}, start)
+
+    def finish(self):
+        self.done = True
+        self._wake()
+
+    def _append(self, payload, start: int):
+        self._last_id += 1
+        self._events.append(_Event(self._last_id, sse_event(payload, self._last_id), start, len(self.text)))
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _resume_offset(self, last_event_id: Optional[int], offset: int) -> tuple:
+        """换算出 (下一个事件 ID, 客户端已有的字符数)"""
+        offset = min(max(0, offset), len(self.text))
+        if last_event_id is None or not 0 < last_event_id <= self._last_id:
+            if offset:
+                STREAM_RESUMES.inc(1, "offset")
+            return 1, offset
+        for event in self._events:
+            if event.id == last_event_id:
+                STREAM_RESUMES.inc(1, "event_id")
+                return last_event_id + 1, event.end
+        # 该事件已被挤出缓冲区，只能依据客户端上报的字符数续传
+        STREAM_RESUMES.inc(1, "offset")
+        return last_event_id + 1, offset
+
+    async def events(self, last_event_id: Optional[int] = None, offset: int = 0) -> AsyncIterator[bytes]:
+        """
+        订阅事件流，生成结束且事件发送完毕后返回
+
+        :param last_event_id: 客户端收到的最后一个事件 ID（Last-Event-ID）
+        :param offset: 客户端已收到的回答字符数，事件 ID 不可用时据此续传
+        """
+        next_id, offset = self._resume_offset(last_event_id, offset)
+        try:
+            while True:
+                changed = self._changed
+                for event in list(self._events):
+                    if event.id < next_id:
+                        continue
+                    if event.start > offset:
+                        # 中间的 token 事件已被挤出缓冲区，用全文补上
+                        yield sse_event({"token": self.text[offset:event.start]}, event.id - 1)
+                        yield event.frame
+                    elif event.start < offset:
+                        # 按字符数续传时，客户端已有这个 token 的一部分
+                        if event.end > offset:
+                            yield sse_event({"token": self.text[offset:event.end]}, event.id)
+                    else:
+                        yield event.frame
+                    offset = max(offset, event.end)
+                    next_id = event.id + 1
+                if self.done and next_id > self._last_id:
+                    return
+                await changed.wait()
+        finally:
+            if not self.done:
+                STREAM_DETACHED.inc()
+
+
+class GenerationRegistry:
+    """
+    按对话登记进行中的生成
+
+    生成在独立任务中执行，不随 HTTP 连接断开而取消；结束后保留 retention 秒供重连，
+    同一对话同时只允许一个生成。缓冲区在进程内存中，多 worker 部署时续传需要会话粘滞。
+    """
+
+    def __init__(self, buffer_size: int = GENERATION_BUFFER_EVENTS, retention: float = GENERATION_RETENTION_SECONDS):
+        self.buffer_size = buffer_size
+        self.retention = retention
+        self._generations: Dict[str, Generation] = {}
+        # 已预占、尚未 start 的对话
+        self._reserved: Set[str] = set()
+        _registries.append(self)
+
+    def get(self, key: str) -> Optional[Generation]:
+        return self._generations.get(key)
+
+    def running(self, key: str) -> bool:
+        if key in self._reserved:
+            return True
+        generation = self._generations.get(key)
+        return generation is not None and not generation.done
+
+    def reserve(self, key: str) -> bool:
+        """
+        预占对话的生成名额，对话正在生成或已被预占时返回 False
+
+        检查与登记之间没有 await，在事件循环中是原子的；预占后由 start() 转为正式生成，
+        未能 start 时调用 release() 归还。
+        """
+        if self.running(key):
+            return False
+        self._reserved.add(key)
+        return True
+
+    def release(self, key: Optional[str]):
+        """归还 reserve() 预占的名额"""
+        self._reserved.discard(key)
+
+    def start(self, key: str, owner, producer: Callable[[Generation], Awaitable[None]]) -> Generation:
+        """
+        创建生成并在后台任务中执行 producer
+
+        :param key: 对话 ID
+        :param owner: 所属用户，重连时校验
+        :param producer: 写入事件的协程函数；抛出异常时向订阅者发布错误事件
+        """
+        generation = self._generations.get(key)
+        if generation is not None and not generation.done:
+            raise RuntimeError(f"对话 {key} 正在生成回答")
+        self._reserved.discard(key)
+        generation = Generation(key, owner, self.buffer_size)
+        self._generations[key] = generation
+        generation.task = asyncio.get_running_loop().create_task(self._run(generation, producer))
+        return generation
+
+    async def _run(self, generation: Generation, producer: Callable[[Generation], Awaitable[None]]):
+        started = time.perf_counter()
+        try:
+            await producer(generation)
+        except asyncio.CancelledError:
+            generation.publish({"error": "服务正在重启，回答已中断"})
+            raise
+        except Exception as e:
+            print(f"生成回答失败（对话 {generation.key}）: {e}")
+            generation.publish({"error": "生成回答失败，请稍后再试"})
+        finally:
+            generation.finish()
+            print(f"生成结束（对话 {generation.key}），耗时 {time.perf_counter() - started:.2f}s，{len(generation.text)} 字")
+            asyncio.get_running_loop().call_later(self.retention, self._expire, generation)
+
+    def _expire(self, generation: Generation):
+        if self._generations.get(generation.key) is generation:
+            del self._generations[generation.key]
+
+    async def aclose(self):
+        """关闭时取消仍在进行的生成，已产出的内容由 producer 负责落库"""
+        tasks = [g.task for g in self._generations.values() if g.task is not None and not g.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._generations.clear()
+        self._reserved.clear()
+
+
+metrics.REGISTRY.gauge(
+    "chat_generations", "登记中的回答生成数（running 为进行中，finished 为已结束、等待重连取回）",
+    lambda: {
+        (state,): sum(1 for registry in _registries for g in registry._generations.values() if g.done == (state == "finished"))
+        for state in ("running", "finished")
+    },
+    ("state",)
+)
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import re
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+HISTORY_ENCODING = os.getenv("HISTORY_ENCODING", "cl100k_base")
+
+_CJK_CHAR = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]")
+
+ROLE_NAMES = {"user": "用户", "assistant": "助手"}
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """
+    加载 tiktoken 编码
+
+    tiktoken 首次使用需要下载 BPE 文件（可通过 TIKTOKEN_CACHE_DIR 预置），
+    离线环境加载失败时退化为按字符估算，保证预算逻辑仍然可用。
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(HISTORY_ENCODING)
+    except Exception as e:
+        print(f"加载 tiktoken 编码 {HISTORY_ENCODING} 失败，按字符估算 token 数: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """统计文本 token 数；无法加载编码时中文按 1 字 1 token、其余按 4 字符 1 token 估算"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断到 max_tokens 以内，保留开头部分"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + "…"
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "…"
+
+
+def format_message(role: str, content: str) -> str:
+    return f"{ROLE_NAMES.get(role, role)}: {content}"
+
+
+def pack_recent_messages(messages: Sequence[Tuple[int, str, str]], max_tokens: int) -> Tuple[List[str], Optional[int], bool]:
+    """
+    从最新的消息开始，尽可能多地装入 token 预算
+
+    :param messages: [(消息 ID, 角色, 内容)]，按时间倒序（最新在前）
+    :param max_tokens: 历史消息的 token 预算
+    :return: (按时间正序排列的历史行, 装入的最早一条消息 ID, 是否有消息因超出预算被舍弃)
+    """
+    lines = []
+    oldest_id = None
+    used = 0
+    for message_id, role, content in messages:
+        line = format_message(role, content or "")
+        tokens = count_tokens(line) + 1  # 换行符
+        if used + tokens > max_tokens:
+            if not lines:
+                # 最新一条单独就超出预算时截断后保留，避免历史为空
+                lines.append(truncate_to_tokens(line, max_tokens))
+                oldest_id = message_id
+            return lines[::-1], oldest_id, True
+        lines.append(line)
+        used += tokens
+        oldest_id = message_id
+    return lines[::-1], oldest_id, False
+
+
+def render_history(summary: str, lines: List[str]) -> str:
+    """拼接滚动摘要与最近的对话"""
+    if summary:
+        return "\n".join([f"此前对话摘要：{summary}", *lines])
+    return "\n".join(lines)
+
+
+class SummaryJobs:
+    """
+    后台摘要任务
+
+    摘要在请求路径之外以 asyncio 任务执行，同一对话同时只保留一个任务，
+    前一个任务未结束时新的调度请求直接忽略（下一轮会再次检查是否需要摘要）。
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def schedule(self, key: Hashable, job: Callable[[], Awaitable[None]]) -> bool:
+        if key in self._tasks:
+            return False
+        task = asyncio.get_running_loop().create_task(job())
+        self._tasks[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return True
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        self._tasks.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"生成对话摘要失败 {key}: {task.exception()}")
+
+    async def aclose(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
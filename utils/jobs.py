@@ -0,0 +1,114 @@
+import asyncio
+import random
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Set
+
+
+class BackgroundWorkerPool:
+    """
+    事件循环内的小型后台任务池
+
+    固定数量的 worker 从有界队列中取任务执行，失败时按指数退避（带随机抖动）重试，
+    超过重试次数后放弃并记录。同一个 key 在排队或执行期间不会重复提交。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int = 2,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_queue: int = 1000
+    ):
+        """
+        :param name: 任务池名称，用于日志
+        :param workers: 并发执行的 worker 数量
+        :param max_retries: 失败后的最大重试次数
+        :param backoff_base: 首次重试前的基础等待时间（秒）
+        :param backoff_max: 单次等待时间上限（秒）
+        :param max_queue: 队列容量，满时拒绝新任务
+        """
+        self.name = name
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_queue = max_queue
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._pending: Set[Hashable] = set()
+        self._stats = {"submitted": 0, "succeeded": 0, "retries": 0, "failed": 0, "rejected": 0}
+
+    def start(self):
+        """在事件循环中启动 worker，需在应用启动后调用"""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [
+            loop.create_task(self._worker(), name=f"{self.name}-{i}")
+            for i in range(max(1, self.workers))
+        ]
+
+    def submit(self, key: Hashable, job: Callable[[], Awaitable[None]]) -> bool:
+        """提交任务，返回是否入队成功"""
+        if self._queue is None:
+            self.start()
+        if key in self._pending:
+            return False
+        try:
+            self._queue.put_nowait((key, job))
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            print(f"[{self.name}] 队列已满，丢弃任务 {key}")
+            return False
+        self._pending.add(key)
+        self._stats["submitted"] += 1
+        return True
+
+    def pending(self, key: Hashable) -> bool:
+        """任务是否仍在排队或执行中"""
+        return key in self._pending
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize() if self._queue else 0
+        stats["pending"] = len(self._pending)
+        return stats
+
+    async def _worker(self):
+        while True:
+            key, job = await self._queue.get()
+            try:
+                await self._run(key, job)
+            finally:
+                self._pending.discard(key)
+                self._queue.task_done()
+
+    async def _run(self, key: Hashable, job: Callable[[], Awaitable[None]]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await job()
+                self._stats["succeeded"] += 1
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    self._stats["failed"] += 1
+                    print(f"[{self.name}] 任务 {key} 重试 {self.max_retries} 次后仍失败: {e}")
+                    return
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                delay = random.uniform(delay / 2, delay)
+                self._stats["retries"] += 1
+                print(f"[{self.name}] 任务 {key} 失败，{delay:.2f}s 后重试: {e}")
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._pending.clear()
@@ -0,0 +1,236 @@
+import hashlib
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+# 英文/数字标识符：错误码、命令行参数、表名、路径等，保留 _ - . / : 连接符
+_ASCII_TOKEN = re.compile(r"[a-z0-9][a-z0-9_\-./:]*[a-z0-9]|[a-z0-9]")
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_SUB_TOKEN = re.compile(r"[a-z0-9]+")
+# 词法索引文件格式版本，格式变化时递增，旧文件读取失败后自动重建
+INDEX_FORMAT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中英文混合分词
+
+    中文按单字 + 相邻二元组切分（无需词典即可匹配任意词语）；英文数字整体保留为一个词，
+    复合标识符（如 skip-lock-tables、AUTH_LOCKED）同时拆出子词，兼顾精确和部分匹配。
+    """
+    text = text.lower()
+    tokens = []
+    for match in _ASCII_TOKEN.finditer(text):
+        token = match.group()
+        tokens.append(token)
+        parts = _SUB_TOKEN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    for match in _CJK_RUN.finditer(text):
+        run = match.group()
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    基于倒排表的 BM25 索引
+
+    每个词的倒排表预先计算好 BM25 词项权重，存成 numpy 数组，查询时只需对命中的文档
+    做向量化累加，十万级片段的集合上单次查询为毫秒级。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.signature: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self, ids: List[str], documents: List[str], signature: Optional[tuple] = None):
+        self.ids = list(ids)
+        self.signature = signature
+        doc_lengths = np.zeros(len(ids), dtype=np.float32)
+        raw: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_index, text in enumerate(documents):
+            counts = Counter(tokenize(text or ""))
+            doc_lengths[doc_index] = sum(counts.values())
+            for term, tf in counts.items():
+                raw[term].append((doc_index, tf))
+
+        total = len(ids)
+        avg_length = float(doc_lengths.mean()) if total else 0.0
+        self.postings = {}
+        for term, entries in raw.items():
+            doc_ids = np.fromiter((d for d, _ in entries), dtype=np.int32, count=len(entries))
+            tfs = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[doc_ids] / (avg_length or 1.0))
+            weights = (idf * tfs * (self.k1 + 1) / (tfs + norm)).astype(np.float32)
+            self.postings[term] = (doc_ids, weights)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """返回 [(文档 ID, BM25 分数)]，按分数降序"""
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        matched = False
+        for term, qtf in Counter(tokenize(query)).items():
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            doc_ids, weights = posting
+            scores[doc_ids] += weights * qtf
+            matched = True
+        if not matched:
+            return []
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path: str):
+        """
+        以 npz 格式保存：各词倒排表首尾相接存成两个数组，按 offsets 切分；
+        词表、文档 ID 等元数据以 JSON 字节存入同一文件，整个文件原子替换
+        """
+        terms = list(self.postings)
+        lengths = np.fromiter((len(self.postings[term][0]) for term in terms), dtype=np.int64, count=len(terms))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        empty = (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32))
+        meta = {
+            "version": INDEX_FORMAT_VERSION, "k1": self.k1, "b": self.b, "ids": self.ids, "terms": terms,
+            "signature": list(self.signature) if self.signature is not None else None,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                meta=np.frombuffer(orjson.dumps(meta), dtype=np.uint8),
+                offsets=offsets,
+                doc_ids=np.concatenate([self.postings[term][0] for term in terms] or [empty[0]]),
+                weights=np.concatenate([self.postings[term][1] for term in terms] or [empty[1]]),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        # 只接受纯数组，不反序列化任何 Python 对象
+        with np.load(path, allow_pickle=False) as data:
+            meta = orjson.loads(data["meta"].tobytes())
+            offsets = data["offsets"]
+            doc_ids = data["doc_ids"]
+            weights = data["weights"]
+        if meta.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"词法索引格式版本不匹配: {meta.get('version')}")
+        terms = meta["terms"]
+        if len(offsets) != len(terms) + 1 or offsets[-1] != len(doc_ids) or len(doc_ids) != len(weights):
+            raise ValueError("词法索引文件已损坏")
+        index = cls(k1=meta["k1"], b=meta["b"])
+        index.ids = meta["ids"]
+        index.postings = {
+            term: (doc_ids[offsets[i]:offsets[i + 1]], weights[offsets[i]:offsets[i + 1]])
+            for i, term in enumerate(terms)
+        }
+        index.signature = tuple(meta["signature"]) if meta["signature"] is not None else None
+        return index
+
+
+# 词法索引文件名：当前格式、写入中的临时文件与早期的 pickle 格式
+_INDEX_FILE = re.compile(r"bm25_.+\.(npz|pkl)(\.tmp)?")
+
+
+def index_path(db_path: Optional[str], collection_name: str) -> str:
+    """词法索引与 chroma.sqlite3 放在同一目录"""
+    return os.path.join(db_path or ".", f"bm25_{collection_name}.npz")
+
+
+def is_index_file(file_name: str) -> bool:
+    """是否为词法索引文件；检索器加载时会写入这些文件，热加载检测磁盘变化时需要排除"""
+    return _INDEX_FILE.fullmatch(file_name) is not None
+
+
+def _remove_legacy_index(db_path: Optional[str], collection_name: str):
+    """早期版本用 pickle 保存的索引不再读取（加载 pickle 可执行任意代码），直接删除"""
+    legacy = os.path.join(db_path or ".", f"bm25_{collection_name}.pkl")
+    if os.path.exists(legacy):
+        try:
+            os.remove(legacy)
+            print(f"已删除旧格式的词法索引: {legacy}")
+        except OSError as e:
+            print(f"删除旧格式的词法索引失败: {e}")
+
+
+def collection_signature(collection, page_size: int = 5000) -> tuple:
+    """
+    集合内容签名：条数 + 全部片段 ID 的哈希
+
+    入库流程的片段 ID 由内容派生，内容变化必然带来 ID 变化；只读 ID 不读正文，开销远小于重建索引。
+    """
+    ids = []
+    offset = 0
+    while True:
+        batch = collection.get(include=[], limit=page_size, offset=offset)
+        if not batch["ids"]:
+            break
+        ids.extend(batch["ids"])
+        offset += len(batch["ids"])
+    digest = hashlib.sha1("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+    return (len(ids), digest)
+
+
+def load_or_build(collection, db_path: Optional[str], page_size: int = 5000) -> BM25Index:
+    """
+    读取磁盘上的词法索引，签名不一致（集合内容变化）时从 collection.get() 重新构建并落盘
+    """
+    _remove_legacy_index(db_path, collection.name)
+    path = index_path(db_path, collection.name)
+    signature = collection_signature(collection, page_size)
+    if os.path.exists(path):
+        try:
+            index = BM25Index.load(path)
+            if index.signature == signature:
+                return index
+        except Exception as e:
+            print(f"读取词法索引失败，重新构建: {e}")
+
+    start = time.perf_counter()
+    ids, documents = [], []
+    offset = 0
+    while True:
+        batch = collection.get(include=["documents"], limit=page_size, offset=offset)
+        if not batch["ids"]:
+            break
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        offset += len(batch["ids"])
+
+    index = BM25Index()
+    index.build(ids, documents, signature=signature)
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"保存词法索引失败: {e}")
+    print(f"集合 {collection.name} 词法索引构建完成：{len(ids)} 个片段，耗时 {time.perf_counter() - start:.2f}s")
+    return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """RRF 融合多路排序结果：score(d) = Σ 1 / (k + rank)"""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,191 @@
+import asyncio
+import os
+import random
+import threading
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import orjson
+from dotenv import load_dotenv
+
+from utils import metrics
+
+load_dotenv()
+DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com")
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek-chat")
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# 流式响应中两次收到数据的最长间隔，而不是整个回答的总时长
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_WRITE_TIMEOUT = float(os.getenv("LLM_WRITE_TIMEOUT", "10"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+# 各场景的模型参数，未列出的场景使用 DEFAULT_PARAMS；
+# 可通过 LLM_SCENARIO_PARAMS（JSON，如 {"用例生成": {"max_tokens": 4096}}）覆盖
+DEFAULT_PARAMS = {"temperature": 0.7, "max_tokens": None}
+SCENARIO_PARAMS: Dict[str, Dict] = {
+    "用例生成": {"temperature": 0.5, "max_tokens": 8192},
+    "运维助手": {"temperature": 0.3},
+    "产品手册": {"temperature": 0.3},
+    "标题生成": {"temperature": 0.3, "max_tokens": 32},
+    "历史摘要": {"temperature": 0.3, "max_tokens": 300},
+}
+for _scenario, _params in orjson.loads(os.getenv("LLM_SCENARIO_PARAMS", "{}")).items():
+    SCENARIO_PARAMS.setdefault(_scenario, {}).update(_params)
+
+LLM_RETRIES = metrics.REGISTRY.counter(
+    "llm_retries_total", "大模型请求重试次数", ("scenario",))
+
+
+def retryable_errors() -> Tuple:
+    """尚未输出任何 token 时遇到这些错误可以安全重试"""
+    import httpx
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+
+    return APIConnectionError, RateLimitError, InternalServerError, httpx.TransportError
+
+
+def scenario_params(scenario: Optional[str]) -> Dict:
+    params = dict(DEFAULT_PARAMS)
+    params.update(SCENARIO_PARAMS.get(scenario or "", {}))
+    return params
+
+
+class LLMClientManager:
+    """
+    进程内共享的大模型客户端
+
+    所有请求复用同一个 httpx.AsyncClient（连接池 + keep-alive，安装 h2 时启用 HTTP/2），
+    模型对象按场景参数缓存，不再每次调用都重新导入、构建模型和 HTTP 客户端。
+    SDK 与 HTTP 客户端在首次构建模型时才导入（启动时由 warm_up 在后台完成）。
+    SDK 自带的重试关闭，改为在尚未输出 token 时按指数退避（带随机抖动）重试，
+    已经开始输出的回答不会被重放。
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = DEEPSEEK_API_KEY,
+        base_url: str = DEEPSEEK_API_BASE,
+        model_name: str = LLM_MODEL,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        http2: bool = LLM_HTTP2
+    ):
+        """
+        :param api_key: DeepSeek API Key
+        :param base_url: OpenAI 兼容接口地址
+        :param model_name: 模型名称
+        :param max_retries: 首 token 之前失败的最大重试次数
+        :param backoff_base: 首次重试前的基础等待时间（秒）
+        :param backoff_max: 单次等待时间上限（秒）
+        :param http2: 是否尝试启用 HTTP/2（需要安装 h2）
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model_name = model_name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.http2 = http2
+
+        self.timeout = None
+        self._http_client = None
+        self._models: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if self._http_client is None:
+            import httpx
+
+            self.timeout = httpx.Timeout(
+                connect=LLM_CONNECT_TIMEOUT,
+                read=LLM_READ_TIMEOUT,
+                write=LLM_WRITE_TIMEOUT,
+                pool=LLM_POOL_TIMEOUT
+            )
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    print("未安装 h2，大模型客户端使用 HTTP/1.1 keep-alive（pip install httpx[http2] 可启用 HTTP/2）")
+                    http2 = False
+            self._http_client = httpx.AsyncClient(
+                http2=http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+                )
+            )
+        return self._http_client
+
+    def model(self, scenario: Optional[str] = None):
+        """返回该场景参数对应的模型对象，参数相同的场景共用一个"""
+        params = scenario_params(scenario)
+        key = tuple(sorted(params.items()))
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                from langchain_deepseek import ChatDeepSeek
+
+                http_client = self._client()
+                model = ChatDeepSeek(
+                    model=self.model_name,
+                    api_key=self.api_key,
+                    api_base=self.base_url,
+                    request_timeout=self.timeout,
+                    max_retries=0,
+                    stream_usage=True,
+                    http_async_client=http_client,
+                    **{name: value for name, value in params.items() if value is not None}
+                )
+                self._models[key] = model
+        return model
+
+    def warm_up(self):
+        """提前导入 SDK 并构建默认模型，避免首个请求承担这部分开销"""
+        self.model()
+
+    async def astream(self, prompt, scenario: Optional[str] = None) -> AsyncIterator[str]:
+        """流式调用，逐个产出 token；scenario 为空时取当前请求的场景"""
+        scenario = scenario or metrics.current_scenario.get()
+        model = self.model(scenario)
+        retryable = retryable_errors()
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async for chunk in model.astream(prompt):
+                    usage = getattr(chunk, "usage_metadata", None)
+                    if usage:
+                        metrics.LLM_TOKENS.inc(usage.get("input_tokens", 0), scenario, "prompt")
+                        metrics.LLM_TOKENS.inc(usage.get("output_tokens", 0), scenario, "completion")
+                    if chunk.content:
+                        started = True
+                        yield chunk.content
+                return
+            except retryable as e:
+                if started or attempt >= self.max_retries:
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                delay = random.uniform(delay / 2, delay)
+                LLM_RETRIES.inc(1, scenario)
+                print(f"大模型请求失败，{delay:.2f}s 后重试: {e}")
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        self._models.clear()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
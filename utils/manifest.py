@@ -0,0 +1,80 @@
+import json
+import os
+import time
+from typing import Dict, Optional
+
+MANIFEST_FILE_NAME = "ingest_manifest.json"
+
+
+def default_manifest_path(db_path: Optional[str]) -> str:
+    """清单默认与 chroma.sqlite3 放在同一目录"""
+    return os.path.join(db_path or ".", MANIFEST_FILE_NAME)
+
+
+class IngestManifest:
+    """
+    知识库入库清单
+
+    记录每个集合已入库的源文件、文件哈希、逐页哈希及每页对应的片段 ID，
+    用于增量同步时判断哪些页需要重新嵌入、哪些片段需要删除。
+    每次内容变化时集合的 generation 加一，供下游缓存判断是否失效。
+
+    文件结构：
+    {
+        "collections": {
+            "devops_tool": {
+                "generation": 3,
+                "updated_at": 1722760000.0,
+                "sources": {
+                    "Bug Manage.pdf": {
+                        "path": "...", "size": 1234, "mtime": 1722760000.0, "file_hash": "...",
+                        "pages": {"0": {"hash": "...", "chunks": ["id1", "id2"]}}
+                    }
+                }
+            }
+        }
+    }
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: Dict = {"collections": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+            self.data.setdefault("collections", {})
+
+    def collection(self, name: str) -> Dict:
+        return self.data["collections"].setdefault(
+            name, {"generation": 0, "updated_at": None, "sources": {}}
+        )
+
+    def sources(self, name: str) -> Dict[str, Dict]:
+        return self.collection(name)["sources"]
+
+    def generation(self, name: str) -> int:
+        return self.data["collections"].get(name, {}).get("generation", 0)
+
+    def bump(self, name: str):
+        entry = self.collection(name)
+        entry["generation"] += 1
+        entry["updated_at"] = time.time()
+
+    def save(self):
+        """先写临时文件再原子替换，避免中断时留下半个清单"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def read_generation(path: Optional[str], name: str) -> int:
+    """只读方式获取集合当前 generation，清单不存在时返回 0"""
+    if not path or not os.path.exists(path):
+        return 0
+    try:
+        return IngestManifest(path).generation(name)
+    except (OSError, ValueError):
+        return 0
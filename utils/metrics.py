@@ -0,0 +1,282 @@
+import bisect
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+
+# 当前请求所属场景，嵌入/模型 token 用量按它打标签；contextvar 会随 asyncio 任务和线程池调用传递
+current_scenario: contextvars.ContextVar[str] = contextvars.ContextVar("current_scenario", default="none")
+
+# 秒级时延的默认分桶：覆盖 1ms 到 60s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        lines = self.header()
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各分桶计数..., +Inf 计数], 总和
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def series(self) -> List[Tuple[str, ...]]:
+        """已有观测值的标签组合"""
+        return list(self._values)
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        """按分桶线性插值估算分位数，算法同 PromQL 的 histogram_quantile；落在 +Inf 桶时返回最大有限边界"""
+        entry = self._values.get(labels)
+        if not entry:
+            return None
+        counts = entry[0]
+        rank = q * sum(counts)
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            items = [(labels, (list(counts), total[0])) for labels, (counts, total) in self._values.items()]
+        lines = self.header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """取值时回调的 gauge，用于导出缓存、队列等组件自身维护的状态"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback: Callable[[], Dict[Tuple[str, ...], float]], labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def expose(self) -> List[str]:
+        lines = self.header()
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"采集指标 {self.name} 失败: {e}")
+            return lines
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, callback, labelnames))
+
+    def expose(self) -> str:
+        """Prometheus 文本格式（version 0.0.4）"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_duration_seconds", "对话请求各阶段耗时", ("stage", "scenario"))
+TTFT_SECONDS = REGISTRY.histogram(
+    "chat_time_to_first_token_seconds", "从收到请求到输出首个 token 的时间", ("scenario",))
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "chat_generation_tokens_per_second", "首 token 之后的生成速度", ("scenario",), buckets=RATE_BUCKETS)
+CHAT_REQUESTS = REGISTRY.counter(
+    "chat_requests_total", "对话请求数", ("scenario", "outcome"))
+DB_COMMIT_SECONDS = REGISTRY.histogram(
+    "db_commit_duration_seconds", "数据库提交耗时", ("operation",))
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "大模型 token 用量", ("scenario", "type"))
+EMBEDDING_TOKENS = REGISTRY.counter(
+    "embedding_tokens_total", "嵌入接口 token 用量", ("scenario", "model"))
+
+
+_tracer = None
+
+
+def get_tracer():
+    """
+    OTEL_ENABLED=true 时返回 OpenTelemetry tracer，否则返回 None
+
+    配置了 OTEL_EXPORTER_OTLP_ENDPOINT 时通过 OTLP/gRPC 批量导出，否则只在进程内创建 span
+    （可由外部 SDK 配置接管）。
+    """
+    global _tracer
+    if not OTEL_ENABLED:
+        return None
+    if _tracer is None:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        if not isinstance(trace.get_tracer_provider(), TracerProvider):
+            provider = TracerProvider(resource=Resource.create({
+                "service.name": os.getenv("OTEL_SERVICE_NAME", "fastapi-local-rag")
+            }))
+            if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+                from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(provider)
+        _tracer = trace.get_tracer("fastapi-local-rag")
+    return _tracer
+
+
+class stage:
+    """
+    记录一个阶段的耗时到 chat_stage_duration_seconds，启用 OpenTelemetry 时同时创建同名 span
+
+    用法：with metrics.stage("history"): ...。
+    """
+    __slots__ = ("name", "scenario", "attributes", "_start", "_span")
+
+    def __init__(self, name: str, scenario: Optional[str] = None, **attributes):
+        self.name = name
+        self.scenario = scenario
+        self.attributes = attributes
+        self._span = None
+
+    def __enter__(self):
+        if self.scenario is None:
+            self.scenario = current_scenario.get()
+        tracer = get_tracer()
+        if tracer is not None:
+            self._span = tracer.start_as_current_span(
+                self.name, attributes={"scenario": self.scenario, **self.attributes}
+            )
+            self._span.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self._start, self.name, self.scenario)
+        if self._span is not None:
+            return self._span.__exit__(exc_type, exc, tb)
+        return False
+
+
+def observe_stage(name: str, seconds: float, scenario: Optional[str] = None):
+    """记录已经在别处测得的阶段耗时（如检索器返回的 timings）"""
+    STAGE_SECONDS.observe(seconds, name, scenario or current_scenario.get())
@@ -0,0 +1,417 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from utils.manifest import default_manifest_path, read_generation
+
+# chromadb、openai、langchain 等依赖较重，推迟到 start()/get() 时导入，
+# 导入 main 和只处理登录等轻量请求的 worker 不承担这部分开销
+if TYPE_CHECKING:
+    from utils.admission import AdmissionController
+    from utils.embeddings import EmbeddingBackend
+    from utils.retriever import ChromaRetriever
+
+load_dotenv()
+ALIYUN_API_KEY = os.getenv("ALIYUN_API_KEY")
+ALIYUN_BASE_URL = os.getenv("ALIYUN_BASE_URL")
+# 热加载后旧的 Chroma 客户端至少保留的秒数：请求可能已取得旧检索器、还没开始查询
+RAG_RETIRE_GRACE_SECONDS = float(os.getenv("RAG_RETIRE_GRACE_SECONDS", "30"))
+# 集合加载失败（如尚未入库）后重试的退避时间（秒），每次失败翻倍，不超过上限
+RAG_LOAD_RETRY_SECONDS = float(os.getenv("RAG_LOAD_RETRY_SECONDS", "5"))
+RAG_LOAD_RETRY_MAX_SECONDS = float(os.getenv("RAG_LOAD_RETRY_MAX_SECONDS", "300"))
+
+
+def _detach_system(client):
+    """
+    从 chromadb 的进程级缓存中摘下该客户端的 System 并返回
+
+    PersistentClient 按路径缓存 System，摘下后再打开同一路径会创建新的 System、读到磁盘上的新索引；
+    只移除这一个路径，不影响进程中其他客户端。摘下的 System 需要调用 stop() 才会释放 SQLite 连接与 HNSW 段。
+    """
+    from chromadb.api.client import SharedSystemClient
+
+    system = SharedSystemClient._identifier_to_system.get(client._identifier)
+    if system is not None:
+        del SharedSystemClient._identifier_to_system[client._identifier]
+    return system
+
+
+def _stop_system(system):
+    try:
+        system.stop()
+    except Exception as e:
+        print(f"关闭 Chroma 客户端失败: {e}")
+
+
+@dataclass
+class CollectionState:
+    """单个集合在注册表中的加载状态"""
+    name: str
+    status: str = "unloaded"  # unloaded / ready / error
+    count: int = 0
+    loaded_at: Optional[float] = None
+    warm_up_ms: Optional[float] = None
+    error: Optional[str] = None
+    failures: int = 0
+    # 加载失败后下次允许重试的时间（time.monotonic()）
+    retry_at: Optional[float] = None
+    reloads: int = 0
+    generation: int = 0
+    lexical_docs: Optional[int] = None
+    retriever: Optional["ChromaRetriever"] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "status": self.status,
+            "count": self.count,
+            "loaded_at": self.loaded_at,
+            "warm_up_ms": self.warm_up_ms,
+            "error": self.error,
+            "failures": self.failures,
+            "reloads": self.reloads,
+            "generation": self.generation,
+            "lexical_docs": self.lexical_docs,
+        }
+
+
+class RetrieverRegistry:
+    """
+    进程级检索器注册表
+
+    应用启动时构建一次，按集合名缓存 ChromaRetriever，所有检索器共享同一个
+    PersistentClient 与带连接池的 OpenAI 客户端，避免每轮对话重新打开
+    SQLite/HNSW 文件和 TLS 连接。
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str],
+        collection_names: List[str],
+        model_name: str = "text-embedding-v4",
+        embedding_dimensions: int = 1024,
+        reload_interval: float = 5.0,
+        max_connections: int = 20,
+        timeout: float = 30.0,
+        query_workers: int = 4,
+        hybrid: bool = True,
+        singleflight: bool = True,
+        admission: Optional["AdmissionController"] = None
+    ):
+        """
+        :param db_path: Chroma 持久化目录
+        :param collection_names: 需要托管的集合名称
+        :param model_name: 嵌入模型名称
+        :param embedding_dimensions: 向量维度（用于预热查询）
+        :param reload_interval: 检查磁盘文件变化的最小间隔（秒），<=0 表示关闭热加载
+        :param max_connections: 嵌入 HTTP 连接池大小
+        :param timeout: 嵌入请求超时时间（秒）
+        :param query_workers: 执行 Chroma 查询的线程数上限
+        :param hybrid: 是否为每个集合构建 BM25 词法索引并启用混合检索
+        :param singleflight: 是否合并并发的相同嵌入/检索调用
+        :param admission: 嵌入接口的准入控制，为空时不限制
+        """
+        self.db_path = db_path
+        self.model_name = model_name
+        self.embedding_dimensions = embedding_dimensions
+        self.reload_interval = reload_interval
+        self.hybrid = hybrid
+        self.singleflight = singleflight
+        self.admission = admission
+
+        self._lock = threading.RLock()
+        self._states: Dict[str, CollectionState] = {
+            name: CollectionState(name=name) for name in collection_names
+        }
+        self._chroma_client = None
+        # 热加载替换下来的 Chroma System：(System, 使用它的检索器, 替换时间)，查询全部结束后关闭
+        self._retired: List[tuple] = []
+        self._signature = None
+        self._last_check = 0.0
+        self._reload_listeners: List[Callable[[str], None]] = []
+
+        # 长连接 HTTP 客户端（同步/异步各一个）由所有检索器共享，首次打开客户端时创建
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._http_client = None
+        self._async_http_client = None
+        self.openai_client = None
+        self.async_openai_client = None
+        self.embedding_backend: Optional["EmbeddingBackend"] = None
+
+        # Chroma 查询是同步调用，放到有界线程池中执行，避免阻塞事件循环
+        self.query_executor = ThreadPoolExecutor(
+            max_workers=query_workers,
+            thread_name_prefix="chroma-query"
+        )
+
+    def start(self, warm_up: bool = True):
+        """打开 Chroma 客户端并加载全部集合，可选预热 HNSW 索引"""
+        with self._lock:
+            self._open_client()
+            for state in self._states.values():
+                self._load(state, warm_up=warm_up)
+            self._signature = self._disk_signature()
+            self._last_check = time.monotonic()
+
+    def get(self, collection_name: str) -> Optional["ChromaRetriever"]:
+        """获取集合对应的检索器，必要时热加载或重试加载（加载失败的集合按退避时间重试）"""
+        state = self._states.get(collection_name)
+        if state is None:
+            return None
+
+        self._maybe_reload()
+        if state.status == "ready" or self._backing_off(state):
+            return state.retriever
+
+        with self._lock:
+            if state.status != "ready" and not self._backing_off(state):
+                if self._chroma_client is None:
+                    self._open_client()
+                self._load(state, warm_up=False)
+                # 加载会写入词法索引、更新集合配置，以加载后的文件为基准，避免下次检查误判为外部写入
+                if self._signature is not None:
+                    self._signature = self._disk_signature()
+            return state.retriever
+
+    def generation(self, collection_name: str) -> int:
+        """集合当前的入库 generation，内容变化后递增"""
+        state = self._states.get(collection_name)
+        return state.generation if state else 0
+
+    def add_reload_listener(self, callback: Callable[[str], None]):
+        """注册热加载回调，参数为重新加载的集合名，用于清理下游缓存"""
+        self._reload_listeners.append(callback)
+
+    def health(self) -> dict:
+        """
+        返回各集合加载状态
+
+        不获取 _lock：启动时的后台加载会长时间持有该锁，健康检查在事件循环中调用，不能被阻塞。
+        """
+        collections = [state.to_dict() for state in list(self._states.values())]
+        ready = all(c["status"] == "ready" for c in collections)
+        return {
+            "status": "ok" if ready else "degraded",
+            "db_path": self.db_path,
+            "collections": collections,
+        }
+
+    def reload(self):
+        """丢弃缓存的 Chroma 系统并重新加载全部集合"""
+        with self._lock:
+            print(f"检测到向量库文件变化，重新加载: {self.db_path}")
+            # 旧客户端上可能还有进行中的查询，先摘下，等查询结束后再关闭
+            self._retire_client()
+            self._open_client()
+            for state in self._states.values():
+                state.reloads += 1
+                self._load(state, warm_up=True)
+            self._signature = self._disk_signature()
+            for state in self._states.values():
+                for callback in self._reload_listeners:
+                    callback(state.name)
+            self._stop_retired()
+
+    async def aclose(self):
+        if self._async_http_client is not None:
+            await self._async_http_client.aclose()
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self.query_executor.shutdown(wait=False)
+            if self.embedding_backend is not None:
+                self.embedding_backend.close()
+            # 关闭时不再等待宽限期，仍有查询在执行的 System 留给进程退出时回收
+            self._retire_client()
+            self._stop_retired(grace=0)
+            for state in self._states.values():
+                state.retriever = None
+                state.status = "unloaded"
+
+    def _open_client(self):
+        try:
+            import chromadb
+            from utils.embeddings import create_embedding_backend
+
+            if self.openai_client is None:
+                import httpx
+                from openai import AsyncOpenAI, OpenAI
+
+                limits = httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0
+                )
+                http_timeout = httpx.Timeout(self.timeout, connect=5.0)
+                self._http_client = httpx.Client(limits=limits, timeout=http_timeout)
+                self._async_http_client = httpx.AsyncClient(limits=limits, timeout=http_timeout)
+                self.openai_client = OpenAI(
+                    api_key=ALIYUN_API_KEY,
+                    base_url=ALIYUN_BASE_URL,
+                    http_client=self._http_client
+                )
+                self.async_openai_client = AsyncOpenAI(
+                    api_key=ALIYUN_API_KEY,
+                    base_url=ALIYUN_BASE_URL,
+                    http_client=self._async_http_client
+                )
+            if self.embedding_backend is None:
+                # 远程后端复用上面的连接池客户端；EMBEDDING_BACKEND=onnx 时使用本地模型
+                self.embedding_backend = create_embedding_backend(
+                    model_name=self.model_name,
+                    dimensions=self.embedding_dimensions,
+                    openai_client=self.openai_client,
+                    async_openai_client=self.async_openai_client
+                )
+            self._chroma_client = chromadb.PersistentClient(path=self.db_path)
+            if self._apply_search_params():
+                # 客户端缓存了集合配置，重新打开后新的 ef_search 才会生效；这个客户端还没有检索器在用，直接关闭
+                system = _detach_system(self._chroma_client)
+                if system is not None:
+                    _stop_system(system)
+                self._chroma_client = chromadb.PersistentClient(path=self.db_path)
+        except Exception as e:
+            print(f"初始化检索客户端失败: {e}")
+            for state in self._states.values():
+                self._mark_error(state, e)
+            self._retire_client()
+
+    def _retire_client(self):
+        """摘下当前的 Chroma 客户端，与仍引用它的检索器一起登记，待查询结束后关闭"""
+        if self._chroma_client is None:
+            return
+        system = _detach_system(self._chroma_client)
+        if system is not None:
+            retrievers = [state.retriever for state in self._states.values() if state.retriever is not None]
+            self._retired.append((system, retrievers, time.monotonic()))
+        self._chroma_client = None
+
+    def _stop_retired(self, grace: float = RAG_RETIRE_GRACE_SECONDS):
+        """关闭已过宽限期且没有进行中查询的旧 System"""
+        now = time.monotonic()
+        remaining = []
+        for system, retrievers, retired_at in self._retired:
+            if now - retired_at >= grace and all(r.active_queries == 0 for r in retrievers):
+                _stop_system(system)
+            else:
+                remaining.append((system, retrievers, retired_at))
+        self._retired = remaining
+
+    def _apply_search_params(self) -> bool:
+        """按 RAG_HNSW_* 配置更新各集合的 ef_search，返回是否有集合被更新"""
+        from utils.vector_index import apply_search_params
+
+        changed = False
+        for state in self._states.values():
+            try:
+                collection = self._chroma_client.get_collection(name=state.name)
+            except Exception:
+                # 集合不存在等错误在加载时记录
+                continue
+            changed = apply_search_params(collection) or changed
+        return changed
+
+    def _load(self, state: CollectionState, warm_up: bool):
+        if self._chroma_client is None:
+            return
+        try:
+            from utils.lexical_index import load_or_build
+            from utils.retriever import ChromaRetriever
+
+            retriever = ChromaRetriever(
+                collection_name=state.name,
+                chroma_client=self._chroma_client,
+                executor=self.query_executor,
+                embedding_backend=self.embedding_backend,
+                singleflight=self.singleflight,
+                admission=self.admission
+            )
+            state.count = retriever.collection.count()
+            state.generation = read_generation(default_manifest_path(self.db_path), state.name)
+            if self.hybrid:
+                retriever.lexical_index = load_or_build(retriever.collection, self.db_path)
+                state.lexical_docs = len(retriever.lexical_index)
+            if warm_up:
+                state.warm_up_ms = self._warm_up(retriever, state.count)
+            state.retriever = retriever
+            state.status = "ready"
+            state.error = None
+            state.failures = 0
+            state.retry_at = None
+            state.loaded_at = time.time()
+        except Exception as e:
+            print(f"加载集合 {state.name} 失败: {e}")
+            self._mark_error(state, e)
+            state.retriever = None
+
+    @staticmethod
+    def _mark_error(state: CollectionState, error: Exception):
+        state.status = "error"
+        state.error = str(error)
+        state.failures += 1
+        delay = min(RAG_LOAD_RETRY_MAX_SECONDS, RAG_LOAD_RETRY_SECONDS * 2 ** (state.failures - 1))
+        state.retry_at = time.monotonic() + delay
+
+    @staticmethod
+    def _backing_off(state: CollectionState) -> bool:
+        return state.status == "error" and state.retry_at is not None and time.monotonic() < state.retry_at
+
+    def _warm_up(self, retriever: "ChromaRetriever", count: int) -> float:
+        """用一次本地向量查询把 HNSW 段加载进内存，不调用嵌入接口"""
+        start = time.perf_counter()
+        if count > 0:
+            retriever.collection.query(
+                query_embeddings=[[0.0] * retriever.embedding_dimensions],
+                n_results=1,
+                include=[]
+            )
+        return round((time.perf_counter() - start) * 1000, 2)
+
+    def _maybe_reload(self):
+        # 热加载正在进行时不等待，下次再关闭旧 System
+        if self._retired and self._lock.acquire(blocking=False):
+            try:
+                self._stop_retired()
+            finally:
+                self._lock.release()
+        if self.reload_interval <= 0 or self._signature is None:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._last_check < self.reload_interval:
+                return
+            self._last_check = now
+            signature = self._disk_signature()
+            if signature != self._signature:
+                self.reload()
+
+    def _disk_signature(self) -> tuple:
+        """向量库目录下所有文件的 (路径, 修改时间, 大小)，用于检测外部写入"""
+        if not self.db_path or not os.path.isdir(self.db_path):
+            return ()
+        from utils.lexical_index import is_index_file
+
+        entries = []
+        for root, _, files in os.walk(self.db_path):
+            for file_name in files:
+                # SQLite 共享内存文件在只读查询时也会变化；词法索引由注册表自己写入，都不算外部写入
+                if file_name.endswith("-shm") or is_index_file(file_name):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(entries))
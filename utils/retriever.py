@@ -1,13 +1,65 @@
+import asyncio
+import threading
+import time
 import chromadb
-from typing import List, Dict, Any
-from openai import OpenAI  
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from openai import OpenAI, AsyncOpenAI
 from langchain_core.documents import Document
-from dotenv import load_dotenv
-import os
+from utils import metrics
+from utils.admission import AdmissionController
+from utils.embedding_cache import EmbeddingCache, get_embedding_cache, normalize_text
+from utils.embeddings import EmbeddingBackend, RemoteEmbeddingBackend
+from utils.lexical_index import BM25Index, reciprocal_rank_fusion
+
+SINGLEFLIGHT_CALLS = metrics.REGISTRY.counter(
+    "retrieval_singleflight_calls_total",
+    "嵌入/向量检索调用数：leader 实际发起上游调用，shared 合并到进行中的相同调用（即节省的调用）",
+    ("operation", "role")
+)
+
+
+class SingleFlight:
+    """
+    合并并发的相同调用
+
+    同一个 key 在执行期间再次被请求时不再发起新调用，而是等待进行中的那一次，
+    结果或异常分发给所有等待者；调用完成后立即移除，不缓存结果。
+    上游调用在独立任务中执行，某个等待者被取消（如客户端断开）不会影响其他等待者。
+    """
+
+    def __init__(self, operation: str):
+        """
+        :param operation: 指标中的 operation 标签
+        """
+        self.operation = operation
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        # 事件循环不同（如多次 asyncio.run）的残留任务不能跨循环等待
+        if task is not None and task.get_loop() is loop:
+            SINGLEFLIGHT_CALLS.inc(1, self.operation, "shared")
+        else:
+            task = loop.create_task(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            SINGLEFLIGHT_CALLS.inc(1, self.operation, "leader")
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+# 嵌入调用按 (模型, 维度, 规范化文本) 合并，所有检索器共用
+_embedding_flights = SingleFlight("embedding")
 
-load_dotenv()
-ALIYUN_API_KEY = os.getenv("ALIYUN_API_KEY")
-ALIYUN_BASE_URL = os.getenv("ALIYUN_BASE_URL")
 
 class ChromaRetriever:
     def __init__(
@@ -17,7 +69,17 @@ class ChromaRetriever:
         # ALIYUN_API_KEY: str,
         model_name: str = "text-embedding-v4",
         embedding_dimensions: int = 1024,
-        encoding_format: str = "float"
+        encoding_format: str = "float",
+        openai_client: Optional[OpenAI] = None,
+        async_openai_client: Optional[AsyncOpenAI] = None,
+        executor: Optional[Executor] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        lexical_index: Optional[BM25Index] = None,
+        embedding_backend: Optional[EmbeddingBackend] = None,
+        candidate_multiplier: int = 4,
+        rrf_k: int = 60,
+        singleflight: bool = True,
+        admission: Optional[AdmissionController] = None
     ):
         """
         初始化 Chroma 检索器
@@ -27,19 +89,43 @@ class ChromaRetriever:
         :param model_name: 使用的嵌入模型名称
         :param embedding_dimensions: 向量维度（仅支持 text-embedding-v3/v4）
         :param encoding_format: 向量编码格式（float 或 base64）
+        :param openai_client: 可复用的 OpenAI 客户端（共享连接池），为空时自行创建
+        :param async_openai_client: 可复用的异步 OpenAI 客户端，为空时自行创建
+        :param executor: 执行 Chroma 查询的线程池，为空时使用事件循环默认线程池
+        :param embedding_cache: 嵌入向量缓存，为空时使用进程共享的默认缓存
+        :param lexical_index: BM25 词法索引，提供时启用向量 + 关键词混合检索
+        :param embedding_backend: 嵌入后端（远程接口或本地 ONNX），为空时按上面的参数创建远程后端
+        :param candidate_multiplier: 混合检索时每一路召回 n_results 的倍数作为候选
+        :param rrf_k: RRF 融合常数
+        :param singleflight: 是否合并并发的相同嵌入/检索调用
+        :param admission: 嵌入接口的准入控制（并发上限与公平排队），为空时不限制
         """
         self.collection_name = collection_name
         self.chroma_client = chroma_client
-        self.model_name = model_name
-        self.embedding_dimensions = embedding_dimensions
         self.encoding_format = encoding_format
+        self.executor = executor
+        self.embedding_cache = embedding_cache or get_embedding_cache()
+        self.lexical_index = lexical_index
+        self.candidate_multiplier = candidate_multiplier
+        self.rrf_k = rrf_k
+        self.singleflight = singleflight
+        self.admission = admission
+        # 同一集合的相同查询合并；热加载后会创建新的检索器，不会与旧数据的查询合并
+        self._search_flights = SingleFlight("search")
+        # 进行中的 Chroma 查询数，热加载时据此判断旧客户端何时可以关闭
+        self._active_queries = 0
+        self._active_lock = threading.Lock()
 
-        # 初始化 OpenAI 客户端
-        # self.openai_client = OpenAI(api_key=openai_api_key)
-        self.openai_client = OpenAI(
-            api_key=ALIYUN_API_KEY, 
-            base_url=ALIYUN_BASE_URL
+        # 初始化嵌入后端，模型名与维度以后端为准（参与缓存键）
+        self.embedding_backend = embedding_backend or RemoteEmbeddingBackend(
+            model_name=model_name,
+            dimensions=embedding_dimensions,
+            encoding_format=encoding_format,
+            openai_client=openai_client,
+            async_openai_client=async_openai_client
         )
+        self.model_name = self.embedding_backend.model_name
+        self.embedding_dimensions = self.embedding_backend.dimensions
 
         # 获取 Chroma 集合
         self.collection = self.chroma_client.get_collection(name=collection_name)
@@ -50,33 +136,158 @@ class ChromaRetriever:
         :param text: 输入文本
         :return: 嵌入向量
         """
-        response = self.openai_client.embeddings.create(
-            model=self.model_name,
-            input=text,
-            dimensions=self.embedding_dimensions,
-            encoding_format=self.encoding_format
-        )
-        print(f"使用的 token 数量为：{response.usage.total_tokens}")
-        return response.data[0].embedding  # 返回向量数据
+        cached = self._cached_embedding(text)
+        if cached is not None:
+            return cached
+        return self._store_embedding(text, self.embedding_backend.embed(text))  # 返回向量数据
+
+    async def aembed(self, text: str) -> List[float]:
+        """
+        异步生成文本的嵌入向量，不阻塞事件循环；并发的相同文本只调用一次嵌入接口
+        :param text: 输入文本
+        :return: 嵌入向量
+        """
+        # 内存层在事件循环中直接查；SQLite 磁盘层的查询交给线程池，写入交给缓存的后台线程
+        cached = self._cached_embedding(text, memory_only=True)
+        if cached is None and self.encoding_format == "float" and self.embedding_cache.persistent:
+            loop = asyncio.get_running_loop()
+            cached = await loop.run_in_executor(self.executor, self._cached_embedding, text)
+        if cached is not None:
+            return cached
+
+        async def call():
+            if self.admission is None:
+                return self._store_embedding(text, await self.embedding_backend.aembed(text), wait=False)
+            # 合并后的调用才占用名额，等待同一结果的请求不重复排队
+            async with self.admission.slot():
+                return self._store_embedding(text, await self.embedding_backend.aembed(text), wait=False)
+
+        if not self.singleflight:
+            return await call()
+        key = (self.model_name, self.embedding_dimensions, self.encoding_format, normalize_text(text))
+        return await _embedding_flights.do(key, call)
+
+    def _cached_embedding(self, text: str, memory_only: bool = False) -> Optional[List[float]]:
+        if self.encoding_format != "float":
+            return None
+        return self.embedding_cache.get(self.model_name, self.embedding_dimensions, text, memory_only)
+
+    def _store_embedding(self, text: str, vector: List[float], wait: bool = True) -> List[float]:
+        # base64 格式返回的是字符串，不进入缓存
+        if self.encoding_format == "float":
+            self.embedding_cache.put(self.model_name, self.embedding_dimensions, text, vector, wait)
+        return vector
 
     def get_relevant_documents(self, query: str, n_results: int = 3) -> List[Document]:
         """LangChain标准接口方法"""
+        docs, _ = self.retrieve(query, n_results)
+        return docs
+
+    async def aget_relevant_documents(self, query: str, n_results: int = 3) -> List[Document]:
+        """异步检索：嵌入走异步 HTTP 客户端，Chroma 查询交给有界线程池执行"""
+        docs, _ = await self.aretrieve(query, n_results)
+        return docs
+
+    def retrieve(self, query: str, n_results: int = 3) -> Tuple[List[Document], Dict[str, float]]:
+        """检索并返回各阶段耗时（毫秒）"""
+        start = time.perf_counter()
         query_vector = self.embed(query)
+        embed_ms = (time.perf_counter() - start) * 1000
+        docs, timings = self._search(query, query_vector, n_results)
+        timings["embed_ms"] = round(embed_ms, 2)
+        return docs, timings
+
+    async def aretrieve(self, query: str, n_results: int = 3) -> Tuple[List[Document], Dict[str, float]]:
+        """
+        异步检索并返回各阶段耗时（毫秒）
+
+        并发的相同查询（规范化后）共用一次嵌入和一次 Chroma 查询，
+        合并的请求得到的阶段耗时是共享调用的耗时，embed_ms 为各自的等待时间。
+        """
+        start = time.perf_counter()
+        query_vector = await self.aembed(query)
+        embed_ms = (time.perf_counter() - start) * 1000
+        loop = asyncio.get_running_loop()
+
+        async def call():
+            return await loop.run_in_executor(
+                self.executor,
+                partial(self._search, query, query_vector, n_results)
+            )
+
+        if not self.singleflight:
+            docs, timings = await call()
+        else:
+            docs, timings = await self._search_flights.do((normalize_text(query), n_results), call)
+        # 结果由所有等待者共享，返回副本
+        timings = dict(timings, embed_ms=round(embed_ms, 2))
+        return list(docs), timings
+
+    @property
+    def active_queries(self) -> int:
+        return self._active_queries
+
+    def _track_query(self, delta: int):
+        with self._active_lock:
+            self._active_queries += delta
+
+    def _search(self, query: str, query_vector: List[float], n_results: int) -> Tuple[List[Document], Dict[str, float]]:
+        """
+        向量检索；配置了词法索引时同时做 BM25 检索并用 RRF 融合两路排序
+        """
+        self._track_query(1)
+        try:
+            return self._search_collection(query, query_vector, n_results)
+        finally:
+            self._track_query(-1)
+
+    def _search_collection(self, query: str, query_vector: List[float], n_results: int) -> Tuple[List[Document], Dict[str, float]]:
+        timings = {}
+        hybrid = self.lexical_index is not None and len(self.lexical_index) > 0
+        candidates = n_results * self.candidate_multiplier if hybrid else n_results
+
+        start = time.perf_counter()
         results = self.collection.query(
             query_embeddings=[query_vector],
-            n_results=n_results,
+            n_results=candidates,
             include=["documents", "metadatas"]
         )
-        
-        # 将结果转换为LangChain Document对象
+        timings["vector_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        dense_docs = self._to_documents(results)
+        if not hybrid:
+            return dense_docs, timings
+
+        start = time.perf_counter()
+        lexical_hits = self.lexical_index.search(query, candidates)
+        timings["lexical_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+        start = time.perf_counter()
+        fused = reciprocal_rank_fusion(
+            [[doc.id for doc in dense_docs], [doc_id for doc_id, _ in lexical_hits]],
+            k=self.rrf_k
+        )[:n_results]
+        by_id = {doc.id: doc for doc in dense_docs}
+        missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        if missing:
+            # 只由关键词召回的片段需要回表取正文
+            extra = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, text, metadata in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+                by_id[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata or {})
+        docs = [by_id[doc_id] for doc_id, _ in fused if doc_id in by_id]
+        timings["fusion_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return docs, timings
+
+    def _to_documents(self, results: Dict[str, Any]) -> List[Document]:
+        """将结果转换为LangChain Document对象"""
         documents = []
         if results.get('documents'):
             for doc_list in results['documents']:
                 for i, text in enumerate(doc_list):
                     metadata = results['metadatas'][0][i] if results.get('metadatas') else {}
-                    documents.append(Document(page_content=text, metadata=metadata))
+                    doc_id = results['ids'][0][i] if results.get('ids') else None
+                    documents.append(Document(id=doc_id, page_content=text, metadata=metadata or {}))
         return documents
-    
+
     def query(
         self,
         query_text: str,
@@ -91,9 +302,12 @@ class ChromaRetriever:
         :return: 查询结果（包含文档和元数据）
         """
         query_vector = self.embed(query_text)
-        results = self.collection.query(
-            query_embeddings=query_vector,
-            n_results=n_results,
-            **kwargs
-        )
-        return results
\ No newline at end of file
+        self._track_query(1)
+        try:
+            return self.collection.query(
+                query_embeddings=query_vector,
+                n_results=n_results,
+                **kwargs
+            )
+        finally:
+            self._track_query(-1)
\ No newline at end of file
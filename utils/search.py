@@ -0,0 +1,229 @@
+import html
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from utils import metrics
+
+load_dotenv()
+# 搜索结果摘要的长度（字符数）
+SEARCH_SNIPPET_CHARS = int(os.getenv("SEARCH_SNIPPET_CHARS", "48"))
+# 一次查询最多使用的检索词数量，多余的忽略
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", "8"))
+# trigram 分词以 3 个字符为单位建索引，更短的词（如“备份”）无法走索引，改为在该用户的消息中做子串匹配
+TRIGRAM_MIN_CHARS = 3
+
+SEARCH_SECONDS = metrics.REGISTRY.histogram(
+    "search_query_seconds", "对话全文搜索耗时（fts 为全文索引，like 为子串扫描）", ("mode",))
+
+# 全文索引按用户分区：rowid = user_id << 32 | message_id，同一用户的消息在倒排表中相邻，
+# 查询时限定 rowid 范围，FTS5 直接定位到该用户的区间，常见词、少见词都只读取很少的数据
+_USER_SHIFT = 32
+_MESSAGE_MASK = (1 << _USER_SHIFT) - 1
+_FTS_ROWID = f"(c.user_id << {_USER_SHIFT}) | {{message}}.id"
+
+# 无内容表（content=''）：只保存 trigram 倒排，不重复存放原文，摘要从 messages 取原文生成；
+# 由触发器随消息增删改同步，删除时需要提供原来的内容
+_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+    f"INSERT INTO messages_fts(rowid, content) SELECT {_FTS_ROWID.format(message='new')}, new.content "
+    "FROM conversations c WHERE c.id = new.conversation_id AND new.content IS NOT NULL; END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+    f"INSERT INTO messages_fts(messages_fts, rowid, content) SELECT 'delete', {_FTS_ROWID.format(message='old')}, old.content "
+    "FROM conversations c WHERE c.id = old.conversation_id AND old.content IS NOT NULL; END",
+    # 回答在生成过程中增量落库，每次更新内容都要替换索引中的旧内容
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+    f"INSERT INTO messages_fts(messages_fts, rowid, content) SELECT 'delete', {_FTS_ROWID.format(message='old')}, old.content "
+    "FROM conversations c WHERE c.id = old.conversation_id AND old.content IS NOT NULL; "
+    f"INSERT INTO messages_fts(rowid, content) SELECT {_FTS_ROWID.format(message='new')}, new.content "
+    "FROM conversations c WHERE c.id = new.conversation_id AND new.content IS NOT NULL; END",
+]
+# 按 rowid 顺序写入，建索引时倒排表只追加
+_FTS_BUILD = (
+    f"INSERT INTO messages_fts(rowid, content) SELECT {_FTS_ROWID.format(message='m')}, m.content "
+    "FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+    "WHERE m.content IS NOT NULL AND c.user_id IS NOT NULL ORDER BY c.user_id, m.id"
+)
+
+_fts_enabled = False
+
+
+def create_search_index(engine) -> bool:
+    """
+    建立消息全文索引，应用启动时在建表之后执行
+
+    SQLite 使用按用户分区的 FTS5 trigram 索引，首次建立时导入已有消息，之后由触发器增量维护；
+    PostgreSQL 建 pg_trgm GIN 索引加速 ILIKE。SQLite 未编译 FTS5/trigram 时退化为子串扫描。
+    :return: 是否启用了 FTS5 检索
+    """
+    global _fts_enabled
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_messages_content_trgm ON messages USING gin (content gin_trgm_ops)"))
+        return False
+    if engine.dialect.name != "sqlite":
+        return False
+
+    try:
+        with engine.begin() as connection:
+            exists = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'")).first()
+            for ddl in _FTS_DDL:
+                connection.execute(text(ddl))
+            if not exists:
+                start = time.perf_counter()
+                connection.execute(text(_FTS_BUILD))
+                print(f"消息全文索引已建立，耗时 {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"SQLite 不支持 FTS5 trigram 分词，对话搜索改为子串扫描: {e}")
+        _fts_enabled = False
+        return False
+    _fts_enabled = True
+    return True
+
+
+def parse_query(query: str) -> List[str]:
+    """按空白切分检索词，多个词之间为“且”的关系"""
+    terms = []
+    for term in (query or "").split():
+        if term not in terms:
+            terms.append(term)
+    return terms[:SEARCH_MAX_TERMS]
+
+
+def _fts_phrase(term: str) -> str:
+    # 整体作为短语，避免用户输入中的 AND/OR/NEAR、引号、* 等被当作 FTS5 语法
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _highlight(raw: str, terms: Sequence[str]) -> str:
+    """转义文本并用 <mark> 标出检索词（不区分大小写）"""
+    if not terms:
+        return html.escape(raw)
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.I)
+    parts = []
+    last = 0
+    for match in pattern.finditer(raw):
+        parts.append(html.escape(raw[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        last = match.end()
+    parts.append(html.escape(raw[last:]))
+    return "".join(parts)
+
+
+def make_snippet(content: str, terms: Sequence[str], length: int = SEARCH_SNIPPET_CHARS) -> str:
+    """
+    截取第一个命中位置附近的文本作为摘要
+
+    :return: 已转义的 HTML，检索词用 <mark> 标出
+    """
+    lowered = content.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [p for p in positions if p >= 0]
+    first = min(positions) if positions else 0
+    start = max(0, first - length // 4)
+    end = min(len(content), start + length)
+    snippet = _highlight(content[start:end], terms).replace("\n", " ")
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(content) else "")
+
+
+def _time_text(value) -> str:
+    """与 /api/history 等接口一致输出 isoformat()；SQLite 上原生 SQL 返回的是 "YYYY-MM-DD HH:MM:SS" 文本"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.isoformat()
+
+
+def search_messages(
+    db,
+    user_id: int,
+    query: str,
+    scenario: Optional[str] = None,
+    before: Optional[int] = None,
+    limit: int = 20
+) -> Tuple[List[Dict], bool]:
+    """
+    在用户自己的对话中检索消息，按消息从新到旧排列
+
+    :param db: 数据库会话
+    :param query: 检索词，空白分隔，全部命中才返回
+    :param scenario: 只搜索该场景的对话
+    :param before: 分页游标，返回 ID 小于它的消息
+    :param limit: 每页条数
+    :return: (结果列表, 是否还有下一页)
+    """
+    terms = parse_query(query)
+    if not terms:
+        return [], False
+    dialect = db.get_bind().dialect.name
+    indexed = [term for term in terms if len(term) >= TRIGRAM_MIN_CHARS] if _fts_enabled and dialect == "sqlite" else []
+    scanned = [term for term in terms if term not in indexed]
+
+    params = {"user_id": user_id, "limit": limit + 1}
+    filters = ["c.user_id = :user_id"]
+    if scenario:
+        filters.append("c.scenario = :scenario")
+        params["scenario"] = scenario
+    like = "ILIKE" if dialect == "postgresql" else "LIKE"
+    for i, term in enumerate(scanned):
+        filters.append(f"m.content {like} :term{i} ESCAPE '\\'")
+        params[f"term{i}"] = _like_pattern(term)
+
+    if indexed:
+        mode = "fts"
+        # 只读取该用户的分区；游标同样换算成 rowid 上界
+        low = user_id << _USER_SHIFT
+        high = low | (min(before - 1, _MESSAGE_MASK) if before is not None else _MESSAGE_MASK)
+        params.update(match=" ".join(_fts_phrase(term) for term in indexed), low=low, high=high)
+        sql = f"""
+            SELECT m.id, m.conversation_id, m.role, m.timestamp, m.content, c.title, c.scenario
+            FROM messages_fts
+            JOIN messages m ON m.id = (messages_fts.rowid & {_MESSAGE_MASK})
+            JOIN conversations c ON c.id = m.conversation_id
+            WHERE messages_fts MATCH :match AND messages_fts.rowid BETWEEN :low AND :high
+              AND {" AND ".join(filters)}
+            ORDER BY messages_fts.rowid DESC
+            LIMIT :limit
+        """
+    else:
+        mode = "like"
+        if before is not None:
+            filters.append("m.id < :before")
+            params["before"] = before
+        sql = f"""
+            SELECT m.id, m.conversation_id, m.role, m.timestamp, m.content, c.title, c.scenario
+            FROM messages m
+            JOIN conversations c ON c.id = m.conversation_id
+            WHERE {" AND ".join(filters)}
+            ORDER BY m.id DESC
+            LIMIT :limit
+        """
+
+    with SEARCH_SECONDS.time(mode):
+        rows = db.execute(text(sql), params).all()
+
+    has_more = len(rows) > limit
+    results = []
+    for row in rows[:limit]:
+        results.append({
+            "message_id": row.id,
+            "conversation_id": row.conversation_id,
+            "title": row.title,
+            "scenario": row.scenario,
+            "role": row.role,
+            "timestamp": _time_text(row.timestamp),
+            "snippet": make_snippet(row.content or "", terms),
+        })
+    return results, has_more
@@ -0,0 +1,155 @@
+import csv
+import io
+import re
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional
+
+_SEPARATOR_CELL = re.compile(r":?-+:?")
+
+
+def split_row(line: str) -> List[str]:
+    """拆分一行 Markdown 表格，去掉首尾的 |，支持 \\| 转义"""
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    cells = re.split(r"(?<!\\)\|", line)
+    return [cell.strip().replace("\\|", "|") for cell in cells]
+
+
+def is_separator(cells: List[str]) -> bool:
+    return bool(cells) and all(_SEPARATOR_CELL.fullmatch(cell.replace(" ", "")) for cell in cells)
+
+
+class MarkdownTableParser:
+    """
+    增量解析 Markdown 表格
+
+    流式回答时逐段 feed，只处理已完整的行；表头行之后紧跟分隔行（| --- |）才认定为表格，
+    一条回答中的多个表格都会被收集，结果为 [{"header": [...], "rows": [[...], ...]}]。
+    """
+
+    def __init__(self):
+        self.tables: List[Dict] = []
+        self._buffer = ""
+        self._candidate: Optional[List[str]] = None
+        self._current: Optional[Dict] = None
+
+    def feed(self, text: str):
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            self._process(line)
+
+    def close(self) -> List[Dict]:
+        if self._buffer:
+            self._process(self._buffer)
+            self._buffer = ""
+        self._end_table()
+        self._candidate = None
+        return self.tables
+
+    def _process(self, line: str):
+        stripped = line.strip()
+        if not stripped.startswith("|"):
+            self._end_table()
+            self._candidate = None
+            return
+
+        cells = split_row(stripped)
+        if self._current is not None:
+            width = len(self._current["header"])
+            # 单元格数与表头对齐：缺的补空，多的合并到最后一列
+            if len(cells) < width:
+                cells += [""] * (width - len(cells))
+            elif len(cells) > width:
+                cells = cells[:width - 1] + [" | ".join(cells[width - 1:])]
+            self._current["rows"].append(cells)
+        elif self._candidate is not None and is_separator(cells):
+            self._current = {"header": self._candidate, "rows": []}
+            self._candidate = None
+        else:
+            self._candidate = cells
+
+    def _end_table(self):
+        if self._current is not None:
+            self.tables.append(self._current)
+            self._current = None
+
+
+def extract_tables(text: str) -> List[Dict]:
+    """一次性解析整段文本中的全部表格"""
+    parser = MarkdownTableParser()
+    parser.feed(text or "")
+    return parser.close()
+
+
+def iter_csv(tables: Iterable[Dict], bom: bool = True) -> Iterator[str]:
+    """
+    逐行产出 CSV 文本
+
+    表头相同的相邻表格合并为一张；表头变化时空一行再写新表头。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    if bom:
+        # Excel 依赖 BOM 识别 UTF-8 编码的中文
+        yield "\ufeff"
+    last_header = None
+    for table in tables:
+        if table["header"] != last_header:
+            if last_header is not None:
+                writer.writerow([])
+            writer.writerow(table["header"])
+            last_header = table["header"]
+            yield flush()
+        for row in table["rows"]:
+            writer.writerow(row)
+            yield flush()
+
+
+def write_xlsx(tables: Iterable[Dict], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    以 openpyxl 的 write_only 模式写出 XLSX，每种表头一个工作表
+
+    XLSX 是 zip 格式，需要先完整写入（超过 8MB 落到临时文件），再分块读出。
+    openpyxl 为可选依赖，未安装时调用即抛出 RuntimeError（在开始响应之前）。
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError as e:
+        raise RuntimeError("导出 XLSX 需要安装 openpyxl：pip install openpyxl") from e
+
+    def generate():
+        workbook = Workbook(write_only=True)
+        sheets = {}
+        for table in tables:
+            key = tuple(table["header"])
+            sheet = sheets.get(key)
+            if sheet is None:
+                sheet = workbook.create_sheet(title=f"测试用例{len(sheets) + 1}")
+                sheet.append(table["header"])
+                sheets[key] = sheet
+            for row in table["rows"]:
+                sheet.append(row)
+        if not sheets:
+            workbook.create_sheet(title="测试用例1")
+
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as output:
+            workbook.save(output)
+            output.seek(0)
+            while True:
+                chunk = output.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    return generate()
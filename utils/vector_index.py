@@ -0,0 +1,104 @@
+import os
+from dataclasses import dataclass, replace
+from typing import Dict, Optional
+
+import orjson
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name, "").strip()
+    return int(value) if value else None
+
+
+# 知识库集合的 HNSW 索引参数，未配置的项使用 Chroma 默认值（space=l2, M=16, ef_construction=100, ef_search=100）
+# space（l2/cosine/ip）、M、ef_construction 只在创建集合时生效，修改后需要删除集合重新入库；
+# ef_search 是查询参数，打开集合时按配置更新，可以随时调整（越大召回率越高、查询越慢）
+RAG_HNSW_SPACE = os.getenv("RAG_HNSW_SPACE", "").strip() or None
+RAG_HNSW_M = _optional_int("RAG_HNSW_M")
+RAG_HNSW_EF_CONSTRUCTION = _optional_int("RAG_HNSW_EF_CONSTRUCTION")
+RAG_HNSW_EF_SEARCH = _optional_int("RAG_HNSW_EF_SEARCH")
+# 按集合覆盖，如 RAG_HNSW_COLLECTIONS={"product_manual": {"ef_search": 200}}
+RAG_HNSW_COLLECTIONS: Dict[str, dict] = orjson.loads(os.getenv("RAG_HNSW_COLLECTIONS", "{}"))
+
+HNSW_SPACES = ("l2", "cosine", "ip")
+
+
+@dataclass(frozen=True)
+class HNSWParams:
+    """HNSW 索引参数，None 表示使用 Chroma 默认值"""
+    space: Optional[str] = None
+    m: Optional[int] = None
+    ef_construction: Optional[int] = None
+    ef_search: Optional[int] = None
+
+    def __post_init__(self):
+        if self.space is not None and self.space not in HNSW_SPACES:
+            raise ValueError(f"不支持的 HNSW 距离: {self.space}，可选 {'/'.join(HNSW_SPACES)}")
+        for name in ("m", "ef_construction", "ef_search"):
+            value = getattr(self, name)
+            if value is not None and value < 1:
+                raise ValueError(f"HNSW 参数 {name} 必须为正整数: {value}")
+
+    def creation_config(self) -> dict:
+        """创建集合时传给 Chroma 的 hnsw 配置（Chroma 中 M 名为 max_neighbors）"""
+        config = {
+            "space": self.space,
+            "max_neighbors": self.m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+        }
+        return {key: value for key, value in config.items() if value is not None}
+
+
+def hnsw_params(collection_name: str) -> HNSWParams:
+    """集合的 HNSW 参数：全局配置叠加 RAG_HNSW_COLLECTIONS 中该集合的覆盖项"""
+    params = HNSWParams(RAG_HNSW_SPACE, RAG_HNSW_M, RAG_HNSW_EF_CONSTRUCTION, RAG_HNSW_EF_SEARCH)
+    override = RAG_HNSW_COLLECTIONS.get(collection_name)
+    return replace(params, **override) if override else params
+
+
+def current_hnsw(collection) -> dict:
+    """集合实际生效的 hnsw 配置（max_neighbors 即 M）"""
+    return dict((collection.configuration or {}).get("hnsw") or {})
+
+
+def get_or_create_collection(client, name: str, params: Optional[HNSWParams] = None):
+    """
+    按 HNSW 参数打开或创建集合
+
+    集合已存在时 Chroma 忽略传入的构建参数，这里检查并提示不一致的项，再按需更新 ef_search。
+    :param client: Chroma 客户端
+    :param name: 集合名称
+    :param params: HNSW 参数，为空时按环境变量配置
+    """
+    params = params or hnsw_params(name)
+    config = params.creation_config()
+    collection = client.get_or_create_collection(name=name, configuration={"hnsw": config} if config else None)
+    apply_search_params(collection, params)
+    return collection
+
+
+def apply_search_params(collection, params: Optional[HNSWParams] = None) -> bool:
+    """
+    将集合的 ef_search 更新为配置值；构建参数与配置不一致时打印提示
+
+    Chroma 客户端会缓存集合配置，已打开的客户端（包括执行更新的这个）看不到新的 ef_search，
+    需要关闭该客户端的 System 并重新打开客户端才会生效。
+    :return: 是否更新了 ef_search
+    """
+    params = params or hnsw_params(collection.name)
+    current = current_hnsw(collection)
+    expected = {"space": params.space, "max_neighbors": params.m, "ef_construction": params.ef_construction}
+    mismatched = [key for key, value in expected.items()
+                  if value is not None and key in current and current[key] != value]
+    if mismatched:
+        print(f"集合 {collection.name} 的 HNSW 参数 {', '.join(f'{key}={current[key]}' for key in mismatched)} "
+              f"与配置不一致，需要删除集合并重新入库才能生效")
+    if params.ef_search is None or current.get("ef_search") == params.ef_search:
+        return False
+    collection.modify(configuration={"hnsw": {"ef_search": params.ef_search}})
+    print(f"集合 {collection.name} 的 ef_search 已由 {current.get('ef_search')} 调整为 {params.ef_search}")
+    return True